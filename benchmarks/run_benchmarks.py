@@ -0,0 +1,430 @@
+import os
+import sys
+
+# must run headless and from the repository root, where the images live
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(REPO_ROOT)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import argparse  # noqa: E402
+import contextlib  # noqa: E402
+import io  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import statistics  # noqa: E402
+import time  # noqa: E402
+import tracemalloc  # noqa: E402
+from collections.abc import Callable  # noqa: E402
+from typing import Any  # noqa: E402
+
+import numpy as np  # noqa: E402
+
+from benchmarks.scenarios import random_grid, random_waypoints  # noqa: E402
+from grid.grid import Grid  # noqa: E402
+from grid.node import Node  # noqa: E402
+from pathfinding.astar import AStar  # noqa: E402
+from pathfinding.held_karp import HeldKarp  # noqa: E402
+from pathfinding.ant_colony_opt import AntColonyOptimisation  # noqa: E402
+from pathfinding.distance_matrix import WaypointDistanceMatrix  # noqa: E402
+from visualization.visualization import TaskSetting  # noqa: E402
+
+DEFAULT_RESULTS_FILE = "bench_results.json"
+# maximum number of seeds tried to get a scenario where everything is reachable
+MAX_SCENARIO_ATTEMPTS = 20
+
+Metrics = dict[str, Any]
+
+
+def setup_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--axes",
+        nargs="+",
+        required=False,
+        default=["grid_size", "density", "terrain", "waypoints", "aco"],
+        choices=["grid_size", "density", "terrain", "waypoints", "aco"],
+        help="Scaling axes to benchmark",
+    )
+    parser.add_argument(
+        "--grid_sizes",
+        type=int,
+        nargs="+",
+        required=False,
+        default=[15, 64, 256, 512],
+        help="Grid sizes for the grid_size axis (up to 4096)",
+    )
+    parser.add_argument(
+        "--densities",
+        type=float,
+        nargs="+",
+        required=False,
+        default=[0.0, 0.1, 0.2, 0.3],
+        help="Obstacle densities for the density axis",
+    )
+    parser.add_argument(
+        "--k_values",
+        type=float,
+        nargs="+",
+        required=False,
+        default=[0.0, 0.5, 1.0],
+        help="K values for the terrain axis (ELEVATION setting)",
+    )
+    parser.add_argument(
+        "--waypoint_counts",
+        type=int,
+        nargs="+",
+        required=False,
+        default=[3, 5, 8, 10, 12],
+        help="Waypoint counts for Held-Karp and ACO (3 to 20)",
+    )
+    parser.add_argument(
+        "--aco_epochs",
+        type=int,
+        nargs="+",
+        required=False,
+        default=[10, 50, 100],
+        help="Epochs for the aco axis",
+    )
+    parser.add_argument(
+        "--aco_ants",
+        type=int,
+        nargs="+",
+        required=False,
+        default=[5, 10, 20],
+        help="Number of ants for the aco axis",
+    )
+    parser.add_argument(
+        "--axis_grid_size",
+        type=int,
+        required=False,
+        default=128,
+        help="Grid size used by all axes except grid_size",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        required=False,
+        default=3,
+        help="Timed repetitions per case, the median is reported",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        required=False,
+        default=0,
+        help="Seed for the generated scenarios",
+    )
+    parser.add_argument(
+        "--output",
+        required=False,
+        default=DEFAULT_RESULTS_FILE,
+        help="JSON file the results are written to",
+    )
+    parser.add_argument(
+        "--baseline",
+        required=False,
+        default=None,
+        help="JSON results file to compare against",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        required=False,
+        default=0.1,
+        help="Relative slowdown above which a case counts as a regression",
+    )
+    parser.add_argument(
+        "--min_delta",
+        type=float,
+        required=False,
+        default=0.002,
+        help="Slowdowns smaller than this many seconds are treated as noise",
+    )
+    parser.add_argument(
+        "--fail_on_regression",
+        required=False,
+        action="store_true",
+        help="Exit with a non-zero status if a regression is found",
+    )
+
+
+def measure(run: Callable[[], Metrics], repeats: int) -> Metrics:
+    # wall time without tracing, then one extra traced run for peak memory
+    times: list[float] = []
+    metrics: Metrics = {}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        metrics = run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    metrics["wall_time"] = statistics.median(times)
+    metrics["wall_time_min"] = min(times)
+    metrics["peak_memory"] = peak_memory
+    return metrics
+
+
+def astar_case(grid: Grid, k: float, task_setting: TaskSetting) -> Metrics:
+    astar = AStar(k)
+    astar.set_task_setting(task_setting)
+    graph_start = time.perf_counter()
+    grid.create_graph()
+    graph_time = time.perf_counter() - graph_start
+    astar.set_graph(grid.get_grid())
+    cost, _ = astar.find_leg(grid.start_node, grid.end_node)
+    return {"cost": cost, "graph_time": graph_time,
+            "node_expansions": astar.get_total_nodes_expanded()}
+
+
+def tour_case(
+    grid: Grid,
+    waypoints: list[Node],
+    make_solver: Callable[[], HeldKarp | AntColonyOptimisation],
+    seed: int,
+) -> Metrics:
+    np.random.seed(seed)
+    astar = AStar(1)
+    astar.set_task_setting(TaskSetting.WAYPOINT)
+    grid.create_graph()
+    astar.set_graph(grid.get_grid())
+    start_node, end_node = grid.start_node, grid.end_node
+    assert start_node is not None and end_node is not None
+
+    matrix_start = time.perf_counter()
+    distance_matrix = WaypointDistanceMatrix(astar)
+    distance_matrix.sync(start_node, end_node, waypoints,
+                         grid.get_content_hash())
+    matrix_time = time.perf_counter() - matrix_start
+
+    solver = make_solver()
+    solver.set_distance_matrix(distance_matrix)
+    if isinstance(solver, HeldKarp):
+        cost, _ = solver.run_algorithm()
+    else:
+        solver.start_node = start_node
+        solver.end_node = end_node
+        # the solvers print their progress, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            solver.reset_values()
+            solver.fit()
+        cost = solver.best_path_length
+    return {"cost": cost, "matrix_time": matrix_time,
+            "node_expansions": astar.get_total_nodes_expanded()}
+
+
+def reachable_grid(
+    build: Callable[[int], Grid],
+    seed: int,
+) -> tuple[Grid, int]:
+    # retry with the next seeds until start and end are connected
+    for attempt in range(MAX_SCENARIO_ATTEMPTS):
+        grid = build(seed + attempt)
+        astar = AStar(0)
+        grid.create_graph()
+        astar.set_graph(grid.get_grid())
+        cost, _ = astar.find_leg(grid.start_node, grid.end_node)
+        if cost != float("inf"):
+            return grid, seed + attempt
+    raise RuntimeError("Could not generate a connected scenario")
+
+
+def reachable_tour_grid(
+    size: int,
+    count: int,
+    seed: int,
+) -> tuple[Grid, list[Node], int]:
+    for attempt in range(MAX_SCENARIO_ATTEMPTS):
+        grid = random_grid(size, 0.2, seed + attempt, TaskSetting.WAYPOINT)
+        waypoints = random_waypoints(grid, count, seed + attempt)
+        grid.create_graph()
+        astar = AStar(1)
+        astar.set_graph(grid.get_grid())
+        start_node, end_node = grid.start_node, grid.end_node
+        assert start_node is not None and end_node is not None
+        # all waypoints are reachable if they are reachable from the start
+        if all(astar.find_leg(start_node, node)[0] != float("inf")
+               for node in waypoints + [end_node]):
+            return grid, waypoints, seed + attempt
+    raise RuntimeError("Could not generate a connected scenario")
+
+
+def run_grid_size_axis(args: argparse.Namespace) -> list[Metrics]:
+    results = []
+    for size in args.grid_sizes:
+        grid, seed = reachable_grid(
+            lambda seed: random_grid(size, 0.2, seed), args.seed)
+        metrics = measure(
+            lambda: astar_case(grid, 1, TaskSetting.DEFAULT), args.repeats)
+        results.append({"axis": "grid_size", "algorithm": "AStar",
+                        "params": {"size": size, "density": 0.2,
+                                   "seed": seed}, **metrics})
+    return results
+
+
+def run_density_axis(args: argparse.Namespace) -> list[Metrics]:
+    results = []
+    size = args.axis_grid_size
+    for density in args.densities:
+        grid, seed = reachable_grid(
+            lambda seed: random_grid(size, density, seed), args.seed)
+        metrics = measure(
+            lambda: astar_case(grid, 1, TaskSetting.DEFAULT), args.repeats)
+        results.append({"axis": "density", "algorithm": "AStar",
+                        "params": {"size": size, "density": density,
+                                   "seed": seed}, **metrics})
+    return results
+
+
+def run_terrain_axis(args: argparse.Namespace) -> list[Metrics]:
+    results = []
+    size = args.axis_grid_size
+    grid, seed = reachable_grid(
+        lambda seed: random_grid(size, 0.1, seed, TaskSetting.ELEVATION,
+                                 rough_terrain=True), args.seed)
+    for k in args.k_values:
+        metrics = measure(
+            lambda: astar_case(grid, k, TaskSetting.ELEVATION), args.repeats)
+        results.append({"axis": "terrain", "algorithm": "AStar",
+                        "params": {"size": size, "k": k, "density": 0.1,
+                                   "seed": seed}, **metrics})
+    return results
+
+
+def run_waypoint_axis(args: argparse.Namespace) -> list[Metrics]:
+    results = []
+    size = args.axis_grid_size
+    for count in args.waypoint_counts:
+        grid, waypoints, seed = reachable_tour_grid(size, count, args.seed)
+        solvers: dict[str, Callable[[], HeldKarp | AntColonyOptimisation]] = {
+            "HeldKarp": HeldKarp,
+            "AntColonyOptimisation": lambda: AntColonyOptimisation(
+                epochs=100, number_ants=10, rho=0.1, Q=1, alpha=1, beta=1,
+                ini_pheromone=0.1),
+        }
+        for name, make_solver in solvers.items():
+            metrics = measure(
+                lambda: tour_case(grid, waypoints, make_solver, seed),
+                args.repeats)
+            results.append({"axis": "waypoints", "algorithm": name,
+                             "params": {"size": size, "waypoints": count,
+                                        "seed": seed}, **metrics})
+    return results
+
+
+def run_aco_axis(args: argparse.Namespace) -> list[Metrics]:
+    results = []
+    size = args.axis_grid_size
+    grid, waypoints, seed = reachable_tour_grid(size, 10, args.seed)
+    for epochs in args.aco_epochs:
+        for ants in args.aco_ants:
+            metrics = measure(
+                lambda: tour_case(
+                    grid, waypoints,
+                    lambda: AntColonyOptimisation(
+                        epochs=epochs, number_ants=ants, rho=0.1, Q=1,
+                        alpha=1, beta=1, ini_pheromone=0.1),
+                    seed),
+                args.repeats)
+            results.append({"axis": "aco", "algorithm": "AntColonyOptimisation",
+                            "params": {"size": size, "waypoints": 10,
+                                       "epochs": epochs, "ants": ants,
+                                       "seed": seed}, **metrics})
+    return results
+
+
+AXES: dict[str, Callable[[argparse.Namespace], list[Metrics]]] = {
+    "grid_size": run_grid_size_axis,
+    "density": run_density_axis,
+    "terrain": run_terrain_axis,
+    "waypoints": run_waypoint_axis,
+    "aco": run_aco_axis,
+}
+
+
+def case_key(case: Metrics) -> str:
+    params = ",".join(f"{name}={value}" for name, value
+                      in sorted(case["params"].items()) if name != "seed")
+    return f"{case['axis']}/{case['algorithm']}/{params}"
+
+
+def compare(
+    results: list[Metrics],
+    baseline: list[Metrics],
+    threshold: float,
+    min_delta: float,
+) -> list[str]:
+    # prints a comparison table and returns the keys of regressed cases
+    baseline_cases = {case_key(case): case for case in baseline}
+    regressions: list[str] = []
+    print(f"{'case':<70} {'time':>10} {'base':>10} {'ratio':>7} "
+          f"{'exp ratio':>9} {'cost':>10} {'base cost':>10}")
+    for case in results:
+        key = case_key(case)
+        base = baseline_cases.get(key)
+        if base is None:
+            print(f"{key:<70} {case['wall_time']:>10.4f} {'new':>10}")
+            continue
+        ratio = case["wall_time"] / max(base["wall_time"], 1e-12)
+        expansion_ratio = (case["node_expansions"]
+                           / max(base["node_expansions"], 1))
+        flag = ""
+        slower = (ratio > 1 + threshold
+                  and case["wall_time"] - base["wall_time"] > min_delta)
+        if slower or case["cost"] > base["cost"]:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{key:<70} {case['wall_time']:>10.4f} "
+              f"{base['wall_time']:>10.4f} {ratio:>7.2f} "
+              f"{expansion_ratio:>9.2f} {case['cost']:>10.1f} "
+              f"{base['cost']:>10.1f}{flag}")
+    return regressions
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmarks for the path planning algorithms")
+
+
+def main() -> None:
+    setup_parser(parser)
+    args = parser.parse_args()
+
+    results: list[Metrics] = []
+    for axis in args.axes:
+        print(f"Running {axis} axis")
+        for case in AXES[axis](args):
+            print(f"  {case_key(case)}: {case['wall_time']:.4f} s, "
+                  f"{case['node_expansions']} expansions, "
+                  f"{case['peak_memory'] / 1e6:.1f} MB, "
+                  f"cost {case['cost']}")
+            results.append(case)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeats": args.repeats,
+        "results": results,
+    }
+    with open(args.output, "w") as results_file:
+        json.dump(report, results_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline["results"], args.threshold,
+                              args.min_delta)
+        print(f"{len(regressions)} regression(s) against {args.baseline}")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
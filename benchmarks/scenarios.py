@@ -0,0 +1,41 @@
+import random
+
+from grid.grid import Grid
+from grid.node import Node, NodeType, MAX_ALLOWED_TERRAIN_LEVEL, ELEVATION_STEP
+from visualization.visualization import TaskSetting
+
+
+def random_grid(
+    size: int,
+    obstacle_density: float,
+    seed: int,
+    task_setting: TaskSetting = TaskSetting.DEFAULT,
+    rough_terrain: bool = False,
+) -> Grid:
+    # random obstacle field, the corners are kept free for start and end
+    rng = random.Random(seed)
+    grid = Grid(size, size, task_setting)
+    corners = {(0, 0), (size - 1, size - 1)}
+    levels = list(range(0, MAX_ALLOWED_TERRAIN_LEVEL + 1, ELEVATION_STEP))
+    for row in range(size):
+        for col in range(size):
+            if (row, col) in corners:
+                continue
+            if rng.random() < obstacle_density:
+                grid.set_obstacle_node(row, col)
+            elif rough_terrain:
+                grid.set_terrain_level(row, col, rng.choice(levels))
+    grid.set_start_node(0, 0)
+    grid.set_end_node(size - 1, size - 1)
+    return grid
+
+
+def random_waypoints(grid: Grid, count: int, seed: int) -> list[Node]:
+    rng = random.Random(seed)
+    free = [node for row in grid.get_grid() for node in row
+            if node.get_type() == NodeType.FREE]
+    waypoints = rng.sample(free, count)
+    for node in waypoints:
+        node.set_type(NodeType.WAYPOINT)
+    grid.set_waypoints(waypoints)
+    return waypoints
@@ -0,0 +1,417 @@
+import argparse
+import time
+
+import numpy as np
+
+from grid.grid_map import GridMap, Position
+from grid.map_io import write_map
+from grid.node import MAX_ALLOWED_TERRAIN_LEVEL, ELEVATION_STEP
+
+MAP_KINDS = ("random", "maze", "rooms", "terrain")
+# start, end and waypoints are drawn from the first cells reached from the
+# start, which bounds the placement time on huge maps
+DEFAULT_SEARCH_LIMIT = 1 << 20
+# chambers of a maze smaller than this in both directions are carved as
+# binary tree mazes in one batched pass
+FINISH_CHAMBER = 16
+# map rows per matrix product of the terrain noise
+NOISE_BLOCK_ROWS = 64
+
+
+def ragged_arange(lengths: np.ndarray) -> np.ndarray:
+    # concatenation of arange(length) for every length, without a loop
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.arange(int(lengths.sum()), dtype=lengths.dtype) - offsets
+
+
+class ScenarioGenerator:
+    # Seeded generator for synthetic maps. All maps are built with NumPy
+    # slice operations on the occupancy array, the same seed always gives
+    # the same map.
+    def __init__(self, seed: int) -> None:
+        self.rng = np.random.default_rng(seed)
+
+    # Obstacle layouts
+    def random_obstacles(
+        self, rows: int, cols: int, density: float,
+    ) -> np.ndarray:
+        return self.rng.random((rows, cols), dtype=np.float32) < density
+
+    def recursive_division_maze(
+        self, rows: int, cols: int, min_chamber: int = 2,
+    ) -> np.ndarray:
+        # Walls are placed on odd rows/columns and their gaps on even ones,
+        # so a later wall never closes an earlier gap. All chambers of one
+        # recursion level are divided at once, chambers smaller than
+        # min_chamber in both directions are not divided further. In the
+        # end every odd row and column is a wall except for the gaps, so
+        # the loop only records the gaps and the walls are drawn at once.
+        min_chamber = max(2, min_chamber)
+        # below this size the chambers of a full maze are finished in one
+        # batched pass instead of millions of tiny divisions
+        finish_size = FINISH_CHAMBER if min_chamber == 2 else min_chamber
+        # int32 coordinates halve the memory traffic of the last levels,
+        # which hold one entry per small chamber
+        index_type = np.int32 if rows * cols < 2**31 else np.int64
+        top = np.array([0], dtype=index_type)
+        bottom = np.array([rows - 1], dtype=index_type)
+        left = np.array([0], dtype=index_type)
+        right = np.array([cols - 1], dtype=index_type)
+        gaps = [np.empty(0, dtype=np.int64)]
+        finished = []
+        while top.size:
+            height = bottom - top
+            width = right - left
+            done = (height < finish_size) & (width < finish_size)
+            finished.append((top[done], bottom[done], left[done],
+                             right[done]))
+            keep = ~done
+            top, bottom, left, right = (top[keep], bottom[keep],
+                                        left[keep], right[keep])
+            height, width = height[keep], width[keep]
+            if not top.size:
+                break
+            horizontal = height >= width
+
+            # horizontal walls
+            h_top, h_bottom = top[horizontal], bottom[horizontal]
+            h_left, h_right = left[horizontal], right[horizontal]
+            wall_row = h_top + 1 + 2 * self.random_below(
+                height[horizontal] // 2)
+            gap_col = h_left + 2 * self.random_below(
+                width[horizontal] // 2 + 1)
+            gaps.append(wall_row.astype(np.int64) * cols + gap_col)
+
+            # vertical walls
+            vertical = ~horizontal
+            v_top, v_bottom = top[vertical], bottom[vertical]
+            v_left, v_right = left[vertical], right[vertical]
+            wall_col = v_left + 1 + 2 * self.random_below(
+                width[vertical] // 2)
+            gap_row = v_top + 2 * self.random_below(
+                height[vertical] // 2 + 1)
+            gaps.append(gap_row.astype(np.int64) * cols + wall_col)
+
+            top = np.concatenate((h_top, wall_row + 1, v_top, v_top))
+            bottom = np.concatenate((wall_row - 1, h_bottom, v_bottom,
+                                     v_bottom))
+            left = np.concatenate((h_left, h_left, v_left, wall_col + 1))
+            right = np.concatenate((h_right, h_right, wall_col - 1, v_right))
+
+        # a wall never lands on the last row or column, with an even size
+        # that one is a dead end lane next to the chambers
+        wall_rows = np.arange(rows) % 2 == 1
+        wall_cols = np.arange(cols) % 2 == 1
+        wall_rows[-1] = wall_cols[-1] = False
+        occupancy = wall_rows[:, None] | wall_cols[None, :]
+        top, bottom, left, right = (np.concatenate(bounds)
+                                    for bounds in zip(*finished))
+        if min_chamber == 2:
+            self.carve_binary_tree(occupancy, top, bottom, left, right)
+        else:
+            # chambers too small to divide stay open rooms
+            occupancy &= ~self.cover_rectangles(rows, cols, top, bottom,
+                                                left, right)
+        occupancy.ravel()[np.concatenate(gaps)] = False
+        return occupancy
+
+    def carve_binary_tree(
+        self,
+        occupancy: np.ndarray,
+        top: np.ndarray,
+        bottom: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+    ) -> None:
+        # Opens a spanning tree inside every chamber, walled on all odd
+        # lines. The cells on even rows and columns form a lattice, each of
+        # them opens the wall to its north or west neighbour at random,
+        # along the top row and left column of its chamber the only way
+        # that stays inside it. All chambers are carved in one pass.
+        lattice_rows = (occupancy.shape[0] + 1) // 2
+        lattice_cols = (occupancy.shape[1] + 1) // 2
+        top, bottom, left, right = top // 2, bottom // 2, left // 2, right // 2
+        north_wall = np.zeros(lattice_rows * lattice_cols, dtype=bool)
+        west_wall = np.zeros(lattice_rows * lattice_cols, dtype=bool)
+        lengths = right - left + 1
+        north_wall[np.repeat(top * lattice_cols + left, lengths)
+                   + ragged_arange(lengths)] = True
+        lengths = bottom - top + 1
+        west_wall[np.repeat(top * lattice_cols + left, lengths)
+                  + ragged_arange(lengths) * lattice_cols] = True
+        north_wall = north_wall.reshape(lattice_rows, lattice_cols)
+        west_wall = west_wall.reshape(lattice_rows, lattice_cols)
+        open_north = self.rng.random((lattice_rows, lattice_cols),
+                                     dtype=np.float32) < 0.5
+        open_north |= west_wall
+        open_north &= ~north_wall
+        open_west = ~(west_wall | open_north)
+        # the walls between lattice cells, the first lattice row and column
+        # never open across the map border
+        north = occupancy[1:2 * lattice_rows - 1:2, 0::2]
+        west = occupancy[0::2, 1:2 * lattice_cols - 1:2]
+        north &= ~open_north[1:]
+        west &= ~open_west[:, 1:]
+
+    def random_below(self, upper: np.ndarray) -> np.ndarray:
+        # one random integer in [0, upper) per entry
+        return (self.rng.random(upper.size) * upper).astype(upper.dtype)
+
+    def rooms_and_corridors(
+        self,
+        rows: int,
+        cols: int,
+        number_of_rooms: int | None = None,
+        min_room: int = 3,
+        max_room: int = 12,
+    ) -> np.ndarray:
+        # rectangular rooms carved out of solid rock, every room is joined
+        # to the previous one with an L-shaped corridor
+        if number_of_rooms is None:
+            number_of_rooms = max(2, rows * cols // (4 * max_room * max_room))
+        max_room = max(min_room, min(max_room, rows - 2, cols - 2))
+        heights = self.rng.integers(min_room, max_room + 1, number_of_rooms)
+        widths = self.rng.integers(min_room, max_room + 1, number_of_rooms)
+        tops = self.rng.integers(0, np.maximum(rows - heights, 1))
+        lefts = self.rng.integers(0, np.maximum(cols - widths, 1))
+        centers_row = tops + heights // 2
+        centers_col = lefts + widths // 2
+        # the corridor to room i runs along the row of room i - 1 and then
+        # along the column of room i
+        row0, col0 = centers_row[:-1], centers_col[:-1]
+        row1, col1 = centers_row[1:], centers_col[1:]
+        return ~self.cover_rectangles(
+            rows, cols,
+            np.concatenate((tops, row0, np.minimum(row0, row1))),
+            np.concatenate((np.minimum(tops + heights, rows) - 1, row0,
+                            np.maximum(row0, row1))),
+            np.concatenate((lefts, np.minimum(col0, col1), col1)),
+            np.concatenate((np.minimum(lefts + widths, cols) - 1,
+                            np.maximum(col0, col1), col1)),
+        )
+
+    def cover_rectangles(
+        self,
+        rows: int,
+        cols: int,
+        top: np.ndarray,
+        bottom: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+    ) -> np.ndarray:
+        # True on the cells of any of the rectangles (inclusive bounds).
+        # Every rectangle adds +1/-1 at its four corners of a difference
+        # array, two prefix sums then count the rectangles on each cell.
+        width = cols + 1
+        corners = np.concatenate((
+            top * width + left, top * width + right + 1,
+            (bottom + 1) * width + left, (bottom + 1) * width + right + 1,
+        ))
+        signs = np.repeat(np.array([1, -1, -1, 1], dtype=np.int32), top.size)
+        counts = np.bincount(corners, signs, (rows + 1) * width).astype(
+            np.int32).reshape(rows + 1, width)
+        np.cumsum(counts, axis=0, out=counts)
+        np.cumsum(counts, axis=1, out=counts)
+        return counts[:rows, :cols] > 0
+
+    # Terrain
+    def perlin_terrain(
+        self,
+        rows: int,
+        cols: int,
+        scale: float = 32.0,
+        octaves: int = 4,
+        persistence: float = 0.5,
+    ) -> np.ndarray:
+        # Fractal value noise quantized to the allowed terrain levels. Every
+        # octave blends two rows of its interpolated lattice per map row, so
+        # a block of map rows is one small matrix product over the lattice
+        # rows of all octaves, written straight into the map.
+        lattices = []
+        amplitude = 1.0
+        frequency = 1.0 / scale
+        for _ in range(octaves):
+            lattices.append(self.value_noise(rows, cols, frequency,
+                                             amplitude))
+            amplitude *= persistence
+            frequency *= 2
+        noise = np.empty((rows, cols), dtype=np.float32)
+        for start in range(0, rows, NOISE_BLOCK_ROWS):
+            end = min(start + NOISE_BLOCK_ROWS, rows)
+            weights = []
+            columns = []
+            for y0, ty, lattice in lattices:
+                first, last = y0[start], y0[end - 1] + 2
+                block_weights = np.zeros((end - start, last - first),
+                                         dtype=np.float32)
+                block_rows = np.arange(end - start)
+                block_weights[block_rows, y0[start:end] - first] = (
+                    1 - ty[start:end])
+                block_weights[block_rows, y0[start:end] + 1 - first] = (
+                    ty[start:end])
+                weights.append(block_weights)
+                columns.append(lattice[first:last])
+            np.matmul(np.hstack(weights), np.vstack(columns),
+                      out=noise[start:end])
+        low = float(noise.min())
+        n_levels = MAX_ALLOWED_TERRAIN_LEVEL // ELEVATION_STEP
+        noise -= low
+        noise *= n_levels / max(float(noise.max()), 1e-9)
+        levels = np.rint(noise, out=noise).astype(np.uint8)
+        levels *= np.uint8(ELEVATION_STEP)
+        return levels
+
+    def value_noise(
+        self,
+        rows: int,
+        cols: int,
+        frequency: float,
+        amplitude: float,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Random values on a coarse lattice, smoothly interpolated per cell.
+        # The interpolation along the columns is done on the small lattice,
+        # returned with the lattice row above every map row and the weight
+        # of the row below it.
+        lattice_rows = int(rows * frequency) + 2
+        lattice_cols = int(cols * frequency) + 2
+        lattice = self.rng.random((lattice_rows, lattice_cols),
+                                  dtype=np.float32)
+        lattice *= np.float32(amplitude)
+        y = np.arange(rows, dtype=np.float32) * np.float32(frequency)
+        x = np.arange(cols, dtype=np.float32) * np.float32(frequency)
+        y0 = y.astype(np.int64)
+        x0 = x.astype(np.int64)
+        # smoothstep fade as in Perlin noise
+        ty = y - y0
+        tx = x - x0
+        ty = ty * ty * (3 - 2 * ty)
+        tx = tx * tx * (3 - 2 * tx)
+        columns = lattice[:, x0] * (1 - tx) + lattice[:, x0 + 1] * tx
+        return y0, ty, columns
+
+    # Placement
+    def reachable_cells(
+        self,
+        occupancy: np.ndarray,
+        source: Position,
+        limit: int | None = None,
+    ) -> np.ndarray:
+        # breadth first wavefront over flat indices, one NumPy step per
+        # layer, stops early once `limit` cells have been reached. A maze
+        # has thousands of layers of a few cells each, so the grid gets a
+        # border of walls and the steps skip all bounds checks.
+        rows, cols = occupancy.shape
+        width = cols + 2
+        unvisited = np.zeros((rows + 2, width), dtype=bool)
+        np.logical_not(occupancy, out=unvisited[1:-1, 1:-1])
+        unvisited = unvisited.ravel()
+        offsets = np.array([-width, width, -1, 1], dtype=np.int64)
+        start = (source[0] + 1) * width + source[1] + 1
+        unvisited[start] = False
+        frontier = np.array([start], dtype=np.int64)
+        reached = [frontier]
+        n_reached = 1
+        while frontier.size and (limit is None or n_reached < limit):
+            candidates = (frontier[:, None] + offsets).ravel()
+            candidates = candidates[unvisited[candidates]]
+            # sorting and dropping repeats is cheaper than np.unique
+            candidates.sort()
+            first = np.empty(candidates.size, dtype=bool)
+            first[:1] = True
+            np.not_equal(candidates[1:], candidates[:-1], out=first[1:])
+            frontier = candidates[first]
+            unvisited[frontier] = False
+            reached.append(frontier)
+            n_reached += frontier.size
+        padded = np.concatenate(reached)
+        return (padded // width - 1) * cols + padded % width - 1
+
+    def place_points(
+        self,
+        occupancy: np.ndarray,
+        number_of_waypoints: int,
+        search_limit: int | None = None,
+    ) -> tuple[Position, Position, list[Position]]:
+        # start, end and waypoints are all in the component of the start
+        cols = occupancy.shape[1]
+        free_cells = np.flatnonzero(~occupancy)
+        if free_cells.size == 0:
+            raise ValueError("The map has no free cell")
+        needed = number_of_waypoints + 2
+        # prefer a start in a component that is large enough
+        for _ in range(16):
+            start = int(self.rng.choice(free_cells))
+            reachable = self.reachable_cells(
+                occupancy, (start // cols, start % cols), search_limit)
+            if reachable.size >= needed:
+                break
+        else:
+            raise ValueError(
+                f"No connected region with {needed} free cells found")
+        others = self.rng.choice(reachable[1:], needed - 1, replace=False)
+        positions = [(int(cell) // cols, int(cell) % cols)
+                     for cell in [start] + others.tolist()]
+        return positions[0], positions[1], positions[2:]
+
+    def generate(
+        self,
+        kind: str,
+        rows: int,
+        cols: int,
+        density: float = 0.2,
+        number_of_waypoints: int = 0,
+        with_terrain: bool = False,
+        search_limit: int | None = DEFAULT_SEARCH_LIMIT,
+    ) -> GridMap:
+        if kind == "random":
+            occupancy = self.random_obstacles(rows, cols, density)
+        elif kind == "maze":
+            occupancy = self.recursive_division_maze(rows, cols)
+        elif kind == "rooms":
+            occupancy = self.rooms_and_corridors(rows, cols)
+        elif kind == "terrain":
+            occupancy = np.zeros((rows, cols), dtype=bool)
+            with_terrain = True
+        else:
+            raise ValueError(f"Unknown map kind {kind}, "
+                             f"expected one of {MAP_KINDS}")
+        if with_terrain:
+            terrain = self.perlin_terrain(rows, cols)
+            terrain[occupancy] = 0
+        else:
+            terrain = np.zeros((rows, cols), dtype=np.uint8)
+        start, end, waypoints = self.place_points(
+            occupancy, number_of_waypoints, search_limit)
+        return GridMap(occupancy, terrain, start, end, waypoints)
+
+
+def setup_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--kind", choices=MAP_KINDS, default="random",
+                        help="Kind of map to generate")
+    parser.add_argument("--rows", type=int, default=256,
+                        help="Number of rows of the map")
+    parser.add_argument("--cols", type=int, default=None,
+                        help="Number of columns (defaults to rows)")
+    parser.add_argument("--density", type=float, default=0.2,
+                        help="Obstacle density for random maps")
+    parser.add_argument("--waypoints", type=int, default=0,
+                        help="Number of waypoints to place")
+    parser.add_argument("--terrain", action="store_true",
+                        help="Add Perlin-style terrain levels")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the generator")
+    parser.add_argument("--output", required=True,
+                        help="File the map is written to (.gmap or .npz)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic map generator")
+    setup_parser(parser)
+    args = parser.parse_args()
+    generation_start = time.perf_counter()
+    grid_map = ScenarioGenerator(args.seed).generate(
+        args.kind, args.rows, args.cols or args.rows, args.density,
+        args.waypoints, args.terrain)
+    print(f"Generated {args.rows}x{args.cols or args.rows} {args.kind} map "
+          f"in {time.perf_counter() - generation_start:.3f} s")
+    write_map(grid_map, args.output)
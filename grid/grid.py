@@ -1,8 +1,55 @@
+import numpy as np
 import pygame
 
 from grid.node import Node, NodeType
 from visualization.visualization import TaskSetting
 
+# cell state used for hashing obstacles, free cells use their terrain level
+OBSTACLE_STATE: int = -1
+MASK_64: int = (1 << 64) - 1
+
+
+def cell_state_hash(node_id: int, state: int) -> int:
+    # splitmix64 of the (cell, state) pair, an empty cell contributes nothing
+    # so that the hash of an empty grid is 0
+    if state == 0:
+        return 0
+    z = ((node_id << 16) ^ (state & 0xFFFF)) & MASK_64
+    z = (z + 0x9E3779B97F4A7C15) & MASK_64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return z ^ (z >> 31)
+
+
+def cell_state_hashes(node_ids: np.ndarray, states: np.ndarray) -> np.ndarray:
+    # cell_state_hash for many cells at once, uint64 arithmetic wraps just
+    # like the masked Python version
+    node_ids = node_ids.astype(np.uint64)
+    states = states.astype(np.int64).astype(np.uint64) & np.uint64(0xFFFF)
+    z = (node_ids << np.uint64(16)) ^ states
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    z[states == 0] = 0
+    return z
+
+
+class GridEdit:
+    # a change of the graph relevant content of one cell (obstacle or terrain)
+    # a node id of -1 means that the whole grid was reset
+    def __init__(
+        self,
+        old_hash: int,
+        new_hash: int,
+        node_id: int,
+        blocked: bool,
+    ) -> None:
+        self.old_hash = old_hash
+        self.new_hash = new_hash
+        self.node_id = node_id
+        self.blocked = blocked
+
 
 class Grid:
     def __init__(
@@ -13,14 +60,23 @@ class Grid:
     ) -> None:
         self.rows = rows
         self.cols = cols
-        self.grid = [[Node(node_id=row*cols + col, row=row, col=col)
-                      for col in range(cols)] for row in range(rows)]
+        self.grid = self.create_cells()
         self.start_node: None | Node = None
         self.end_node: None | Node = None
         self.task_setting = (
             task_setting if task_setting else TaskSetting.DEFAULT)
         self.waypoints: list[Node] = []
         self.number_of_waypoints: int = 0
+        # bumped by every modifier so that views know when to redraw
+        self.version: int = 0
+        # hash of the obstacles and terrain, i.e. everything the graph
+        # depends on, together with the edits that changed it
+        self.content_hash: int = 0
+        self.edits: list[GridEdit] = []
+
+    def create_cells(self) -> list[list[Node]]:
+        return [[Node(node_id=row*self.cols + col, row=row, col=col)
+                 for col in range(self.cols)] for row in range(self.rows)]
 
     # Accessors
     def get_node(self, row: int, col: int) -> Node:
@@ -57,12 +113,42 @@ class Grid:
     def get_number_of_waypoints(self) -> int:
         return len(self.waypoints)
 
+    def get_version(self) -> int:
+        return self.version
+
+    def get_content_hash(self) -> int:
+        return self.content_hash
+
+    def get_cell_state(self, node: Node) -> int:
+        if node.get_type() == NodeType.OBSTACLE:
+            return OBSTACLE_STATE
+        return node.get_terrain_level()
+
     # Modifiers
+    def touch(self) -> None:
+        self.version += 1
+
+    def record_cell_change(self, node: Node, old_state: int) -> None:
+        new_state = self.get_cell_state(node)
+        if new_state == old_state:
+            return
+        old_hash = self.content_hash
+        self.content_hash ^= (cell_state_hash(node.id, old_state)
+                              ^ cell_state_hash(node.id, new_state))
+        self.edits.append(GridEdit(old_hash, self.content_hash, node.id,
+                                   new_state == OBSTACLE_STATE))
+
+    def pop_edits(self) -> list[GridEdit]:
+        edits = self.edits
+        self.edits = []
+        return edits
+
     def set_number_of_waypoints(self, number_of_waypoints: int) -> None:
         self.number_of_waypoints = number_of_waypoints
 
     def set_waypoints(self, waypoints: list[Node]) -> None:
         self.waypoints = waypoints
+        self.touch()
 
     def set_task_setting(
         self,
@@ -99,8 +185,12 @@ class Grid:
                 self.get_number_of_waypoints() < self.number_of_waypoints:
             self.waypoints.append(self.grid[row][col])
             self.grid[row][col].set_type(NodeType.WAYPOINT)
+            self.touch()
         elif self.task_setting == TaskSetting.ELEVATION:
+            old_state = self.get_cell_state(self.grid[row][col])
             self.grid[row][col].increase_terrain_level()
+            self.record_cell_change(self.grid[row][col], old_state)
+            self.touch()
         else:
             self.set_obstacle_node(row, col)
 
@@ -112,9 +202,12 @@ class Grid:
         row, col = self.get_row_col(normalized_mouse_pos, board_sizes)
         if not self.within_bounds(row, col):
             return
+        old_state = self.get_cell_state(self.grid[row][col])
         if self.task_setting == TaskSetting.ELEVATION:
             if self.grid[row][col].get_terrain_level() > 0:
                 self.grid[row][col].decrease_terrain_level()
+                self.record_cell_change(self.grid[row][col], old_state)
+                self.touch()
                 return
         if self.start_node and self.start_node.get_position() == (row, col):
             self.start_node = None
@@ -125,23 +218,36 @@ class Grid:
               and self.grid[row][col].node_type == NodeType.WAYPOINT):
             self.waypoints.remove(self.grid[row][col])
         self.grid[row][col].reset()
+        self.record_cell_change(self.grid[row][col], old_state)
+        self.touch()
 
     def set_start_node(self, row: int, col: int) -> None:
         self.start_node = self.grid[row][col]
         self.start_node.set_type(NodeType.START)
+        self.touch()
 
     def set_end_node(self, row: int, col: int) -> None:
         self.end_node = self.grid[row][col]
         self.end_node.set_type(NodeType.END)
+        self.touch()
 
     def set_obstacle_node(self, row: int, col: int) -> None:
+        old_state = self.get_cell_state(self.grid[row][col])
         self.grid[row][col].set_type(NodeType.OBSTACLE)
+        self.record_cell_change(self.grid[row][col], old_state)
+        self.touch()
 
     def set_free_node(self, row: int, col: int) -> None:
+        old_state = self.get_cell_state(self.grid[row][col])
         self.grid[row][col].set_type(NodeType.FREE)
+        self.record_cell_change(self.grid[row][col], old_state)
+        self.touch()
 
     def set_terrain_level(self, row: int, col: int, terrain_level: int) -> None:
+        old_state = self.get_cell_state(self.grid[row][col])
         self.grid[row][col].set_terrain_level(terrain_level)
+        self.record_cell_change(self.grid[row][col], old_state)
+        self.touch()
 
     def reset(self) -> None:
         self.start_node = None
@@ -151,6 +257,10 @@ class Grid:
         for row in range(self.rows):
             for col in range(self.cols):
                 self.grid[row][col].reset()
+        if self.content_hash != 0:
+            self.edits.append(GridEdit(self.content_hash, 0, -1, False))
+            self.content_hash = 0
+        self.touch()
 
     def create_graph(self) -> None:
         for row in range(self.rows):
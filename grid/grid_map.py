@@ -0,0 +1,135 @@
+import numpy as np
+
+from grid.grid import Grid
+from grid.node import NodeType
+from visualization.visualization import TaskSetting
+
+Position = tuple[int, int]
+
+
+class GridMap:
+    # Array backed description of a grid: occupancy (True for obstacles),
+    # terrain levels and the start, end and waypoint positions. Unlike Grid
+    # it does not need one Node object per cell, so it is used to generate,
+    # store and load large maps.
+    def __init__(
+        self,
+        occupancy: np.ndarray,
+        terrain: np.ndarray | None = None,
+        start: Position | None = None,
+        end: Position | None = None,
+        waypoints: list[Position] | None = None,
+    ) -> None:
+        self.occupancy = occupancy
+        self.terrain = (terrain if terrain is not None
+                        else np.zeros(occupancy.shape, dtype=np.uint8))
+        self.start = start
+        self.end = end
+        self.waypoints = waypoints if waypoints is not None else []
+
+    # Accessors
+    def get_rows(self) -> int:
+        return int(self.occupancy.shape[0])
+
+    def get_cols(self) -> int:
+        return int(self.occupancy.shape[1])
+
+    def get_occupancy(self) -> np.ndarray:
+        return self.occupancy
+
+    def get_terrain(self) -> np.ndarray:
+        return self.terrain
+
+    def get_start(self) -> Position | None:
+        return self.start
+
+    def get_end(self) -> Position | None:
+        return self.end
+
+    def get_waypoints(self) -> list[Position]:
+        return self.waypoints
+
+    def get_density(self) -> float:
+        return float(self.occupancy.mean())
+
+    # Modifiers
+    def set_start(self, start: Position | None) -> None:
+        self.start = start
+
+    def set_end(self, end: Position | None) -> None:
+        self.end = end
+
+    def set_waypoints(self, waypoints: list[Position]) -> None:
+        self.waypoints = waypoints
+
+    # Conversions
+    def to_grid(self, task_setting: TaskSetting | None = None) -> Grid:
+        # materializes one Node per cell, only meant for maps that fit the UI
+        # or the Node based algorithms
+        if task_setting is None:
+            if self.waypoints:
+                task_setting = TaskSetting.WAYPOINT
+            elif bool(np.any(self.terrain)):
+                task_setting = TaskSetting.ELEVATION
+            else:
+                task_setting = TaskSetting.DEFAULT
+        grid = Grid(self.get_rows(), self.get_cols(), task_setting)
+        for row, col in np.argwhere(self.occupancy).tolist():
+            grid.set_obstacle_node(row, col)
+        for row, col in np.argwhere(
+                (self.terrain > 0) & ~self.occupancy).tolist():
+            grid.set_terrain_level(row, col, int(self.terrain[row, col]))
+        if self.start is not None:
+            grid.set_start_node(*self.start)
+        if self.end is not None:
+            grid.set_end_node(*self.end)
+        if self.waypoints:
+            waypoints = [grid.get_node(row, col) for row, col in self.waypoints]
+            for node in waypoints:
+                node.set_type(NodeType.WAYPOINT)
+            grid.set_number_of_waypoints(len(waypoints))
+            grid.set_waypoints(waypoints)
+        return grid
+
+
+def grid_map_from_grid(grid: Grid) -> GridMap:
+    nodes = grid.get_grid()
+    occupancy = np.array(
+        [[node.get_type() == NodeType.OBSTACLE for node in row]
+         for row in nodes], dtype=bool)
+    terrain = np.array(
+        [[node.get_terrain_level() for node in row] for row in nodes],
+        dtype=np.uint8)
+    return GridMap(
+        occupancy, terrain,
+        grid.start_node.get_position() if grid.start_node else None,
+        grid.end_node.get_position() if grid.end_node else None,
+        [node.get_position() for node in grid.get_waypoints()],
+    )
+
+
+def save_grid_map(grid_map: GridMap, path: str) -> None:
+    # positions are stored as (-1, -1) when missing
+    missing = (-1, -1)
+    np.savez_compressed(
+        path,
+        occupancy=grid_map.get_occupancy(),
+        terrain=grid_map.get_terrain(),
+        start=np.array(grid_map.get_start() or missing, dtype=np.int64),
+        end=np.array(grid_map.get_end() or missing, dtype=np.int64),
+        waypoints=np.array(grid_map.get_waypoints(),
+                           dtype=np.int64).reshape(-1, 2),
+    )
+
+
+def load_grid_map(path: str) -> GridMap:
+    with np.load(path) as data:
+        start = tuple(data["start"].tolist())
+        end = tuple(data["end"].tolist())
+        return GridMap(
+            data["occupancy"].astype(bool),
+            data["terrain"],
+            (start[0], start[1]) if start[0] >= 0 else None,
+            (end[0], end[1]) if end[0] >= 0 else None,
+            [(row, col) for row, col in data["waypoints"].tolist()],
+        )
@@ -0,0 +1,173 @@
+import os
+from typing import BinaryIO
+
+import numpy as np
+import pygame
+
+from grid.grid_map import GridMap, Position, load_grid_map, save_grid_map
+
+# Binary map file layout, all integers little endian:
+#   header (HEADER_DTYPE, padded to HEADER_SIZE bytes)
+#   waypoints as int32 (row, col) pairs
+#   occupancy, one byte per cell (1 for obstacles), at a page aligned offset
+#   terrain, one byte per cell, at a page aligned offset (only if stored)
+# The cell arrays are raw C-order bytes, so they are opened with np.memmap
+# and only the pages that are actually read are loaded from disk.
+MAP_MAGIC = b"PATHPMAP"
+MAP_VERSION = 1
+MAP_EXTENSION = ".gmap"
+HEADER_SIZE = 64
+PAGE_SIZE = 4096
+FLAG_TERRAIN = 1
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("flags", "<u4"),
+    ("rows", "<u4"),
+    ("cols", "<u4"),
+    ("n_waypoints", "<u4"),
+    ("start", "<i4", (2,)),
+    ("end", "<i4", (2,)),
+    ("occupancy_offset", "<u8"),
+    ("terrain_offset", "<u8"),
+])
+# cells written at once when saving, bounds the temporary copies
+SAVE_CHUNK_CELLS = 1 << 24
+
+# MovingAI benchmark maps: "." "G" "S" are passable, "@" "O" "T" "W" are
+# not (water is only passable from water, we do not model that)
+MOVINGAI_BLOCKED = b"@OTW"
+# pixels darker than this are obstacles in occupancy images
+PNG_THRESHOLD = 128
+
+
+def align(offset: int, alignment: int = PAGE_SIZE) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def save_map(grid_map: GridMap, path: str) -> None:
+    rows, cols = grid_map.get_rows(), grid_map.get_cols()
+    n_cells = rows * cols
+    terrain = grid_map.get_terrain()
+    has_terrain = bool(np.any(terrain))
+    waypoints = np.array(grid_map.get_waypoints(),
+                         dtype="<i4").reshape(-1, 2)
+    occupancy_offset = align(HEADER_SIZE + waypoints.nbytes)
+    terrain_offset = align(occupancy_offset + n_cells) if has_terrain else 0
+
+    header = np.zeros((), dtype=HEADER_DTYPE)
+    header["magic"] = MAP_MAGIC
+    header["version"] = MAP_VERSION
+    header["flags"] = FLAG_TERRAIN if has_terrain else 0
+    header["rows"] = rows
+    header["cols"] = cols
+    header["n_waypoints"] = len(waypoints)
+    header["start"] = grid_map.get_start() or (-1, -1)
+    header["end"] = grid_map.get_end() or (-1, -1)
+    header["occupancy_offset"] = occupancy_offset
+    header["terrain_offset"] = terrain_offset
+
+    with open(path, "wb") as map_file:
+        map_file.write(header.tobytes().ljust(HEADER_SIZE, b"\x00"))
+        map_file.write(waypoints.tobytes())
+        write_cells(map_file, occupancy_offset, grid_map.get_occupancy())
+        if has_terrain:
+            write_cells(map_file, terrain_offset, terrain)
+
+
+def write_cells(map_file: BinaryIO, offset: int, cells: np.ndarray) -> None:
+    map_file.seek(offset)
+    chunk_rows = max(1, SAVE_CHUNK_CELLS // max(1, cells.shape[1]))
+    for row in range(0, cells.shape[0], chunk_rows):
+        chunk = np.ascontiguousarray(cells[row:row + chunk_rows],
+                                     dtype=np.uint8)
+        map_file.write(chunk.tobytes())
+
+
+def load_map(path: str, mode: str = "r") -> GridMap:
+    # the cell arrays are memory mapped, mode "r+" writes edits back to disk
+    # and "c" keeps them in memory only
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if header.size == 0 or header["magic"][0] != MAP_MAGIC:
+        raise ValueError(f"{path} is not a map file")
+    header = header[0]
+    if int(header["version"]) != MAP_VERSION:
+        raise ValueError(f"Unsupported map file version {header['version']}")
+    rows, cols = int(header["rows"]), int(header["cols"])
+    waypoints = np.fromfile(path, dtype="<i4", count=2 * int(
+        header["n_waypoints"]), offset=HEADER_SIZE).reshape(-1, 2)
+    occupancy = np.memmap(path, dtype=np.bool_, mode=mode,
+                          offset=int(header["occupancy_offset"]),
+                          shape=(rows, cols))
+    if int(header["flags"]) & FLAG_TERRAIN:
+        terrain = np.memmap(path, dtype=np.uint8, mode=mode,
+                            offset=int(header["terrain_offset"]),
+                            shape=(rows, cols))
+    else:
+        # np.zeros is backed by untouched pages as well
+        terrain = np.zeros((rows, cols), dtype=np.uint8)
+    return GridMap(
+        occupancy, terrain,
+        position_or_none(header["start"]),
+        position_or_none(header["end"]),
+        [(row, col) for row, col in waypoints.tolist()],
+    )
+
+
+def position_or_none(position: np.ndarray) -> Position | None:
+    row, col = position.tolist()
+    return (row, col) if row >= 0 else None
+
+
+def import_movingai_map(path: str) -> GridMap:
+    # https://movingai.com/benchmarks/formats.html
+    with open(path, "rb") as map_file:
+        header: dict[str, bytes] = {}
+        for line in map_file:
+            line = line.strip()
+            if line == b"map":
+                break
+            key, _, value = line.partition(b" ")
+            header[key.decode()] = value
+        else:
+            raise ValueError(f"{path} has no map section")
+        rows, cols = int(header["height"]), int(header["width"])
+        data = map_file.read()
+    cells = np.frombuffer(data, dtype=np.uint8)
+    # drop line breaks, whatever their convention
+    cells = cells[(cells != ord("\n")) & (cells != ord("\r"))]
+    if cells.size < rows * cols:
+        raise ValueError(f"{path} has fewer cells than {rows}x{cols}")
+    cells = cells[:rows * cols].reshape(rows, cols)
+    blocked = np.frombuffer(MOVINGAI_BLOCKED, dtype=np.uint8)
+    return GridMap(np.isin(cells, blocked))
+
+
+def import_png(path: str, threshold: int = PNG_THRESHOLD) -> GridMap:
+    # dark pixels are obstacles, one pixel per cell
+    surface = pygame.image.load(path)
+    # surfarray indexes pixels as [x, y], i.e. [col, row]
+    pixels = pygame.surfarray.array3d(surface)
+    brightness = pixels.sum(axis=2, dtype=np.uint16).T
+    return GridMap(np.ascontiguousarray(brightness < 3 * threshold))
+
+
+def read_map(path: str) -> GridMap:
+    # picks the reader from the file extension
+    extension = os.path.splitext(path)[1].lower()
+    if extension == MAP_EXTENSION:
+        return load_map(path)
+    if extension == ".map":
+        return import_movingai_map(path)
+    if extension == ".png":
+        return import_png(path)
+    if extension == ".npz":
+        return load_grid_map(path)
+    raise ValueError(f"Unknown map file extension {extension}")
+
+
+def write_map(grid_map: GridMap, path: str) -> None:
+    if os.path.splitext(path)[1].lower() == ".npz":
+        save_grid_map(grid_map, path)
+    else:
+        save_map(grid_map, path)
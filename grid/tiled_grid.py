@@ -0,0 +1,286 @@
+import numpy as np
+
+from grid.grid import Grid, GridEdit, OBSTACLE_STATE, cell_state_hashes
+from grid.grid_map import GridMap
+from grid.node import Node, NodeType
+from visualization.visualization import TaskSetting
+
+DEFAULT_TILE_SIZE: int = 64
+# one byte per cell: the terrain level in the low bits, plus a flag for
+# obstacles so that an obstacle keeps its terrain level like a Node does
+OBSTACLE_BIT: int = 0x80
+TERRAIN_MASK: int = 0x7F
+
+
+class TiledGrid(Grid):
+    # Grid backend for very large, mostly uniform worlds. Cells are grouped
+    # in square tiles: a uniform tile (all free, all one terrain level, or
+    # all obstacle) is a single byte in `uniform`, a tile with detail gets
+    # its own array the first time one of its cells differs. Nodes are
+    # created on demand as TileNode views that read and write the tiles, so
+    # all Grid modifiers and the search algorithms work unchanged.
+    def __init__(
+        self,
+        rows: int,
+        cols: int,
+        task_setting: TaskSetting | None,
+        tile_size: int = DEFAULT_TILE_SIZE,
+    ) -> None:
+        self.tile_size = tile_size
+        self.uniform = np.zeros((-(-rows // tile_size), -(-cols // tile_size)),
+                                dtype=np.uint8)
+        self.tiles: dict[tuple[int, int], np.ndarray] = {}
+        # node types other than free/obstacle (start, waypoints, open, ...)
+        self.marks: dict[int, NodeType] = {}
+        super().__init__(rows, cols, task_setting)
+
+    def create_cells(self) -> "TiledCells":  # type: ignore[override]
+        return TiledCells(self)
+
+    # Accessors
+    def get_tile_size(self) -> int:
+        return self.tile_size
+
+    def get_number_of_tiles(self) -> int:
+        return int(self.uniform.size)
+
+    def get_number_of_detailed_tiles(self) -> int:
+        return len(self.tiles)
+
+    def get_nbytes(self) -> int:
+        return self.uniform.nbytes + sum(tile.nbytes
+                                         for tile in self.tiles.values())
+
+    def get_cell(self, row: int, col: int) -> int:
+        tile = self.tiles.get((row // self.tile_size, col // self.tile_size))
+        if tile is None:
+            return int(self.uniform[row // self.tile_size,
+                                    col // self.tile_size])
+        return int(tile[row % self.tile_size, col % self.tile_size])
+
+    def is_passable(self, row: int, col: int) -> bool:
+        return (self.within_bounds(row, col)
+                and not self.get_cell(row, col) & OBSTACLE_BIT)
+
+    def get_neighbors(self, row: int, col: int) -> list[Node]:
+        # same order as Grid.create_graph: up, down, left, right
+        return [TileNode(self, neighbor_row, neighbor_col)
+                for neighbor_row, neighbor_col in ((row - 1, col),
+                                                   (row + 1, col),
+                                                   (row, col - 1),
+                                                   (row, col + 1))
+                if self.is_passable(neighbor_row, neighbor_col)]
+
+    def get_cell_array(self) -> np.ndarray:
+        # dense cell bytes, only meant for grids that fit in memory
+        size = self.tile_size
+        cells = np.repeat(np.repeat(self.uniform, size, axis=0), size, axis=1)
+        for (tile_row, tile_col), tile in self.tiles.items():
+            cells[tile_row * size:(tile_row + 1) * size,
+                  tile_col * size:(tile_col + 1) * size] = tile
+        return cells[:self.rows, :self.cols]
+
+    def get_terrain_array(self) -> np.ndarray:
+        return self.get_cell_array() & TERRAIN_MASK
+
+    def get_occupancy_array(self) -> np.ndarray:
+        return (self.get_cell_array() & OBSTACLE_BIT) != 0
+
+    def get_mark(self, node_id: int) -> NodeType | None:
+        return self.marks.get(node_id)
+
+    # Modifiers
+    def set_cell(self, row: int, col: int, value: int) -> None:
+        key = (row // self.tile_size, col // self.tile_size)
+        tile = self.tiles.get(key)
+        if tile is None:
+            if self.uniform[key] == value:
+                return
+            tile = np.full((self.tile_size, self.tile_size),
+                           self.uniform[key], dtype=np.uint8)
+            self.tiles[key] = tile
+        tile[row % self.tile_size, col % self.tile_size] = value
+        # collapse the tile again once it is uniform, padding cells outside
+        # the grid are part of the tile as well and keep their value
+        if tile.min() == tile.max():
+            self.uniform[key] = tile[0, 0]
+            del self.tiles[key]
+
+    def set_mark(self, node_id: int, node_type: NodeType | None) -> None:
+        if node_type is None:
+            self.marks.pop(node_id, None)
+        else:
+            self.marks[node_id] = node_type
+
+    def reset(self) -> None:
+        self.start_node = None
+        self.end_node = None
+        self.waypoints = []
+        self.number_of_waypoints = 0
+        self.uniform.fill(0)
+        self.tiles = {}
+        self.marks = {}
+        if self.content_hash != 0:
+            self.edits.append(GridEdit(self.content_hash, 0, -1, False))
+            self.content_hash = 0
+        self.touch()
+
+    def create_graph(self) -> None:
+        # neighbors are looked up in the tiles whenever they are needed
+        pass
+
+    def load_cells(self, occupancy: np.ndarray, terrain: np.ndarray) -> None:
+        # bulk load of a whole map into the grid, replacing its cells. One
+        # band of tile rows is done at a time, so memory mapped inputs are
+        # only paged in band by band
+        self.tiles = {}
+        self.marks = {}
+        size = self.tile_size
+        tile_cols = self.uniform.shape[1]
+        padded_cols = tile_cols * size
+        content_hash = 0
+        for tile_row in range(self.uniform.shape[0]):
+            row0 = tile_row * size
+            row1 = min(row0 + size, self.rows)
+            band = np.array(terrain[row0:row1], dtype=np.uint8)
+            band &= TERRAIN_MASK
+            blocked = np.asarray(occupancy[row0:row1], dtype=bool)
+            band[blocked] |= OBSTACLE_BIT
+
+            hash_states = np.where(
+                blocked, OBSTACLE_STATE,
+                (band & TERRAIN_MASK).astype(np.int16))
+            band_rows, band_cols = np.nonzero(hash_states)
+            if band_rows.size:
+                node_ids = (band_rows + row0) * self.cols + band_cols
+                content_hash ^= int(np.bitwise_xor.reduce(cell_state_hashes(
+                    node_ids, hash_states[band_rows, band_cols])))
+
+            # cells outside the grid take the value of their neighbors in
+            # the tile, so they do not break the uniformity of border tiles
+            band = np.pad(band, ((0, size - (row1 - row0)),
+                                 (0, padded_cols - self.cols)), mode="edge")
+            tiles = band.reshape(size, tile_cols, size).transpose(1, 0, 2)
+            low = tiles.min(axis=(1, 2))
+            high = tiles.max(axis=(1, 2))
+            self.uniform[tile_row] = low
+            for tile_col in np.flatnonzero(low != high).tolist():
+                self.tiles[(tile_row, tile_col)] = tiles[tile_col].copy()
+
+        if content_hash != self.content_hash:
+            # like a reset, all cells may have changed
+            self.edits.append(GridEdit(self.content_hash, content_hash, -1,
+                                       False))
+            self.content_hash = content_hash
+        self.touch()
+
+
+class TileNode(Node):
+    # View of one cell of a TiledGrid. Type and terrain live in the grid,
+    # two views of the same cell compare and hash equal.
+    def __init__(self, grid: TiledGrid, row: int, col: int) -> None:
+        self.grid = grid
+        self.row = row
+        self.col = col
+        self.id = row * grid.cols + col
+
+    @property  # type: ignore[override]
+    def node_type(self) -> NodeType:
+        mark = self.grid.get_mark(self.id)
+        if mark is not None:
+            return mark
+        if self.grid.get_cell(self.row, self.col) & OBSTACLE_BIT:
+            return NodeType.OBSTACLE
+        return NodeType.FREE
+
+    @node_type.setter
+    def node_type(self, node_type: NodeType) -> None:
+        value = self.grid.get_cell(self.row, self.col)
+        if node_type == NodeType.OBSTACLE:
+            self.grid.set_cell(self.row, self.col, value | OBSTACLE_BIT)
+            self.grid.set_mark(self.id, None)
+            return
+        self.grid.set_cell(self.row, self.col, value & TERRAIN_MASK)
+        self.grid.set_mark(
+            self.id, None if node_type == NodeType.FREE else node_type)
+
+    @property  # type: ignore[override]
+    def terrain_level(self) -> int:
+        return self.grid.get_cell(self.row, self.col) & TERRAIN_MASK
+
+    @terrain_level.setter
+    def terrain_level(self, terrain_level: int) -> None:
+        value = self.grid.get_cell(self.row, self.col)
+        self.grid.set_cell(self.row, self.col,
+                           (value & OBSTACLE_BIT) | terrain_level)
+
+    @property  # type: ignore[override]
+    def neighbors(self) -> list[Node]:
+        if self.grid.get_cell(self.row, self.col) & OBSTACLE_BIT:
+            return []
+        return self.grid.get_neighbors(self.row, self.col)
+
+    @neighbors.setter
+    def neighbors(self, neighbors: list[Node]) -> None:
+        # derived from the tiles, nothing to store
+        pass
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, TileNode) and other.id == self.id
+
+    def __hash__(self) -> int:
+        return self.id
+
+
+class TiledCells:
+    # grid[row][col] access to TileNode views, like the list of lists of a
+    # dense Grid
+    def __init__(self, grid: TiledGrid) -> None:
+        self.grid = grid
+
+    def __len__(self) -> int:
+        return self.grid.rows
+
+    def __getitem__(self, row: int) -> "TiledRow":
+        if not 0 <= row < self.grid.rows:
+            raise IndexError(row)
+        return TiledRow(self.grid, row)
+
+
+class TiledRow:
+    def __init__(self, grid: TiledGrid, row: int) -> None:
+        self.grid = grid
+        self.row = row
+
+    def __len__(self) -> int:
+        return self.grid.cols
+
+    def __getitem__(self, col: int) -> TileNode:
+        if not 0 <= col < self.grid.cols:
+            raise IndexError(col)
+        return TileNode(self.grid, self.row, col)
+
+
+def tiled_grid_from_grid_map(
+    grid_map: GridMap,
+    task_setting: TaskSetting | None = None,
+    tile_size: int = DEFAULT_TILE_SIZE,
+) -> TiledGrid:
+    if task_setting is None:
+        task_setting = (TaskSetting.WAYPOINT if grid_map.get_waypoints()
+                        else TaskSetting.DEFAULT)
+    grid = TiledGrid(grid_map.get_rows(), grid_map.get_cols(), task_setting,
+                     tile_size)
+    grid.load_cells(grid_map.get_occupancy(), grid_map.get_terrain())
+    if grid_map.get_start() is not None:
+        grid.set_start_node(*grid_map.get_start())
+    if grid_map.get_end() is not None:
+        grid.set_end_node(*grid_map.get_end())
+    if grid_map.get_waypoints():
+        waypoints = [grid.get_node(row, col)
+                     for row, col in grid_map.get_waypoints()]
+        for node in waypoints:
+            node.set_type(NodeType.WAYPOINT)
+        grid.set_number_of_waypoints(len(waypoints))
+        grid.set_waypoints(waypoints)
+    return grid
@@ -1,77 +1,179 @@
 import pygame
 import argparse
+import time
+import traceback
+from collections.abc import Callable
 
 from grid.grid import Grid
+from grid.grid_map import grid_map_from_grid
+from grid.map_io import read_map, write_map
 from grid.node import Node, MAX_ALLOWED_TERRAIN_LEVEL, ELEVATION_STEP
 from pathfinding.astar import AStar
-from pathfinding.held_karp import HeldKarp
+from pathfinding.held_karp import (
+    HeldKarp, MeetInTheMiddleHeldKarp, ParallelHeldKarp,
+)
 from pathfinding.ant_colony_opt import AntColonyOptimisation
-from pathfinding.utils import rearrange_distance_matrix
+from pathfinding.background import BackgroundSolver, SolverJob
+from pathfinding.bitset_bfs import BitsetBFS
+from pathfinding.cache import PathCache
+from pathfinding.contraction_hierarchy import ContractionHierarchy
+from pathfinding.distance_matrix import WaypointDistanceMatrix
+from pathfinding.path_finding_algorithm import SolverCancelledError
+from pathfinding.stats import RunStats
+from pathfinding.terrain_cost import TerrainCostModel
+from pathfinding.tracing import Tracer
+from pathfinding.utils import ids_to_nodes
 from visualization.visualization import TaskSetting, Visualization
+from visualization.frame_stats import FrameStats
 from utils import setup_parser
 
 TOPBAR_HEIGHT: int = 60
+# how long the idle loop sleeps waiting for events before waking up
+IDLE_TIMEOUT_MS: int = 500
+# frame interval while a solver is running in the background
+SOLVING_FRAME_MS: int = 1000 // 60
+WINDOW_TITLE: str = "PathPlanning"
+
+MOUSE_BUTTON_EVENTS = (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+# events that can change the grid through mouse or keyboard input
+GRID_INPUT_EVENTS = (
+    pygame.MOUSEBUTTONDOWN, pygame.MOUSEMOTION, pygame.KEYDOWN, pygame.KEYUP,
+)
+# events after which the window contents have to be drawn again
+REDRAW_EVENTS = (
+    pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED,
+    pygame.WINDOWSIZECHANGED,
+)
 
 
 def run_algorithm(
     grid: Grid,
     astar: AStar,
-    visualization: Visualization,
+    draw_function: Callable,  # type: ignore
     start_node: Node,
     end_node: Node,
     waypoints: list[Node] | None = None,
     algorithm:  HeldKarp | AntColonyOptimisation | None = None,
+    path_cache: PathCache | None = None,
+    distance_matrix: WaypointDistanceMatrix | None = None,
 ) -> None:
     if waypoints:
         print(f"Running {algorithm.__class__.__name__} for waypoint setting")
     else:
         print(f"Running {algorithm.__class__.__name__} for default setting")
 
-    grid.create_graph()
+    solver = algorithm if algorithm is not None else astar
+    # A* and the waypoint solver share one stats object per run
+    stats = solver.get_stats()
+    stats.reset()
+    with stats.phase("run_algorithm", solver=solver.__class__.__name__):
+        solve(grid, astar, solver, draw_function, start_node, end_node,
+              waypoints, algorithm, path_cache, distance_matrix)
+
+
+def solve(
+    grid: Grid,
+    astar: AStar,
+    solver: AStar | HeldKarp | AntColonyOptimisation,
+    draw_function: Callable,  # type: ignore
+    start_node: Node,
+    end_node: Node,
+    waypoints: list[Node] | None,
+    algorithm:  HeldKarp | AntColonyOptimisation | None,
+    path_cache: PathCache | None,
+    distance_matrix: WaypointDistanceMatrix | None,
+) -> None:
+    stats = solver.get_stats()
+    tour_key = None
+    if path_cache is not None:
+        path_cache.apply_edits(grid.pop_edits())
+        tour_key = (grid.get_content_hash(), astar.task_setting, astar.k,
+                    astar.get_epsilon(), astar.get_cost_signature(),
+                    solver.__class__.__name__,
+                    # empty grids of any size share the content hash
+                    grid.get_rows(), grid.get_cols(),
+                    start_node.id, end_node.id,
+                    tuple(node.id for node in waypoints or []))
+        cached_cells = path_cache.get_tour(tour_key)
+        if cached_cells is not None:
+            print("Using cached result for this grid and query")
+            solver.set_path(ids_to_nodes(grid.get_grid(), cached_cells))
+            solver.mark_path()
+            return
+
+    with stats.phase("create_graph"):
+        grid.create_graph()
     graph = grid.get_grid()
-    astar.set_graph(graph)
+    astar.set_graph(
+        graph, grid.get_content_hash() if path_cache is not None else None)
 
     if algorithm is not None and waypoints is not None:
-        distance_matrix, paths = astar.compute_distance_matrix(
-            start_node, end_node, waypoints)
-        if isinstance(algorithm, AntColonyOptimisation):
-            new_dist_matrix = rearrange_distance_matrix(
-                distance_matrix, waypoints, start_node, end_node)
-            algorithm.set_distance_matrix(new_dist_matrix)
-            algorithm.set_precomputed_paths(paths)
-            node_dict = {node.id: node for node in waypoints}
-            node_dict[start_node.id] = start_node
-            node_dict[end_node.id] = end_node
-            algorithm.set_nodes(node_dict)
-        else:  # HeldKarp
-            algorithm.set_distance_matrix(distance_matrix)
-            algorithm.set_precomputed_paths(paths)
-            algorithm.set_waypoints(waypoints)
-
-    if algorithm is None:
-        path_found = astar.visualize_algorithm(
-            visualization.draw_board,
+        if distance_matrix is None:
+            distance_matrix = WaypointDistanceMatrix(astar)
+        # only the legs of new or moved nodes are computed
+        with stats.phase("distance_matrix"):
+            distance_matrix.sync(start_node, end_node, waypoints,
+                                 grid.get_content_hash())
+        algorithm.set_distance_matrix(distance_matrix)
+
+    with stats.phase("solver"):
+        path_found = solver.visualize_algorithm(
+            draw_function,
             start_node,
             end_node,
         )
-        if path_found:
-            astar.reconstruct_path(
-                start_node, end_node,
-            )
-        else:
-            print("No path found")
-    else:
-        path_found = algorithm.visualize_algorithm(
-            visualization.draw_board,
-            start_node,
-            end_node,
+    if not path_found:
+        print("No path found")
+        return
+    with stats.phase("reconstruct"):
+        solver.reconstruct_path(
+            start_node, end_node,
         )
-        if path_found:
-            algorithm.reconstruct_path(
-                start_node, end_node,
-            )
-        else:
-            print("No path found")
+
+    if path_cache is not None and tour_key is not None:
+        path_cache.put_tour(tour_key, solver.get_path())
+
+
+def make_animation_step(delay: float) -> Callable:  # type: ignore
+    # The board is drawn by the main loop while the solver runs, the solver
+    # only pauses between steps so the search stays visible.
+    def animation_step(
+        graph: list[list[Node]],
+        n_rows: int,
+        n_cols: int,
+    ) -> None:
+        if delay > 0:
+            time.sleep(delay)
+    return animation_step
+
+
+def format_progress(job: SolverJob) -> str:
+    source, progress, _ = job.get_progress()
+    if not progress:
+        return f"{WINDOW_TITLE} - {job.get_description()}"
+    if "total_epochs" in progress:
+        status = (f"epoch {progress['epochs_done']}/"
+                  f"{progress['total_epochs']}, best "
+                  f"{progress['best_path_length']}")
+    elif "total_layers" in progress:
+        status = (f"DP layer {progress['dp_layer']}/"
+                  f"{progress['total_layers']}")
+    elif "total_legs" in progress:
+        status = f"leg {progress['legs_done']}/{progress['total_legs']}"
+    else:
+        status = f"{progress.get('nodes_expanded', 0)} nodes expanded"
+    return f"{WINDOW_TITLE} - {source}: {status} (Esc to cancel)"
+
+
+def finish_job(job: SolverJob) -> None:
+    try:
+        job.result()
+    except SolverCancelledError:
+        print(f"{job.get_description()} cancelled")
+    except Exception:
+        # a failed solve must not take the window down with it
+        print(f"{job.get_description()} failed:")
+        traceback.print_exc()
 
 
 parser = argparse.ArgumentParser(description="Pathfinding algorithm")
@@ -82,8 +184,37 @@ def main() -> None:
     args = parser.parse_args()
 
     grid = Grid(args.rows, args.rows, TaskSetting.DEFAULT)
+    if args.map is not None:
+        grid_map = read_map(args.map)
+        if grid_map.get_rows() != grid_map.get_cols():
+            parser.error("Only square maps can be shown in the window")
+        args.rows = grid_map.get_rows()
+        grid = grid_map.to_grid()
     astar = AStar(args.K)
-    held_karp = HeldKarp()
+    astar.set_task_setting(
+        TaskSetting.ELEVATION if grid.task_setting == TaskSetting.ELEVATION
+        else TaskSetting.DEFAULT)
+    if args.terrain_costs:
+        astar.set_cost_model(TerrainCostModel(
+            climb_cost=args.climb_cost,
+            descent_cost=args.descent_cost,
+            max_slope=args.max_slope,
+        ))
+    astar.set_epsilon(args.epsilon)
+    if args.distance_engine == "bitset":
+        astar.set_distance_engine(BitsetBFS())
+    elif args.distance_engine == "ch":
+        astar.set_distance_engine(ContractionHierarchy(args.ch_file))
+    path_cache = PathCache(args.path_cache_size, args.tour_cache_size)
+    astar.set_cache(path_cache)
+    distance_matrix = WaypointDistanceMatrix(astar)
+    held_karp: HeldKarp
+    if args.held_karp_engine == "parallel":
+        held_karp = ParallelHeldKarp(args.held_karp_workers)
+    elif args.held_karp_engine == "meet_in_the_middle":
+        held_karp = MeetInTheMiddleHeldKarp()
+    else:
+        held_karp = HeldKarp()
     ant_colony_opt = AntColonyOptimisation(
         epochs=int(args.epochs),
         number_ants=int(args.number_ants),
@@ -92,36 +223,108 @@ def main() -> None:
         alpha=float(args.alpha),
         beta=float(args.beta),
         ini_pheromone=float(args.ini_pheromone),
+        warm_start=args.aco_warm_start,
+        patience=args.aco_patience,
+        candidates=args.aco_candidates,
     )
 
+    # tracing records the phases of the stats, so it needs them enabled
+    run_stats = RunStats(enabled=args.stats or args.trace is not None)
+    for algorithm in (astar, held_karp, ant_colony_opt):
+        algorithm.set_stats(run_stats)
+    tracer: Tracer | None = None
+    if args.trace is not None:
+        tracer = Tracer()
+        tracer.attach(run_stats)
+
     waypoint_alg: HeldKarp | AntColonyOptimisation | None = None
     if args.deterministic_waypoints:
         waypoint_alg = held_karp
     else:
         waypoint_alg = ant_colony_opt
 
-    task_setting: TaskSetting | None = TaskSetting.DEFAULT
+    task_setting: TaskSetting | None = grid.task_setting
     visualization = Visualization(
         args.window_size, args.window_size + TOPBAR_HEIGHT, TOPBAR_HEIGHT, task_setting,
         MAX_ALLOWED_TERRAIN_LEVEL, ELEVATION_STEP,
     )
 
-    current_num_waypoints = None
-    current_task_setting = TaskSetting.DEFAULT
+    current_num_waypoints = (grid.get_number_of_waypoints()
+                             if grid.task_setting == TaskSetting.WAYPOINT
+                             else None)
+    current_task_setting = grid.task_setting
 
     space_pressed = False  # Initialize flag
 
+    frame_stats = FrameStats(args.frame_stats_interval)
+    needs_redraw = True
+    drawn_version = -1
+
+    solver = BackgroundSolver()
+    animation_step = make_animation_step(args.animation_delay)
+    progress_version = -1
+    pygame.display.set_caption(WINDOW_TITLE)
+
     while True:
-        visualization.draw_board(grid.get_grid(), args.rows, args.rows)
-        # Constantly checking gor user input
-        task_setting, num_waypoints = visualization.draw_topbar()
+        job = solver.get_current_job()
+        if job is not None:
+            # nodes are recolored by the solver, keep the frame rate up
+            needs_redraw = True
+            _, _, job_progress_version = job.get_progress()
+            if job_progress_version != progress_version:
+                pygame.display.set_caption(format_progress(job))
+                progress_version = job_progress_version
+            if job.done():
+                finish_job(job)
+                if args.stats:
+                    print(run_stats.report())
+                if tracer is not None:
+                    # rewritten after every run, so it survives a crash
+                    tracer.save(args.trace)
+                    print(f"Trace with {len(tracer)} events written to "
+                          f"{args.trace}")
+                solver.clear_current()
+                pygame.display.set_caption(WINDOW_TITLE)
+
+        # only redraw after a grid mutation or a UI event that changed the view
+        if needs_redraw or grid.get_version() != drawn_version:
+            frame_stats.start_frame()
+            visualization.render_topbar()
+            visualization.draw_board(grid.get_grid(), args.rows, args.rows)
+            frame_stats.end_frame()
+            drawn_version = grid.get_version()
+            needs_redraw = False
+
+        if args.frame_stats:
+            frame_stats.maybe_report()
+
+        # block until something happens instead of spinning
+        first_event = pygame.event.wait(
+            SOLVING_FRAME_MS if solver.is_busy() else IDLE_TIMEOUT_MS)
+        if first_event.type == pygame.NOEVENT:
+            frame_stats.record_wakeup(had_events=False)
+            continue
+        events = [first_event] + pygame.event.get()
+        frame_stats.record_wakeup(had_events=True)
+
+        task_setting, num_waypoints = None, None
+        if not solver.is_busy() and any(
+                event.type in MOUSE_BUTTON_EVENTS for event in events):
+            # Checking for clicks on the topbar buttons
+            task_setting, num_waypoints = visualization.draw_topbar()
 
         if task_setting == TaskSetting.QUIT:
+            if args.frame_stats:
+                frame_stats.report()
+            solver.shutdown()
+            held_karp.shutdown()
             pygame.quit()
             return
         if task_setting is not None:
             grid = Grid(args.rows, args.rows, task_setting)
+            distance_matrix.reset()
             current_task_setting = task_setting
+            needs_redraw = True
 
         if task_setting == TaskSetting.DEFAULT:
             current_num_waypoints = None
@@ -135,11 +338,35 @@ def main() -> None:
             current_num_waypoints = None
             astar.set_task_setting(TaskSetting.ELEVATION)
 
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
+                if args.frame_stats:
+                    frame_stats.report()
+                solver.shutdown()
+                held_karp.shutdown()
                 pygame.quit()
                 return
 
+            if event.type in REDRAW_EVENTS:
+                needs_redraw = True
+
+            if event.type not in GRID_INPUT_EVENTS:
+                continue
+
+            if (event.type == pygame.KEYUP
+                    and event.key == pygame.K_SPACE):
+                # also while solving, a release during a run must not
+                # swallow the next press
+                space_pressed = False
+
+            if solver.is_busy():
+                # the grid is being solved, only allow cancelling the run
+                if (event.type == pygame.KEYDOWN
+                        and event.key == pygame.K_ESCAPE):
+                    print("Cancelling current run")
+                    solver.cancel_current()
+                continue
+
             left_click = pygame.mouse.get_pressed()[0]
             right_click = pygame.mouse.get_pressed()[2]
 
@@ -173,16 +400,28 @@ def main() -> None:
                                                 TaskSetting.WAYPOINT]:
                         if current_task_setting == TaskSetting.WAYPOINT:
                             waypoints = grid.get_waypoints()
-                            run_algorithm(
-                                grid, astar, visualization,
+                            solver.submit(
+                                f"{waypoint_alg.__class__.__name__} run",
+                                [astar, waypoint_alg],
+                                run_algorithm,
+                                grid, astar, animation_step,
                                 start_node, end_node,
-                                waypoints, waypoint_alg,
+                                waypoints, waypoint_alg, path_cache,
+                                distance_matrix,
                             )
                         else:
-                            run_algorithm(
-                                grid, astar, visualization, start_node,
-                                end_node,
+                            solver.submit(
+                                "AStar run",
+                                [astar],
+                                run_algorithm,
+                                grid, astar, animation_step, start_node,
+                                end_node, None, None, path_cache,
                             )
+                        progress_version = -1
+
+                if event.key == pygame.K_s:
+                    write_map(grid_map_from_grid(grid), args.save_map)
+                    print(f"Map saved to {args.save_map}")
 
                 if event.key == pygame.K_c:
                     print('Clear Pressed')
@@ -193,11 +432,6 @@ def main() -> None:
                     if current_num_waypoints is not None:
                         grid.set_number_of_waypoints(current_num_waypoints)
 
-            elif event.type == pygame.KEYUP:
-                # Reset the flag when the key is released
-                if event.key == pygame.K_SPACE:
-                    space_pressed = False
-
 
 if __name__ == "__main__":
     main()
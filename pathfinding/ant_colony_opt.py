@@ -1,3 +1,5 @@
+import time
+
 import numpy as np
 
 from collections.abc import Callable
@@ -6,8 +8,13 @@ from visualization.visualization import TaskSetting
 
 
 from grid.node import Node
+from pathfinding.distance_matrix import WaypointDistanceMatrix
 from pathfinding.path_finding_algorithm import PathFindingAlgorithm
-from pathfinding.utils import correct_path
+from pathfinding.path_store import PathStore
+
+# share of the learned pheromone (its difference to the neutral value)
+# that evaporates when it is carried over to the next run
+WARM_START_DECAY: float = 0.5
 
 
 class Ant:
@@ -50,9 +57,27 @@ class Ant:
 
 
 class AntColonyOptimisation(PathFindingAlgorithm):
+    # With warm_start the colony keeps what it learned between runs. The
+    # pheromone is carried over by node id: edges between nodes that are
+    # still there and whose distance did not change keep (part of) their
+    # pheromone, new or changed edges start from the neutral value, the
+    # mean of the carried pheromone. The best tour of the last run, fitted
+    # to the new nodes, is the tour to beat, as is a tour given with
+    # seed_tour. With patience the run stops once the best tour has not
+    # improved for that many epochs, so a run on a slightly edited
+    # instance only takes a few epochs.
+    #
+    # With candidates set, every node gets a list of its nearest waypoints
+    # once per distance matrix. Ants choose among the unvisited candidates
+    # of their node and only scan all nodes when every candidate has been
+    # visited, so building a tour takes O(n * candidates) instead of
+    # O(n^2) with many waypoints.
     def __init__(self, epochs: int,
                  number_ants: int, rho: float, Q: float,
                  alpha: float, beta: float, ini_pheromone: float,
+                 warm_start: bool = False,
+                 patience: int | None = None,
+                 candidates: int | None = None,
                  ) -> None:
         super().__init__()
         self.task_setting: TaskSetting = TaskSetting.WAYPOINT
@@ -65,58 +90,154 @@ class AntColonyOptimisation(PathFindingAlgorithm):
         self.alpha = alpha
         self.beta = beta
         self.ini_pheromone = ini_pheromone
+        self.warm_start = warm_start
+        self.patience = patience
+        self.candidates = candidates
 
         # DS required for the algorithm
         self.ants: list[Ant] = []
         self.distance_matrix: dict[int, dict[int, float]] = {}
         self.pheromone_matrix: dict[int, dict[int, float]] = {}
-        self.path_dict: dict[int, Node] = {}
         self.best_path: list[Node] = []
         self.best_path_length: float = float("inf")
-        self.precomputed_paths: dict[int, dict[int, dict[int, Node]]] = {}
+        self.precomputed_paths = PathStore()
+        # distances the pheromone was learned on, and the tour to start from
+        self.pheromone_distances: dict[int, dict[int, float]] = {}
+        self.seed: list[Node] = []
+        # nearest waypoints of every node, empty without candidates
+        self.candidate_lists: dict[int, list[int]] = {}
 
     def set_distance_matrix(
         self,
-        distance_matrix: dict[int, dict[int, float]],
+        distance_matrix: dict[int, dict[int, float]] | WaypointDistanceMatrix,
     ) -> None:
+        if isinstance(distance_matrix, WaypointDistanceMatrix):
+            # the matrix also knows the nodes and the leg paths
+            self.set_precomputed_paths(distance_matrix.get_paths())
+            self.set_nodes(dict(distance_matrix.get_nodes()))
+            distance_matrix = distance_matrix.get_distance_dict()
         self.distance_matrix = distance_matrix
         self.setup_pheromone_matrix()
+        self.setup_candidate_lists()
 
     def set_nodes(self, nodes: dict[int, Node]) -> None:
         self.nodes = nodes
 
-    def set_precomputed_paths(
-        self, precomputed_paths: dict[int, dict[int, dict[int, Node]]]
-    ) -> None:
+    def set_precomputed_paths(self, precomputed_paths: PathStore) -> None:
         self.precomputed_paths = precomputed_paths
 
     def setup_pheromone_matrix(self) -> None:
+        old_pheromone = self.pheromone_matrix if self.warm_start else {}
+        old_distances = self.pheromone_distances
+        # edges that are still there with the same distance
+        kept = {(node1, node2): old_pheromone[node1][node2]
+                for node1 in self.distance_matrix
+                if node1 in old_pheromone
+                for node2, distance in self.distance_matrix[node1].items()
+                if node2 in old_pheromone[node1]
+                and old_distances[node1].get(node2) == distance}
+        neutral = (sum(kept.values()) / len(kept) if kept
+                   else self.ini_pheromone)
+
+        self.pheromone_matrix = {}
         for node1 in self.distance_matrix:
             self.pheromone_matrix[node1] = {}
             for node2 in self.distance_matrix[node1]:
-                self.pheromone_matrix[node1][node2] = self.ini_pheromone
+                pheromone = kept.get((node1, node2))
+                self.pheromone_matrix[node1][node2] = (
+                    neutral if pheromone is None
+                    else neutral + (pheromone - neutral)
+                    * (1 - WARM_START_DECAY))
+        self.pheromone_distances = {
+            node1: dict(distances)
+            for node1, distances in self.distance_matrix.items()}
+
+    def setup_candidate_lists(self) -> None:
+        # one extra candidate, the end node may be among the nearest but is
+        # only chosen as the last stop
+        self.candidate_lists = {}
+        if self.candidates is None:
+            return
+        for node1, distances in self.distance_matrix.items():
+            others = [node2 for node2 in distances if node2 != node1]
+            others.sort(key=distances.__getitem__)
+            self.candidate_lists[node1] = others[:self.candidates + 1]
 
     def populate_ants(self) -> None:
-        for _ in range(self.number_ants):
-            self.ants.append(
-                Ant(self.start_node, self.end_node, self.alpha, self.beta))
+        self.ants = [Ant(self.start_node, self.end_node, self.alpha, self.beta)
+                     for _ in range(self.number_ants)]
 
     def heuristic(self, node1: Node, node2: Node, **kwargs: Any) -> int:
         return 0
 
+    def get_tour(self) -> list[Node]:
+        # start, waypoints in visiting order and end of the best tour
+        return self.best_path
+
+    def get_tour_length(self, tour: list[Node]) -> float:
+        return float(sum(self.distance_matrix[node1.id][node2.id]
+                         for node1, node2 in zip(tour, tour[1:])))
+
+    def fit_tour(self, tour: list[Node]) -> list[Node]:
+        # the tour on the current nodes: stops that are gone are dropped and
+        # new waypoints are inserted where they add the least distance
+        if not tour:
+            return []
+        distances = self.distance_matrix
+        ends = {self.start_node.id, self.end_node.id}
+        route = [self.start_node.id]
+        for node in tour[1:-1]:
+            if (node.id in self.nodes and node.id not in ends
+                    and node.id not in route):
+                route.append(node.id)
+        route.append(self.end_node.id)
+        for node_id in self.nodes:
+            if node_id in ends or node_id in route:
+                continue
+            position = min(
+                range(1, len(route)),
+                key=lambda i: (distances[route[i - 1]][node_id]
+                               + distances[node_id][route[i]]
+                               - distances[route[i - 1]][route[i]]))
+            route.insert(position, node_id)
+        return [self.nodes[node_id] for node_id in route]
+
+    def seed_tour(self, tour: list[Node]) -> None:
+        # start the next run from a tour found elsewhere, e.g. by HeldKarp
+        self.seed = list(tour)
+
     def reset_values(self) -> None:
-        self.path_dict = {}
+        # the tour to beat: the given seed or the last best tour, whichever
+        # is shorter on the current instance
+        candidates = [self.fit_tour(self.seed)]
+        if self.warm_start:
+            candidates.append(self.fit_tour(self.best_path))
+        self.seed = []
         self.best_path = []
         self.best_path_length = float("inf")
+        for tour in candidates:
+            if tour and self.get_tour_length(tour) < self.best_path_length:
+                self.best_path = tour
+                self.best_path_length = self.get_tour_length(tour)
+        if self.best_path:
+            # as if the whole colony had taken the tour once
+            for node1, node2 in zip(self.best_path, self.best_path[1:]):
+                self.pheromone_matrix[node1.id][node2.id] += (
+                    self.number_ants * self.Q
+                    / self.distance_matrix[node1.id][node2.id])
         self.populate_ants()
 
     def set_task_setting(self, task_setting: TaskSetting) -> None:
         self.task_setting = task_setting
 
     def fit(self) -> None:
-        best_path: list[Node] = []
-        best_path_length = float("inf")
+        best_path = self.best_path
+        best_path_length = self.best_path_length
+        epochs_without_improvement = 0
         for epoch in range(self.epochs):
+            self.check_cancelled()
+            if self.stats.is_enabled():
+                epoch_start = time.perf_counter()
             epoch_paths: list[list[Node]] = []
             for ant in self.ants:
                 ant.reset()  # set the ant back to the start node
@@ -127,15 +248,26 @@ class AntColonyOptimisation(PathFindingAlgorithm):
 
                 epoch_paths.append(ant.get_path())
 
-            epoch_best_path, epoch_best_path_length = self.pheromone_update(
-                epoch_paths)
-            print(
-                f"Epoch {epoch}: Best path of length: {epoch_best_path_length}")
-            print(f"Best path: {[node.id for node in epoch_best_path]}")
+            with self.stats.phase("pheromone_update"):
+                epoch_best_path, epoch_best_path_length = \
+                    self.pheromone_update(epoch_paths)
 
             if epoch_best_path_length < best_path_length:
                 best_path = epoch_best_path
                 best_path_length = epoch_best_path_length
+                epochs_without_improvement = 0
+            else:
+                epochs_without_improvement += 1
+            if self.stats.is_enabled():
+                self.stats.record_epoch(
+                    epoch, time.perf_counter() - epoch_start, best_path_length)
+            self.report_progress(epochs_done=epoch + 1,
+                                 total_epochs=self.epochs,
+                                 best_path_length=best_path_length)
+            if (self.patience is not None
+                    and epochs_without_improvement >= self.patience):
+                self.stats.add("aco_early_stops")
+                break
 
         self.best_path = best_path
         self.best_path_length = best_path_length
@@ -173,7 +305,13 @@ class AntColonyOptimisation(PathFindingAlgorithm):
                                 p=list(probabilities.values()))
 
     def choose_next_node(self, ant: Ant) -> int:
-        unvisited_nodes = self.get_unvisited_nodes(ant)
+        unvisited_nodes = [
+            node for node in self.candidate_lists.get(ant.current_node.id, [])
+            if node not in ant.visited_nodes and node != ant.end_node.id
+        ]
+        if not unvisited_nodes:
+            # no candidates or all of them visited
+            unvisited_nodes = self.get_unvisited_nodes(ant)
         probabilities = self.compute_probabilities(
             ant.get_current_node(), unvisited_nodes)
         next_node = self.select_next_node(probabilities)
@@ -214,6 +352,9 @@ class AntColonyOptimisation(PathFindingAlgorithm):
         start_node: Node,
         end_node: Node,
     ) -> bool:
+        return self.find_tour(start_node, end_node)
+
+    def find_tour(self, start_node: Node, end_node: Node) -> bool:
         # check if any distance between points is infinite
         for node in self.distance_matrix:
             for neighbor in self.distance_matrix[node]:
@@ -224,7 +365,8 @@ class AntColonyOptimisation(PathFindingAlgorithm):
         self.end_node = end_node
         self.reset_values()
 
-        self.fit()
+        with self.stats.phase("aco_fit"):
+            self.fit()
 
         return True
 
@@ -233,19 +375,17 @@ class AntColonyOptimisation(PathFindingAlgorithm):
         start_node: Node,
         end_node: Node,
     ) -> None:
-        self.best_path = list(reversed(self.best_path))
-        for i in range(len(self.best_path) - 1):
-            self.path_dict[self.best_path[i].id] = self.best_path[i + 1]
-
-        self.path = correct_path(self.start_node, self.end_node,
-                                 self.path_dict, self.precomputed_paths)
+        # best path goes from the start to the end node over the waypoints
+        self.path = self.precomputed_paths.stitch_nodes(
+            [node.id for node in self.best_path])
         super().reconstruct_path(start_node, end_node)
 
     def reset(self) -> None:
         self.ants = []
         self.distance_matrix = {}
         self.pheromone_matrix = {}
-        self.path_dict = {}
+        self.pheromone_distances = {}
+        self.seed = []
         self.best_path = []
         self.best_path_length = float("inf")
-        self.precomputed_paths = {}
+        self.precomputed_paths = PathStore()
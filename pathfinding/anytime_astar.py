@@ -0,0 +1,219 @@
+import heapq
+import threading
+import time
+from collections.abc import Callable
+
+import numpy as np
+
+from grid.node import Node
+from pathfinding.astar import AStar, INFINITY
+from pathfinding.path_finding_algorithm import PROGRESS_INTERVAL
+from pathfinding.path_store import EMPTY_LEG
+from pathfinding.utils import leg_from_path_dict
+
+DEFAULT_INITIAL_EPSILON: float = 3.0
+DEFAULT_EPSILON_STEP: float = 0.5
+
+# best leg found so far: distance, node ids and the proven bound on its
+# suboptimality (distance / optimum)
+Solution = tuple[float, np.ndarray, float]
+NO_SOLUTION: Solution = (INFINITY, EMPTY_LEG, INFINITY)
+
+
+class DeadlineReached(Exception):
+    pass
+
+
+class AnytimeAStar(AStar):
+    # ARA*: a weighted A* search with a large epsilon finds a first leg
+    # quickly, then epsilon is lowered step by step down to 1 and each new
+    # search continues from the g values of the previous one. Only the
+    # nodes whose g improved after they were expanded (the inconsistent
+    # ones) are searched again. The best leg so far and its bound are
+    # available at any time, also from another thread, and the search stops
+    # at the deadline with whatever it has. Bounds assume an admissible
+    # heuristic, i.e. not the ELEVATION heuristic without a cost model.
+    def __init__(
+        self,
+        k: float,
+        initial_epsilon: float = DEFAULT_INITIAL_EPSILON,
+        epsilon_step: float = DEFAULT_EPSILON_STEP,
+    ) -> None:
+        super().__init__(k)
+        self.initial_epsilon = initial_epsilon
+        self.epsilon_step = epsilon_step
+        self.solution: Solution = NO_SOLUTION
+        self.solution_lock = threading.Lock()
+        self.deadline: float | None = None
+        # open nodes with their current key, and the inconsistent nodes
+        self.open_keys: dict[int, float] = {}
+        self.open_list: dict[int, Node] = {}
+        self.inconsistent: dict[int, Node] = {}
+        # search statistics over all rounds of one search
+        self.nodes_expanded = 0
+        self.nodes_generated = 0
+        self.heap_peak = 0
+        self.reopened = 0
+
+    # Accessors
+    def get_solution(self) -> Solution:
+        with self.solution_lock:
+            return self.solution
+
+    def get_bound(self) -> float:
+        return self.get_solution()[2]
+
+    def lower_bound(self, heuristic: Callable[[Node], float]) -> float:
+        # no leg is cheaper than the best g + h of the nodes still to search
+        return min((self.g_function[node_id] + heuristic(node)
+                    for nodes in (self.open_list, self.inconsistent)
+                    for node_id, node in nodes.items()),
+                   default=INFINITY)
+
+    # Modifiers
+    def set_solution(self, solution: Solution) -> None:
+        with self.solution_lock:
+            self.solution = solution
+        self.report_progress(distance=solution[0], bound=solution[2])
+
+    def publish(
+        self,
+        start_node: Node,
+        end_node: Node,
+        heuristic: Callable[[Node], float],
+        max_bound: float,
+    ) -> None:
+        # the goal as the new best leg, or a tighter bound for the same one
+        distance = self.g_function.get(end_node.id, INFINITY)
+        best_distance, best_leg, best_bound = self.get_solution()
+        if distance == INFINITY or distance > best_distance:
+            return
+        lower_bound = self.lower_bound(heuristic)
+        bound = max(1.0, max_bound if lower_bound <= 0
+                    else min(max_bound, distance / lower_bound))
+        if distance < best_distance:
+            self.set_solution((distance, leg_from_path_dict(
+                start_node, end_node, self.path_dict), bound))
+        elif bound < best_bound:
+            self.set_solution((distance, best_leg, bound))
+
+    def search(
+        self,
+        start_node: Node,
+        end_node: Node,
+        time_budget: float | None = None,
+    ) -> Solution:
+        # best leg within the time budget (seconds), the leg is optimal when
+        # the returned bound is 1
+        self.deadline = (None if time_budget is None
+                         else time.perf_counter() + time_budget)
+        self.set_solution(NO_SOLUTION)
+        self.reset_values()
+        self.open_keys = {}
+        self.open_list = {start_node.id: start_node}
+        self.inconsistent = {}
+        self.nodes_expanded = 0
+        self.nodes_generated = 0
+        self.heap_peak = 0
+        self.reopened = 0
+        heuristic_values = self.get_heuristic_values(end_node)
+        heuristic_cache: dict[int, float] = {}
+
+        def heuristic(node: Node) -> float:
+            if heuristic_values is not None:
+                return heuristic_values[node.id]
+            if node.id not in heuristic_cache:
+                heuristic_cache[node.id] = self.heuristic(node, end_node)
+            return heuristic_cache[node.id]
+
+        self.g_function[start_node.id] = 0
+        epsilon = self.initial_epsilon
+        with self.stats.phase("anytime_astar", start=start_node.id,
+                              end=end_node.id):
+            while True:
+                self.stats.add("anytime_iterations")
+                try:
+                    self.improve_path(end_node, epsilon, heuristic)
+                except DeadlineReached:
+                    # the goal may have improved during the unfinished round,
+                    # its bound is still the one of the previous round
+                    self.publish(start_node, end_node, heuristic,
+                                 self.get_bound())
+                    break
+                if end_node.id not in self.g_function:
+                    # the goal cannot be reached
+                    break
+                self.publish(start_node, end_node, heuristic, epsilon)
+                if epsilon <= 1:
+                    # a finished round with epsilon 1 is plain A*
+                    distance, leg, _ = self.get_solution()
+                    self.set_solution((distance, leg, 1.0))
+                    break
+                if self.get_bound() <= 1:
+                    break
+                epsilon = max(1.0, epsilon - self.epsilon_step)
+        self.record_search(self.nodes_expanded, self.nodes_generated,
+                           self.heap_peak, self.reopened)
+        return self.get_solution()
+
+    def improve_path(
+        self,
+        end_node: Node,
+        epsilon: float,
+        heuristic: Callable[[Node], float],
+    ) -> None:
+        # weighted A* until the goal is at least as good as every open key.
+        # Nodes expanded in this round are not opened again, they wait in
+        # the inconsistent list for the next round
+        g = self.g_function
+        cost_model = self.get_active_cost_model()
+        edge_costs = self.get_edge_costs()
+        open_keys = self.open_keys
+        open_list = self.open_list
+
+        # the open list gets the keys of this epsilon
+        open_list.update(self.inconsistent)
+        self.inconsistent = {}
+        heap = []
+        for node_id, node in open_list.items():
+            open_keys[node_id] = g[node_id] + epsilon * heuristic(node)
+            self.nodes_generated += 1
+            heap.append((open_keys[node_id], self.nodes_generated, node))
+        heapq.heapify(heap)
+        closed: set[int] = set()
+
+        while heap and g.get(end_node.id, INFINITY) > heap[0][0]:
+            key, _, current_node = heapq.heappop(heap)
+            if open_keys.get(current_node.id) != key:
+                # outdated entry, the node was pushed again with a lower key
+                continue
+            del open_keys[current_node.id]
+            del open_list[current_node.id]
+            closed.add(current_node.id)
+            self.nodes_expanded += 1
+            if self.nodes_expanded % PROGRESS_INTERVAL == 0:
+                self.check_cancelled()
+                if (self.deadline is not None
+                        and time.perf_counter() > self.deadline):
+                    raise DeadlineReached()
+
+            for neighbor in current_node.get_neighbors():
+                new_g = g[current_node.id] + (
+                    1 if cost_model is None
+                    else self.step_cost(current_node, neighbor, edge_costs))
+                if new_g >= g.get(neighbor.id, INFINITY):
+                    continue
+                if neighbor.id in g and neighbor.id not in open_list:
+                    self.reopened += 1
+                g[neighbor.id] = new_g
+                self.path_dict[neighbor.id] = current_node
+                if neighbor.id in closed:
+                    self.inconsistent[neighbor.id] = neighbor
+                    continue
+                open_keys[neighbor.id] = new_g + epsilon * heuristic(neighbor)
+                open_list[neighbor.id] = neighbor
+                self.nodes_generated += 1
+                heapq.heappush(heap, (open_keys[neighbor.id],
+                                      self.nodes_generated, neighbor))
+                if len(heap) > self.heap_peak:
+                    self.heap_peak = len(heap)
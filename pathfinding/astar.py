@@ -3,11 +3,21 @@ from queue import PriorityQueue
 from typing import Any
 from visualization.visualization import TaskSetting
 
-import pygame
+import numpy as np
 
 from grid.node import Node, NodeType
-from pathfinding.path_finding_algorithm import PathFindingAlgorithm
-from pathfinding.utils import correct_path
+from pathfinding.cache import PathCache
+from pathfinding.distance_engine import DistanceEngine, Leg
+from pathfinding.heuristic_field import HeuristicFields
+from pathfinding.terrain_cost import DIRECTIONS, TerrainCostModel
+from pathfinding.path_finding_algorithm import (
+    PathFindingAlgorithm, PROGRESS_INTERVAL,
+)
+from pathfinding.path_store import EMPTY_LEG, PathStore
+from pathfinding.stats import RunStats
+from pathfinding.utils import correct_path, ids_array, leg_from_path_dict
+
+INFINITY = float("inf")
 
 
 class AStar(PathFindingAlgorithm):
@@ -20,11 +30,29 @@ class AStar(PathFindingAlgorithm):
         self.graph: list[list[Node]] = []
         self.task_setting: TaskSetting = TaskSetting.DEFAULT
         self.k = k
+        # weight of the heuristic in the legs of the distance matrix, legs
+        # cost at most epsilon times the optimum
+        self.epsilon = 1.0
         self.path_dict: dict[int, Node] = {}
+        self.cache: PathCache | None = None
+        self.graph_hash: int | None = None
+        # per goal heuristic values of the ELEVATION setting
+        self.heuristic_fields = HeuristicFields()
+        # optional true step costs for the ELEVATION setting
+        self.cost_model: TerrainCostModel | None = None
+        # optional engine for the legs of the distance matrix
+        self.distance_engine: DistanceEngine | None = None
+        # expansions over all runs, for benchmarking
+        self.total_nodes_expanded = 0
 
     def heuristic(self, node1: Node, node2: Node, **kwargs: Any) -> int:
         x1, y1 = node1.get_position()
         x2, y2 = node2.get_position()
+        cost_model = self.get_active_cost_model()
+        if cost_model is not None:
+            return cost_model.heuristic(
+                node1.get_terrain_level(), node2.get_terrain_level(),
+                abs(x1 - x2) + abs(y1 - y2))
         if self.task_setting == TaskSetting.ELEVATION:
             elevation_diff = abs(
                 node1.get_terrain_level() - node2.get_terrain_level())
@@ -43,44 +71,234 @@ class AStar(PathFindingAlgorithm):
     def set_task_setting(self, task_setting: TaskSetting) -> None:
         self.task_setting = task_setting
 
-    def set_graph(self, graph: list[list[Node]]) -> None:
+    def set_graph(
+        self,
+        graph: list[list[Node]],
+        graph_hash: int | None = None,
+    ) -> None:
+        # results are only cached when the content hash of the graph is known
         self.graph = graph
+        self.graph_hash = graph_hash
+        self.heuristic_fields.set_graph(graph, graph_hash)
+        if self.distance_engine is not None:
+            self.distance_engine.set_graph(graph, graph_hash)
+
+    def set_stats(self, stats: RunStats) -> None:
+        super().set_stats(stats)
+        if self.distance_engine is not None:
+            self.distance_engine.set_stats(stats)
+
+    def set_distance_engine(
+        self,
+        distance_engine: DistanceEngine | None,
+    ) -> None:
+        self.distance_engine = distance_engine
+        if distance_engine is not None:
+            distance_engine.set_stats(self.stats)
+            if self.graph:
+                distance_engine.set_graph(self.graph, self.graph_hash)
+
+    def get_distance_engine(self) -> DistanceEngine | None:
+        return self.distance_engine
+
+    def get_active_distance_engine(self) -> DistanceEngine | None:
+        if self.distance_engine is None:
+            return None
+        cost_model = self.get_active_cost_model()
+        if not self.distance_engine.applies(self.task_setting, cost_model):
+            return None
+        self.distance_engine.set_cost_model(cost_model)
+        return self.distance_engine
+
+    def get_heuristic_values(self, end_node: Node) -> memoryview | None:
+        # precomputed heuristic towards end_node indexed by node id, None
+        # when the heuristic is cheap enough to evaluate per node
+        if self.task_setting != TaskSetting.ELEVATION:
+            return None
+        return self.heuristic_fields.get_values(
+            end_node, self.k, self.get_active_cost_model())
+
+    def set_epsilon(self, epsilon: float) -> None:
+        if epsilon < 1:
+            raise ValueError(f"epsilon must be at least 1, got {epsilon}")
+        self.epsilon = epsilon
+
+    def get_epsilon(self) -> float:
+        return self.epsilon
+
+    def set_cost_model(self, cost_model: TerrainCostModel | None) -> None:
+        self.cost_model = cost_model
+
+    def get_cost_model(self) -> TerrainCostModel | None:
+        return self.cost_model
+
+    def get_active_cost_model(self) -> TerrainCostModel | None:
+        # the cost model only applies to the ELEVATION setting
+        if self.task_setting != TaskSetting.ELEVATION:
+            return None
+        return self.cost_model
+
+    def get_cost_signature(self) -> tuple[Any, ...] | None:
+        cost_model = self.get_active_cost_model()
+        return cost_model.get_signature() if cost_model is not None else None
+
+    def get_edge_costs(self) -> memoryview | None:
+        cost_model = self.get_active_cost_model()
+        if cost_model is None:
+            return None
+        return self.heuristic_fields.get_edge_costs(cost_model)
+
+    def step_cost(
+        self,
+        current_node: Node,
+        neighbor: Node,
+        edge_costs: memoryview | None,
+    ) -> float:
+        # cost of a move under the cost model, read from the precomputed
+        # edge costs when the grid is small enough to have them
+        if edge_costs is None:
+            return self.cost_model.edge_cost(  # type: ignore[union-attr]
+                current_node.get_terrain_level(),
+                neighbor.get_terrain_level())
+        n_cols = len(self.graph[0])
+        offset = neighbor.id - current_node.id
+        if offset == -n_cols:
+            direction = 0
+        elif offset == n_cols:
+            direction = 1
+        elif offset == -1:
+            direction = 2
+        else:
+            direction = 3
+        return edge_costs[current_node.id * len(DIRECTIONS) + direction]
+
+    def get_total_nodes_expanded(self) -> int:
+        return self.total_nodes_expanded
+
+    def set_cache(self, cache: PathCache | None) -> None:
+        self.cache = cache
+
+    def get_cache(self) -> PathCache | None:
+        return self.cache
+
+    def cache_key(self, start_node: Node, end_node: Node) -> tuple[Any, ...]:
+        return (self.graph_hash, self.task_setting, self.k, self.epsilon,
+                self.get_cost_signature(), start_node.id, end_node.id)
 
     def compute_distance_matrix(
         self,
         start_node: Node,
         end_node: Node,
         waypoints: list[Node],
-    ) -> tuple[list[list[float]], dict[int, dict[int, dict[int, Node]]]]:
+    ) -> tuple[list[list[float]], PathStore]:
         distance_matrix: list[list[float]] = []
-        paths: dict[int, dict[int, dict[int, Node]]] = {}
+        paths = PathStore(self.graph)
 
         # distance matrix for nodes: start, end, and waypoints
         # matrix should have dimensions (n+2)x(n+2) and first row and column
         # is for the start node, the last row and column is for the end node
         # and the rest of the matrix is for the waypoints
 
-        # path matrix gives for each pair of nodes u, v, the entire path
+        # path store gives for each pair of nodes u, v, the actual leg
 
         nodes = [start_node] + waypoints + [end_node]
         distance_matrix = [[float("inf")] * len(nodes)
                            for _ in range(len(nodes))]
-        for node in nodes:
-            paths[node.id] = {}
 
         # TODO: symmetric matrix, so only compute half
+        total_legs = len(nodes) * (len(nodes) - 1)
+        legs_done = 0
         for i, node1 in enumerate(nodes):
-            for j, node2 in enumerate(nodes):
-                if i == j:
-                    distance_matrix[i][j] = 0
-                    paths[node1.id][node2.id] = {}
-                    continue
-                distance, path = self.run_algorithm(node1, node2)
+            distance_matrix[i][i] = 0
+            paths.set_leg(node1.id, node1.id, ids_array([node1.id]))
+            others = [j for j in range(len(nodes)) if j != i]
+            legs = self.find_legs(node1, [nodes[j] for j in others])
+            for j, (distance, leg) in zip(others, legs):
                 distance_matrix[i][j] = distance
-                paths[node1.id][node2.id] = path
+                paths.set_leg(node1.id, nodes[j].id, leg)
+            legs_done += len(others)
+            self.report_progress(legs_done=legs_done,
+                                 total_legs=total_legs)
 
         return distance_matrix, paths
 
+    def find_leg(
+        self,
+        start_node: Node,
+        end_node: Node,
+    ) -> tuple[float, np.ndarray]:
+        # distance and node ids of the leg, served from the cache if possible
+        key = None
+        if self.cache is not None and self.graph_hash is not None:
+            key = self.cache_key(start_node, end_node)
+            cached = self.cache.get_leg(key)
+            if cached is not None:
+                self.stats.add("cached_legs")
+                return cached
+
+        with self.stats.phase("astar_search", start=start_node.id,
+                              end=end_node.id):
+            distance, path_dict = self.run_algorithm(start_node, end_node)
+        leg = EMPTY_LEG
+        if distance != float("inf"):
+            leg = leg_from_path_dict(start_node, end_node, path_dict)
+        if self.cache is not None and key is not None:
+            self.cache.put_leg(key, distance, leg)
+        return distance, leg
+
+    def find_legs(self, source: Node, targets: list[Node]) -> list[Leg]:
+        # legs from one source to many targets, in one search of the
+        # distance engine when it applies, otherwise one A* per target
+        distance_engine = self.get_active_distance_engine()
+        if distance_engine is None:
+            return [self.find_leg(source, target) for target in targets]
+
+        legs: list[Leg | None] = [None] * len(targets)
+        keys: list[tuple[Any, ...] | None] = [None] * len(targets)
+        if self.cache is not None and self.graph_hash is not None:
+            for i, target in enumerate(targets):
+                keys[i] = self.cache_key(source, target)
+                legs[i] = self.cache.get_leg(keys[i])
+                if legs[i] is not None:
+                    self.stats.add("cached_legs")
+        missing = [i for i, leg in enumerate(legs) if leg is None]
+        if missing:
+            found = distance_engine.find_legs(
+                source, [targets[i] for i in missing])
+            for i, leg in zip(missing, found):
+                legs[i] = leg
+                key = keys[i]
+                if self.cache is not None and key is not None:
+                    self.cache.put_leg(key, *leg)
+        return legs  # type: ignore[return-value]
+
+    def find_distances(
+        self,
+        source: Node,
+        targets: list[Node],
+    ) -> list[float]:
+        # like find_legs, but a distance engine does not reconstruct the
+        # legs. Without one A* finds every leg anyway.
+        distance_engine = self.get_active_distance_engine()
+        if distance_engine is None:
+            return [self.find_leg(source, target)[0] for target in targets]
+
+        distances: list[float | None] = [None] * len(targets)
+        if self.cache is not None and self.graph_hash is not None:
+            for i, target in enumerate(targets):
+                cached = self.cache.get_leg(self.cache_key(source, target))
+                if cached is not None:
+                    self.stats.add("cached_legs")
+                    distances[i] = cached[0]
+        missing = [i for i, distance in enumerate(distances)
+                   if distance is None]
+        if missing:
+            found = distance_engine.find_distances(
+                source, [targets[i] for i in missing])
+            for i, distance in zip(missing, found):
+                distances[i] = distance
+        return distances  # type: ignore[return-value]
+
     def run_algorithm(
         self,
         start_node: Node,
@@ -89,44 +307,95 @@ class AStar(PathFindingAlgorithm):
         # run A-star algorithm to compute distance and path
         self.reset_values()
 
-        # initialize g and f functions
-        self.initialize_functions(self.graph)
+        # g and f are only stored for reached nodes, the others are infinite
+        heuristic_values = self.get_heuristic_values(end_node)
+        cost_model = self.get_active_cost_model()
+        edge_costs = self.get_edge_costs()
+        epsilon = self.epsilon
 
         # initialize the start node
         self.g_function[start_node.id] = 0
-        self.f_function[start_node.id] = self.heuristic(start_node, end_node)
+        self.f_function[start_node.id] = epsilon * (
+            heuristic_values[start_node.id] if heuristic_values is not None
+            else self.heuristic(start_node, end_node))
         insertion_idx = 0
         self.min_heap.put((self.f_function[start_node.id],
                            insertion_idx,
                            start_node))
         self.open_nodes.add(start_node)
+        nodes_expanded = 0
+        # search statistics are kept in locals and recorded once at the end
+        heap_size = 1
+        heap_peak = 1
+        reopened = 0
 
         while not self.min_heap.empty():
-            _, _, current_node = self.min_heap.get()
+            f_value, _, current_node = self.min_heap.get()
+            heap_size -= 1
+            if (current_node not in self.open_nodes
+                    or f_value > self.f_function[current_node.id]):
+                # outdated entry, the node was pushed again with a lower f
+                continue
             self.open_nodes.remove(current_node)
+            nodes_expanded += 1
+            if nodes_expanded % PROGRESS_INTERVAL == 0:
+                self.check_cancelled()
+                self.report_progress(nodes_expanded=nodes_expanded)
 
             if current_node == end_node:
                 # Path reconstruction
                 # self.reconstruct_path(start_node, end_node)
+                self.record_search(nodes_expanded, insertion_idx + 1,
+                                   heap_peak, reopened)
                 return self.g_function[end_node.id], self.path_dict
 
             for neighbor in current_node.get_neighbors():
-                aux_g = self.g_function[current_node.id] + 1
+                aux_g = self.g_function[current_node.id] + (
+                    1 if cost_model is None
+                    else self.step_cost(current_node, neighbor, edge_costs))
+                old_g = self.g_function.get(neighbor.id, INFINITY)
 
-                if aux_g < self.g_function[neighbor.id]:
+                if aux_g < old_g:
                     self.path_dict[neighbor.id] = current_node
                     self.g_function[neighbor.id] = aux_g
-                    self.f_function[neighbor.id] = aux_g + \
-                        self.heuristic(neighbor, end_node)
-
+                    self.f_function[neighbor.id] = aux_g + epsilon * (
+                        heuristic_values[neighbor.id]
+                        if heuristic_values is not None
+                        else self.heuristic(neighbor, end_node))
+
+                    # the node is pushed again whenever its f improves, the
+                    # older entries are skipped when they come up
+                    insertion_idx += 1
+                    self.min_heap.put((self.f_function[neighbor.id],
+                                       insertion_idx,
+                                       neighbor))
+                    heap_size += 1
+                    if heap_size > heap_peak:
+                        heap_peak = heap_size
                     if neighbor not in self.open_nodes:
-                        insertion_idx += 1
-                        self.min_heap.put((self.f_function[neighbor.id],
-                                           insertion_idx,
-                                           neighbor))
+                        # a finite g outside the open set means the node
+                        # was expanded already and will be expanded again
+                        if old_g != INFINITY:
+                            reopened += 1
                         self.open_nodes.add(neighbor)
+        self.record_search(nodes_expanded, insertion_idx + 1, heap_peak,
+                           reopened)
         return float("inf"), {}
 
+    def record_search(
+        self,
+        nodes_expanded: int,
+        nodes_generated: int,
+        heap_peak: int,
+        reexpansions: int,
+    ) -> None:
+        self.total_nodes_expanded += nodes_expanded
+        self.stats.add("astar_searches")
+        self.stats.add("nodes_expanded", nodes_expanded)
+        self.stats.add("nodes_generated", nodes_generated)
+        self.stats.add("reexpansions", reexpansions)
+        self.stats.set_max("heap_peak", heap_peak)
+
     def visualize_algorithm(
         self,
         draw_function: Callable,  # type: ignore
@@ -135,46 +404,72 @@ class AStar(PathFindingAlgorithm):
     ) -> bool:
         self.reset_values()
 
-        # initialize g and f functions
-        self.initialize_functions(self.graph)
+        # g and f are only stored for reached nodes, the others are infinite
+        heuristic_values = self.get_heuristic_values(end_node)
+        cost_model = self.get_active_cost_model()
+        edge_costs = self.get_edge_costs()
 
         # initialize the start node
         self.g_function[start_node.id] = 0
-        self.f_function[start_node.id] = self.heuristic(start_node, end_node)
+        self.f_function[start_node.id] = (
+            heuristic_values[start_node.id] if heuristic_values is not None
+            else self.heuristic(start_node, end_node))
         insertion_idx = 0
         self.min_heap.put((self.f_function[start_node.id],
                            insertion_idx,
                            start_node))
         self.open_nodes.add(start_node)
+        nodes_expanded = 0
+        heap_size = 1
+        heap_peak = 1
+        reopened = 0
 
         while not self.min_heap.empty():
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-
-            _, _, current_node = self.min_heap.get()
+            # the drawing happens step by step, so check on every expansion
+            self.check_cancelled()
+
+            f_value, _, current_node = self.min_heap.get()
+            heap_size -= 1
+            if (current_node not in self.open_nodes
+                    or f_value > self.f_function[current_node.id]):
+                # outdated entry, the node was pushed again with a lower f
+                continue
             self.open_nodes.remove(current_node)
+            nodes_expanded += 1
+            self.report_progress(nodes_expanded=nodes_expanded)
 
             if current_node == end_node:
                 # Path reconstruction
                 current_node.set_type(NodeType.END)
                 # self.reconstruct_path(start_node, end_node)
+                self.record_search(nodes_expanded, insertion_idx + 1,
+                                   heap_peak, reopened)
                 return True
 
             for neighbor in current_node.get_neighbors():
-                aux_g = self.g_function[current_node.id] + 1
+                aux_g = self.g_function[current_node.id] + (
+                    1 if cost_model is None
+                    else self.step_cost(current_node, neighbor, edge_costs))
+                old_g = self.g_function.get(neighbor.id, INFINITY)
 
-                if aux_g < self.g_function[neighbor.id]:
+                if aux_g < old_g:
                     self.path_dict[neighbor.id] = current_node
                     self.g_function[neighbor.id] = aux_g
-                    self.f_function[neighbor.id] = aux_g + \
-                        self.heuristic(neighbor, end_node)
-
+                    self.f_function[neighbor.id] = aux_g + (
+                        heuristic_values[neighbor.id]
+                        if heuristic_values is not None
+                        else self.heuristic(neighbor, end_node))
+
+                    insertion_idx += 1
+                    self.min_heap.put((self.f_function[neighbor.id],
+                                       insertion_idx,
+                                       neighbor))
+                    heap_size += 1
+                    if heap_size > heap_peak:
+                        heap_peak = heap_size
                     if neighbor not in self.open_nodes:
-                        insertion_idx += 1
-                        self.min_heap.put((self.f_function[neighbor.id],
-                                           insertion_idx,
-                                           neighbor))
+                        if old_g != INFINITY:
+                            reopened += 1
                         self.open_nodes.add(neighbor)
                         neighbor.set_type(NodeType.OPEN)
 
@@ -186,14 +481,10 @@ class AStar(PathFindingAlgorithm):
             draw_function(self.graph, n_rows, n_cols)
 
         # the end node is not reachable
+        self.record_search(nodes_expanded, insertion_idx + 1, heap_peak,
+                           reopened)
         return False
 
-    def initialize_functions(self, graph: list[list[Node]]) -> None:
-        for row in graph:
-            for node in row:
-                self.g_function[node.id] = float("inf")
-                self.f_function[node.id] = float("inf")
-
     def reconstruct_path(
         self,
         start_node: Node,
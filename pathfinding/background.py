@@ -0,0 +1,101 @@
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+from pathfinding.path_finding_algorithm import (
+    PathFindingAlgorithm, SolverCancelledError,
+)
+
+
+class SolverJob:
+    def __init__(self, description: str) -> None:
+        self.description = description
+        self.cancel_event = threading.Event()
+        self.future: Future[Any] | None = None
+        self.progress_lock = threading.Lock()
+        self.progress: dict[str, Any] = {}
+        self.progress_source = ""
+        self.progress_version = 0
+
+    # Accessors
+    def get_description(self) -> str:
+        return self.description
+
+    def get_progress(self) -> tuple[str, dict[str, Any], int]:
+        with self.progress_lock:
+            return (self.progress_source, dict(self.progress),
+                    self.progress_version)
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def cancelled(self) -> bool:
+        if not self.done() or self.future is None:
+            return False
+        return isinstance(self.future.exception(), SolverCancelledError)
+
+    def result(self) -> Any:
+        # re-raises whatever the solver raised in the worker
+        if self.future is None:
+            return None
+        return self.future.result()
+
+    # Modifiers
+    def set_future(self, future: Future[Any]) -> None:
+        self.future = future
+
+    def update_progress(self, source: str, progress: dict[str, Any]) -> None:
+        # called from the worker thread
+        with self.progress_lock:
+            if source != self.progress_source:
+                self.progress = {}
+            self.progress_source = source
+            self.progress.update(progress)
+            self.progress_version += 1
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+
+class BackgroundSolver:
+    # The solvers mutate the Node objects of the grid that is being drawn, so
+    # they run on a worker thread of this process rather than in a process pool.
+    def __init__(self) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="solver")
+        self.current_job: SolverJob | None = None
+
+    # Accessors
+    def get_current_job(self) -> SolverJob | None:
+        return self.current_job
+
+    def is_busy(self) -> bool:
+        return self.current_job is not None and not self.current_job.done()
+
+    # Modifiers
+    def submit(
+        self,
+        description: str,
+        algorithms: list[PathFindingAlgorithm],
+        function: Callable[..., Any],
+        *args: Any,
+    ) -> SolverJob:
+        job = SolverJob(description)
+        for algorithm in algorithms:
+            algorithm.set_progress_callback(job.update_progress)
+            algorithm.set_cancel_event(job.cancel_event)
+        job.set_future(self.executor.submit(function, *args))
+        self.current_job = job
+        return job
+
+    def cancel_current(self) -> None:
+        if self.current_job is not None:
+            self.current_job.cancel()
+
+    def clear_current(self) -> None:
+        self.current_job = None
+
+    def shutdown(self) -> None:
+        self.cancel_current()
+        self.executor.shutdown(wait=True)
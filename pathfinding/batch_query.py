@@ -0,0 +1,282 @@
+import heapq
+from collections import defaultdict
+
+import numpy as np
+
+from grid.node import Node
+from pathfinding.astar import AStar, INFINITY
+from pathfinding.grid_arrays import occupancy_array, terrain_array
+from pathfinding.path_finding_algorithm import PROGRESS_INTERVAL
+from pathfinding.terrain_cost import DIRECTIONS, TerrainCostModel
+from pathfinding.utils import ids_array
+
+# index of the opposite move in DIRECTIONS (up/down, left/right)
+OPPOSITE: tuple[int, ...] = (1, 0, 3, 2)
+# the heuristic is a minimum over the remaining goals, with more goals
+# than this it costs more than it saves and the search is plain Dijkstra
+MAX_HEURISTIC_GOALS: int = 16
+
+Query = tuple[Node, Node]
+# (forward, root node id, indices of the queries)
+QueryGroup = tuple[bool, int, list[int]]
+
+
+class SearchBuffers:
+    # Per cell search state that is reused by all searches of a batch.
+    # Instead of clearing the arrays, every search gets a new generation
+    # and values written by older generations count as unset.
+    def __init__(self, n_cells: int) -> None:
+        self.g = np.zeros(n_cells, dtype=np.float64)
+        self.parent = np.zeros(n_cells, dtype=np.int64)
+        self.reached = np.zeros(n_cells, dtype=np.int32)
+        self.closed = np.zeros(n_cells, dtype=np.int32)
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self.g)
+
+    def next_generation(self) -> int:
+        self.generation += 1
+        if self.generation == np.iinfo(np.int32).max:
+            self.reached.fill(0)
+            self.closed.fill(0)
+            self.generation = 1
+        return self.generation
+
+
+class BatchResult:
+    # Distances and legs of a batch in query order. The legs are stored in
+    # one array of node ids with an offset per query, like CSR.
+    def __init__(
+        self,
+        distances: np.ndarray,
+        offsets: np.ndarray,
+        cells: np.ndarray,
+    ) -> None:
+        self.distances = distances
+        self.offsets = offsets
+        self.cells = cells
+
+    # Accessors
+    def __len__(self) -> int:
+        return len(self.distances)
+
+    def get_distances(self) -> np.ndarray:
+        return self.distances
+
+    def get_distance(self, index: int) -> float:
+        return float(self.distances[index])
+
+    def get_leg(self, index: int) -> np.ndarray:
+        # node ids from source to goal, empty if the goal is unreachable
+        return self.cells[self.offsets[index]:self.offsets[index + 1]]
+
+    def get_nbytes(self) -> int:
+        return (self.distances.nbytes + self.offsets.nbytes
+                + self.cells.nbytes)
+
+
+def group_queries(queries: list[tuple[int, int]]) -> list[QueryGroup]:
+    # greedy cover of the queries by shared endpoints: the source or goal
+    # shared by most of the remaining queries becomes the root of the next
+    # group. Forward groups search from a source, the others backwards from
+    # a goal.
+    by_endpoint: dict[tuple[bool, int], set[int]] = defaultdict(set)
+    for index, (source_id, goal_id) in enumerate(queries):
+        by_endpoint[(True, source_id)].add(index)
+        by_endpoint[(False, goal_id)].add(index)
+    heap = [(-len(indices), not forward, root_id)
+            for (forward, root_id), indices in by_endpoint.items()]
+    heapq.heapify(heap)
+    assigned: set[int] = set()
+    groups = []
+    while heap:
+        size, backward, root_id = heapq.heappop(heap)
+        indices = by_endpoint[(not backward, root_id)] - assigned
+        if not indices:
+            continue
+        if len(indices) < -size:
+            # some queries were taken by other groups, try again later
+            heapq.heappush(heap, (-len(indices), backward, root_id))
+            continue
+        assigned |= indices
+        groups.append((not backward, root_id, sorted(indices)))
+    return groups
+
+
+class BatchPlanner:
+    # Answers many point to point queries on the graph of an AStar at once.
+    # Queries that share a source are answered by one search from it that
+    # stops when all of its goals are settled, queries that share a goal by
+    # one search backwards from the goal, so the work grows with the number
+    # of groups rather than the number of queries. The searches are A* on
+    # flat arrays, towards the closest goal not settled yet, and return the
+    # shortest legs under the costs of the AStar (epsilon and the inexact
+    # ELEVATION heuristic are not used).
+    def __init__(self, astar: AStar) -> None:
+        self.astar = astar
+        self.buffers: SearchBuffers | None = None
+        # arrays of the last graph seen, as (key, passable, edge costs,
+        # terrain)
+        self.arrays: tuple[tuple, np.ndarray, memoryview,
+                           memoryview | None] | None = None
+
+    # Accessors
+    def get_arrays(self) -> tuple[np.ndarray, memoryview, memoryview | None]:
+        # memoryviews index to plain floats, for the search loop
+        astar = self.astar
+        cost_model = astar.get_active_cost_model()
+        key = (id(astar.graph), astar.graph_hash, astar.get_cost_signature())
+        if (self.arrays is None or self.arrays[0] != key
+                or astar.graph_hash is None):
+            passable = ~occupancy_array(astar.graph)
+            terrain = None
+            if cost_model is None:
+                cost_model = TerrainCostModel(climb_cost=0.0,
+                                              descent_cost=0.0)
+                levels = np.zeros(passable.shape)
+            else:
+                terrain = terrain_array(astar.graph)
+                levels = terrain
+            edge_costs = cost_model.edge_costs(levels)
+            # moves into obstacles are impossible as well
+            rows, cols = passable.shape
+            free = passable.ravel()
+            for direction, (row_offset, col_offset) in enumerate(DIRECTIONS):
+                offset = row_offset * cols + col_offset
+                costs = edge_costs[direction::len(DIRECTIONS)]
+                sources = np.flatnonzero(np.isfinite(costs))
+                costs[sources[~free[sources + offset]]] = INFINITY
+            edge_costs[np.repeat(~free, len(DIRECTIONS))] = INFINITY
+            self.arrays = (key, passable, memoryview(edge_costs),
+                           None if terrain is None
+                           else memoryview(terrain.ravel()))
+        return self.arrays[1], self.arrays[2], self.arrays[3]
+
+    def get_buffers(self, n_cells: int) -> SearchBuffers:
+        if self.buffers is None or len(self.buffers) != n_cells:
+            self.buffers = SearchBuffers(n_cells)
+        return self.buffers
+
+    def solve(self, queries: list[Query]) -> BatchResult:
+        query_ids = [(source.id, goal.id) for source, goal in queries]
+        distances = np.full(len(queries), INFINITY)
+        legs: list[np.ndarray] = [ids_array([])] * len(queries)
+        stats = self.astar.get_stats()
+        with stats.phase("batch_query", queries=len(queries)):
+            groups = group_queries(query_ids)
+            for forward, root_id, indices in groups:
+                others = [query_ids[index][1 if forward else 0]
+                          for index in indices]
+                found = self.search(root_id, others, forward)
+                for index, other_id in zip(indices, others):
+                    distances[index], legs[index] = found[other_id]
+        stats.add("batch_queries", len(queries))
+        stats.add("batch_groups", len(groups))
+
+        offsets = np.zeros(len(queries) + 1, dtype=np.int64)
+        np.cumsum([len(leg) for leg in legs], out=offsets[1:])
+        cells = (np.concatenate(legs) if legs else ids_array([]))
+        return BatchResult(distances, offsets, cells)
+
+    def search(
+        self,
+        root_id: int,
+        other_ids: list[int],
+        forward: bool,
+    ) -> dict[int, tuple[float, np.ndarray]]:
+        # distance and leg (always in the direction source to goal) between
+        # the root and each of the other nodes
+        passable, edge_costs, terrain = self.get_arrays()
+        rows, cols = passable.shape
+        buffers = self.get_buffers(rows * cols)
+        generation = buffers.next_generation()
+        g, parent = buffers.g, buffers.parent
+        reached, closed = buffers.reached, buffers.closed
+        cost_model = self.astar.get_active_cost_model()
+        n_directions = len(DIRECTIONS)
+        offsets = [row_offset * cols + col_offset
+                   for row_offset, col_offset in DIRECTIONS]
+
+        remaining = {other_id for other_id in other_ids
+                     if passable.flat[other_id]}
+        goal_positions = {other_id: divmod(other_id, cols)
+                          for other_id in remaining}
+
+        def heuristic(node_id: int) -> float:
+            # towards the closest of the remaining goals
+            if len(remaining) > MAX_HEURISTIC_GOALS:
+                return 0.0
+            row, col = divmod(node_id, cols)
+            best = INFINITY
+            for goal_id in remaining:
+                goal_row, goal_col = goal_positions[goal_id]
+                manhattan = abs(row - goal_row) + abs(col - goal_col)
+                if cost_model is None:
+                    estimate = manhattan
+                elif forward:
+                    estimate = cost_model.heuristic(
+                        terrain[node_id], terrain[goal_id], manhattan)
+                else:
+                    estimate = cost_model.heuristic(
+                        terrain[goal_id], terrain[node_id], manhattan)
+                if estimate < best:
+                    best = estimate
+            return best
+
+        heap: list[tuple[float, float, int]] = []
+        if passable.flat[root_id] and remaining:
+            g[root_id] = 0.0
+            parent[root_id] = -1
+            reached[root_id] = generation
+            heap.append((heuristic(root_id), 0.0, root_id))
+        nodes_expanded = 0
+        while heap and remaining:
+            key, g_value, node_id = heapq.heappop(heap)
+            if closed[node_id] == generation or g_value > g[node_id]:
+                continue
+            estimate = g_value + heuristic(node_id)
+            if estimate > key:
+                # a goal was settled since the node was pushed, the closest
+                # remaining one is farther away
+                heapq.heappush(heap, (estimate, g_value, node_id))
+                continue
+            closed[node_id] = generation
+            remaining.discard(node_id)
+            nodes_expanded += 1
+            if nodes_expanded % PROGRESS_INTERVAL == 0:
+                self.astar.check_cancelled()
+
+            row, col = divmod(node_id, cols)
+            for direction in range(n_directions):
+                neighbor_id = node_id + offsets[direction]
+                if forward:
+                    cost = edge_costs[node_id * n_directions + direction]
+                else:
+                    # the move from the neighbor to this node
+                    cost = edge_costs[neighbor_id * n_directions
+                                      + OPPOSITE[direction]] \
+                        if 0 <= neighbor_id < rows * cols else INFINITY
+                if cost == INFINITY:
+                    continue
+                new_g = g_value + cost
+                if reached[neighbor_id] != generation or new_g < g[neighbor_id]:
+                    reached[neighbor_id] = generation
+                    g[neighbor_id] = new_g
+                    parent[neighbor_id] = node_id
+                    heapq.heappush(heap, (new_g + heuristic(neighbor_id),
+                                          new_g, neighbor_id))
+        self.astar.stats.add("nodes_expanded", nodes_expanded)
+
+        found: dict[int, tuple[float, np.ndarray]] = {}
+        for other_id in other_ids:
+            if closed[other_id] != generation:
+                found[other_id] = (INFINITY, ids_array([]))
+                continue
+            path = [other_id]
+            while parent[path[-1]] >= 0:
+                path.append(int(parent[path[-1]]))
+            if forward:
+                path.reverse()
+            found[other_id] = (float(g[other_id]), ids_array(path))
+        return found
@@ -0,0 +1,221 @@
+import numpy as np
+
+from grid.node import Node
+from pathfinding.distance_engine import DistanceEngine, Leg
+from pathfinding.grid_arrays import occupancy_array
+from pathfinding.path_store import EMPTY_LEG
+from pathfinding.terrain_cost import DIRECTIONS, TerrainCostModel
+from pathfinding.utils import ids_array
+from visualization.visualization import TaskSetting
+
+# 64 cells per word, bit i of word w of a row is column 64 * w + i
+WORD = np.dtype("<u8")
+WORD_BITS: int = 64
+UNREACHED: int = -1
+
+
+def pack_rows(mask: np.ndarray) -> np.ndarray:
+    rows, cols = mask.shape
+    n_words = -(-cols // WORD_BITS)
+    padded = np.zeros((rows, n_words * WORD_BITS), dtype=bool)
+    padded[:, :cols] = mask
+    return np.packbits(padded, axis=1, bitorder="little").view(WORD)
+
+
+class PackedGrid:
+    # Passable cells packed into one bit each. A breadth first search on it
+    # advances the whole frontier by one step with a few shifts and ORs over
+    # the words of the rows the frontier spans, i.e. 64 cells per operation
+    # instead of one heap pop per cell.
+    def __init__(self, passable: np.ndarray) -> None:
+        self.rows, self.cols = passable.shape
+        self.passable = pack_rows(passable)
+        self.n_words = self.passable.shape[1]
+
+    # Accessors
+    def get_nbytes(self) -> int:
+        return self.passable.nbytes
+
+    def is_passable(self, node_id: int) -> bool:
+        row, col = divmod(node_id, self.cols)
+        word = int(self.passable[row, col // WORD_BITS])
+        return bool(word >> (col % WORD_BITS) & 1)
+
+    def expand(
+        self,
+        frontier: np.ndarray,
+        top: int,
+    ) -> tuple[np.ndarray, int]:
+        # all cells next to the frontier (rows top.. of the grid), as rows
+        # lo.. of the grid, lo being one above the frontier if possible
+        height = frontier.shape[0]
+        lo = max(top - 1, 0)
+        hi = min(top + height + 1, self.rows)
+        offset = top - lo
+        cells = np.zeros((hi - lo, self.n_words), dtype=WORD)
+        # right and left, carrying the bits that cross a word boundary
+        right = frontier << 1
+        right[:, 1:] |= frontier[:, :-1] >> 63
+        left = frontier >> 1
+        left[:, :-1] |= frontier[:, 1:] << 63
+        cells[offset:offset + height] = right | left
+        # up and down
+        if offset:
+            cells[:height] |= frontier
+        else:
+            cells[:height - 1] |= frontier[1:]
+        if top + height < self.rows:
+            cells[offset + 1:offset + 1 + height] |= frontier
+        else:
+            cells[offset + 1:offset + height] |= frontier[:-1]
+        return cells, lo
+
+    def search(
+        self,
+        source_id: int,
+        target_ids: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, int]:
+        # BFS levels of all cells (UNREACHED for the others) and the number
+        # of levels searched. With targets the search stops as soon as all
+        # of them have a level, every cell closer than the farthest target
+        # has its level already.
+        levels = np.full(self.rows * self.cols, UNREACHED, dtype=np.int32)
+        if not self.is_passable(source_id):
+            return levels, 0
+        levels[source_id] = 0
+        row, col = divmod(source_id, self.cols)
+        visited = np.zeros_like(self.passable)
+        frontier = np.zeros((1, self.n_words), dtype=WORD)
+        frontier[0, col // WORD_BITS] = np.uint64(1) << np.uint64(
+            col % WORD_BITS)
+        visited[row] = frontier[0]
+        top = row
+        level = 0
+        while True:
+            if target_ids is not None and (levels[target_ids] >= 0).all():
+                break
+            cells, lo = self.expand(frontier, top)
+            cells &= self.passable[lo:lo + cells.shape[0]]
+            cells &= ~visited[lo:lo + cells.shape[0]]
+            busy_rows = np.flatnonzero(cells.any(axis=1))
+            if not busy_rows.size:
+                break
+            level += 1
+            visited[lo:lo + cells.shape[0]] |= cells
+            frontier = cells[busy_rows[0]:busy_rows[-1] + 1]
+            top = lo + int(busy_rows[0])
+            self.set_levels(levels, frontier, top, level)
+        return levels, level
+
+    def set_levels(
+        self,
+        levels: np.ndarray,
+        frontier: np.ndarray,
+        top: int,
+        level: int,
+    ) -> None:
+        # only the non-zero words of the frontier are unpacked
+        words = frontier.ravel()
+        word_ids = np.flatnonzero(words)
+        bits = np.unpackbits(words[word_ids].view(np.uint8),
+                             bitorder="little")
+        bit_ids = np.flatnonzero(bits)
+        word_ids = word_ids[bit_ids // WORD_BITS]
+        bit = bit_ids % WORD_BITS
+        rows = top + word_ids // self.n_words
+        cols = word_ids % self.n_words * WORD_BITS + bit
+        levels[rows * self.cols + cols] = level
+
+    def reachable(self, source_id: int) -> np.ndarray:
+        # mask of the cells connected to the source
+        levels, _ = self.search(source_id)
+        return (levels >= 0).reshape(self.rows, self.cols)
+
+    def leg(self, levels: np.ndarray, target_id: int) -> np.ndarray:
+        # node ids from the source of the search to the target, found by
+        # stepping to a neighbor one level lower from the target
+        level = int(levels[target_id])
+        if level < 0:
+            return EMPTY_LEG
+        level_of = memoryview(levels)
+        path = [target_id]
+        node_id = target_id
+        while level > 0:
+            level -= 1
+            row, col = divmod(node_id, self.cols)
+            for row_offset, col_offset in DIRECTIONS:
+                neighbor_row = row + row_offset
+                neighbor_col = col + col_offset
+                if not (0 <= neighbor_row < self.rows
+                        and 0 <= neighbor_col < self.cols):
+                    continue
+                neighbor_id = neighbor_row * self.cols + neighbor_col
+                if level_of[neighbor_id] == level:
+                    node_id = neighbor_id
+                    break
+            path.append(node_id)
+        path.reverse()
+        return ids_array(path)
+
+
+class BitsetBFS(DistanceEngine):
+    # Distance engine for unit cost moves: one bit parallel BFS from each
+    # source reaches all of its targets at once.
+    def __init__(self) -> None:
+        super().__init__()
+        self.packed: PackedGrid | None = None
+
+    # Accessors
+    def applies(
+        self,
+        task_setting: TaskSetting,
+        cost_model: TerrainCostModel | None,
+    ) -> bool:
+        # the ELEVATION heuristic is not admissible for every K, so A* may
+        # return longer legs there, which the engine should not change
+        return task_setting != TaskSetting.ELEVATION
+
+    def get_packed(self) -> PackedGrid:
+        if self.packed is None:
+            self.packed = PackedGrid(~occupancy_array(self.graph))
+        return self.packed
+
+    def find_legs(self, source: Node, targets: list[Node]) -> list[Leg]:
+        packed = self.get_packed()
+        levels = self.search(source, targets)
+        legs: list[Leg] = []
+        for target in targets:
+            level = int(levels[target.id])
+            if level < 0:
+                legs.append((float("inf"), EMPTY_LEG))
+            else:
+                legs.append((float(level), packed.leg(levels, target.id)))
+        return legs
+
+    def find_distances(self, source: Node, targets: list[Node]) -> list[float]:
+        # the levels are the distances, walking the legs back is skipped
+        levels = self.search(source, targets)
+        return [float(level) if level >= 0 else float("inf")
+                for level in levels[[target.id for target in targets]]]
+
+    def search(self, source: Node, targets: list[Node]) -> np.ndarray:
+        target_ids = np.array([target.id for target in targets],
+                              dtype=np.int64)
+        with self.stats.phase("bitset_bfs", source=source.id):
+            levels, n_levels = self.get_packed().search(source.id,
+                                                        target_ids)
+        self.stats.add("bfs_searches")
+        self.stats.add("bfs_levels", n_levels)
+        return levels
+
+    def is_reachable(self, source: Node, target: Node) -> bool:
+        levels, _ = self.get_packed().search(
+            source.id, np.array([target.id], dtype=np.int64))
+        return bool(levels[target.id] >= 0)
+
+    def reachable(self, source: Node) -> np.ndarray:
+        return self.get_packed().reachable(source.id)
+
+    # Modifiers
+    def invalidate(self) -> None:
+        self.packed = None
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from collections.abc import Hashable, Iterator
+from typing import Any
+
+import numpy as np
+
+from grid.grid import GridEdit
+from grid.node import Node
+from pathfinding.utils import ids_array
+from visualization.visualization import TaskSetting
+
+# key layout shared by both caches: (grid hash, task setting, ...)
+CacheKey = tuple[Any, ...]
+
+
+class LRUCache:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    # Accessors
+    def get(self, key: Hashable) -> Any | None:
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def keys(self) -> Iterator[Hashable]:
+        return iter(list(self.entries.keys()))
+
+    def get_stats(self) -> dict[str, int]:
+        return {"size": len(self.entries), "hits": self.hits,
+                "misses": self.misses}
+
+    # Modifiers
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Any | None:
+        return self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+class PathCache:
+    # Content addressed cache for point-to-point legs and full tours.
+    # Entries are keyed by the grid content hash, so undoing an edit makes
+    # the old entries valid again. When a cell gets blocked, entries whose
+    # path does not cross it are still optimal and are carried over to the
+    # new hash, the others are evicted.
+    def __init__(self, max_legs: int, max_tours: int) -> None:
+        self.legs = LRUCache(max_legs)
+        self.tours = LRUCache(max_tours)
+
+    # Accessors
+    def get_leg(self, key: CacheKey) -> tuple[float, np.ndarray] | None:
+        entry = self.legs.get(key)
+        if entry is None:
+            return None
+        distance, leg = entry
+        return distance, leg
+
+    def get_tour(self, key: CacheKey) -> np.ndarray | None:
+        # node ids of the path, the caller turns them into the nodes of its
+        # current graph since a new Grid can have the same content hash
+        entry = self.tours.get(key)
+        if entry is None:
+            return None
+        (cells,) = entry
+        return cells
+
+    def get_stats(self) -> dict[str, dict[str, int]]:
+        return {"legs": self.legs.get_stats(),
+                "tours": self.tours.get_stats()}
+
+    # Modifiers
+    def put_leg(self, key: CacheKey, distance: float, leg: np.ndarray) -> None:
+        self.legs.put(key, (distance, leg))
+
+    def put_tour(self, key: CacheKey, path: list[Node]) -> None:
+        self.tours.put(key, (ids_array([node.id for node in path]),))
+
+    def apply_edits(self, edits: list[GridEdit]) -> None:
+        for edit in edits:
+            if not edit.blocked:
+                # freeing a cell or changing terrain can shorten any path,
+                # old entries stay under the old hash for a possible undo
+                continue
+            for cache in (self.legs, self.tours):
+                self.carry_over(cache, edit)
+
+    def carry_over(self, cache: LRUCache, edit: GridEdit) -> None:
+        for key in cache.keys():
+            if not isinstance(key, tuple) or key[0] != edit.old_hash:
+                continue
+            entry = cache.pop(key)
+            # with the inadmissible elevation heuristic the result depends
+            # on what was explored, not only on the path
+            # the last item of every entry are the node ids of its path
+            if (key[1] == TaskSetting.ELEVATION
+                    or bool(np.any(entry[-1] == edit.node_id))):
+                continue
+            cache.put((edit.new_hash,) + key[1:], entry)
+
+    def clear(self) -> None:
+        self.legs.clear()
+        self.tours.clear()
@@ -0,0 +1,426 @@
+import heapq
+import os
+
+import numpy as np
+
+from grid.node import Node
+from pathfinding.distance_engine import DistanceEngine, Leg
+from pathfinding.grid_arrays import occupancy_array, terrain_array
+from pathfinding.path_store import EMPTY_LEG
+from pathfinding.terrain_cost import DIRECTIONS, INFINITY, TerrainCostModel
+from pathfinding.utils import ids_array, path_dict_from_leg
+from visualization.visualization import TaskSetting
+
+# nodes settled by one witness search before it gives up, a shortcut is
+# added whenever no witness was found within the limit
+WITNESS_SETTLE_LIMIT: int = 64
+NO_MIDDLE: int = -1
+
+
+class Hierarchy:
+    # Contraction hierarchy of a grid graph. Every node has a rank (the
+    # order of contraction). The upward edges go from a node to neighbors
+    # of higher rank, the downward edges are stored reversed at their lower
+    # ranked end, both in CSR form over node ids. A shortcut replaces two
+    # edges through a lower ranked middle node and is unpacked through it.
+    def __init__(
+        self,
+        rows: int,
+        cols: int,
+        rank: np.ndarray,
+        up: tuple[np.ndarray, np.ndarray, np.ndarray],
+        down: tuple[np.ndarray, np.ndarray, np.ndarray],
+        shortcuts: tuple[np.ndarray, np.ndarray, np.ndarray],
+    ) -> None:
+        self.rows = rows
+        self.cols = cols
+        self.rank = rank
+        self.up = up
+        self.down = down
+        self.shortcuts = shortcuts
+        # plain lists for the query loops
+        self.up_lists = tuple(array.tolist() for array in up)
+        self.down_lists = tuple(array.tolist() for array in down)
+        self.middles = {
+            (source, target): middle
+            for source, target, middle in zip(*(array.tolist()
+                                                for array in shortcuts))}
+
+    # Accessors
+    def get_number_of_shortcuts(self) -> int:
+        return len(self.middles)
+
+    def get_shape(self) -> tuple[int, int]:
+        return self.rows, self.cols
+
+    def get_number_of_edges(self) -> int:
+        return len(self.up[1]) + len(self.down[1])
+
+    def search_upward(
+        self,
+        start_id: int,
+        lists: tuple[list[int], list[int], list[float]],
+    ) -> tuple[dict[int, float], dict[int, int]]:
+        # Dijkstra over the edges towards higher ranks only, the search
+        # spaces of these are small so they are searched completely
+        offsets, neighbors, weights = lists
+        distances = {start_id: 0.0}
+        parents: dict[int, int] = {}
+        heap = [(0.0, start_id)]
+        settled: set[int] = set()
+        while heap:
+            distance, node_id = heapq.heappop(heap)
+            if node_id in settled:
+                continue
+            settled.add(node_id)
+            for i in range(offsets[node_id], offsets[node_id + 1]):
+                neighbor_id = neighbors[i]
+                new_distance = distance + weights[i]
+                if new_distance < distances.get(neighbor_id, INFINITY):
+                    distances[neighbor_id] = new_distance
+                    parents[neighbor_id] = node_id
+                    heapq.heappush(heap, (new_distance, neighbor_id))
+        return distances, parents
+
+    def search_forward(
+        self,
+        source_id: int,
+    ) -> tuple[dict[int, float], dict[int, int]]:
+        return self.search_upward(source_id, self.up_lists)
+
+    def search_backward(
+        self,
+        target_id: int,
+    ) -> tuple[dict[int, float], dict[int, int]]:
+        return self.search_upward(target_id, self.down_lists)
+
+    def query(
+        self,
+        forward: tuple[dict[int, float], dict[int, int]],
+        target_id: int,
+    ) -> tuple[float, np.ndarray]:
+        forward_distances, forward_parents = forward
+        backward_distances, backward_parents = self.search_backward(target_id)
+        distance, meeting_id = self.meet(forward_distances, backward_distances)
+        if meeting_id < 0:
+            return INFINITY, EMPTY_LEG
+
+        # edges of the upward paths, source to meeting node to target
+        path = [meeting_id]
+        while path[-1] in forward_parents:
+            path.append(forward_parents[path[-1]])
+        path.reverse()
+        while path[-1] in backward_parents:
+            path.append(backward_parents[path[-1]])
+        return distance, self.unpack(path)
+
+    def query_distance(
+        self,
+        forward: tuple[dict[int, float], dict[int, int]],
+        target_id: int,
+    ) -> float:
+        # like query, without unpacking the shortcuts of the path
+        return self.meet(forward[0], self.search_backward(target_id)[0])[0]
+
+    def meet(
+        self,
+        forward_distances: dict[int, float],
+        backward_distances: dict[int, float],
+    ) -> tuple[float, int]:
+        # the shortest path meets both upward searches at its highest
+        # ranked node, -1 if they do not meet
+        distance = INFINITY
+        meeting_id = -1
+        for node_id, backward_distance in backward_distances.items():
+            total = (forward_distances.get(node_id, INFINITY)
+                     + backward_distance)
+            if total < distance:
+                distance = total
+                meeting_id = node_id
+        return distance, meeting_id
+
+    def unpack(self, path: list[int]) -> np.ndarray:
+        # replace every shortcut by its two edges until only edges between
+        # neighboring cells are left
+        cells = [path[0]]
+        stack = [(source, target)
+                 for source, target in zip(path[-2::-1], path[:0:-1])]
+        while stack:
+            source, target = stack.pop()
+            middle = self.middles.get((source, target))
+            if middle is None:
+                cells.append(target)
+            else:
+                stack.append((middle, target))
+                stack.append((source, middle))
+        return ids_array(cells)
+
+    def save(self, path: str, graph_hash: int | None, signature: str) -> None:
+        np.savez(
+            path,
+            shape=np.array([self.rows, self.cols], dtype=np.int64),
+            rank=self.rank,
+            up_offsets=self.up[0], up_targets=self.up[1],
+            up_weights=self.up[2],
+            down_offsets=self.down[0], down_sources=self.down[1],
+            down_weights=self.down[2],
+            shortcut_sources=self.shortcuts[0],
+            shortcut_targets=self.shortcuts[1],
+            shortcut_middles=self.shortcuts[2],
+            graph_hash=np.array(str(graph_hash)),
+            signature=np.array(signature),
+        )
+
+
+def load_hierarchy(path: str) -> tuple[Hierarchy, str, str]:
+    # the hierarchy, plus the graph hash and cost signature it was built for
+    with np.load(path) as data:
+        rows, cols = data["shape"].tolist()
+        hierarchy = Hierarchy(
+            rows, cols, data["rank"],
+            (data["up_offsets"], data["up_targets"], data["up_weights"]),
+            (data["down_offsets"], data["down_sources"],
+             data["down_weights"]),
+            (data["shortcut_sources"], data["shortcut_targets"],
+             data["shortcut_middles"]),
+        )
+        return hierarchy, str(data["graph_hash"]), str(data["signature"])
+
+
+class HierarchyBuilder:
+    # Contracts the nodes of a grid graph one at a time, in the order of
+    # their edge difference (shortcuts added minus edges removed, plus the
+    # neighbors contracted already, which spreads the contraction evenly).
+    # Priorities are updated lazily when a node comes up.
+    def __init__(self, passable: np.ndarray, edge_costs: np.ndarray) -> None:
+        self.rows, self.cols = passable.shape
+        n_cells = self.rows * self.cols
+        free = passable.ravel()
+        self.out_edges: dict[int, dict[int, float]] = {}
+        self.in_edges: dict[int, dict[int, float]] = {}
+        for node_id in np.flatnonzero(free).tolist():
+            self.out_edges[node_id] = {}
+            self.in_edges[node_id] = {}
+        for direction, (row_offset, col_offset) in enumerate(DIRECTIONS):
+            costs = edge_costs[direction::len(DIRECTIONS)]
+            offset = row_offset * self.cols + col_offset
+            sources = np.flatnonzero(free & np.isfinite(costs))
+            sources = sources[free[sources + offset]]
+            for source, cost in zip(sources.tolist(),
+                                    costs[sources].tolist()):
+                self.out_edges[source][source + offset] = cost
+                self.in_edges[source + offset][source] = cost
+        self.middles: dict[tuple[int, int], int] = {}
+        self.contracted_neighbors = dict.fromkeys(self.out_edges, 0)
+        self.rank = np.full(n_cells, -1, dtype=np.int64)
+        # edges of the final hierarchy, filled when a node is contracted
+        self.up: dict[int, dict[int, float]] = {}
+        self.down: dict[int, dict[int, float]] = {}
+
+    def witness_search(
+        self,
+        source_id: int,
+        excluded_id: int,
+        limit: float,
+        targets: set[int],
+    ) -> dict[int, float]:
+        # distances from source_id without passing excluded_id, only as far
+        # as needed to decide the shortcuts
+        distances = {source_id: 0.0}
+        heap = [(0.0, source_id)]
+        settled = 0
+        remaining = set(targets)
+        while heap and remaining and settled < WITNESS_SETTLE_LIMIT:
+            distance, node_id = heapq.heappop(heap)
+            if distance > distances.get(node_id, INFINITY):
+                continue
+            if distance > limit:
+                break
+            settled += 1
+            remaining.discard(node_id)
+            for neighbor_id, weight in self.out_edges[node_id].items():
+                if neighbor_id == excluded_id:
+                    continue
+                new_distance = distance + weight
+                if new_distance < distances.get(neighbor_id, INFINITY):
+                    distances[neighbor_id] = new_distance
+                    heapq.heappush(heap, (new_distance, neighbor_id))
+        return distances
+
+    def shortcuts(self, node_id: int) -> list[tuple[int, int, float]]:
+        # the shortcuts needed when node_id is contracted now
+        shortcuts = []
+        out_edges = self.out_edges[node_id]
+        for source_id, in_weight in self.in_edges[node_id].items():
+            via = {target_id: in_weight + out_weight
+                   for target_id, out_weight in out_edges.items()
+                   if target_id != source_id}
+            if not via:
+                continue
+            witnesses = self.witness_search(source_id, node_id,
+                                            max(via.values()), set(via))
+            for target_id, weight in via.items():
+                if witnesses.get(target_id, INFINITY) > weight:
+                    shortcuts.append((source_id, target_id, weight))
+        return shortcuts
+
+    def priority(
+        self,
+        node_id: int,
+    ) -> tuple[int, list[tuple[int, int, float]]]:
+        shortcuts = self.shortcuts(node_id)
+        removed = len(self.in_edges[node_id]) + len(self.out_edges[node_id])
+        return (len(shortcuts) - removed
+                + self.contracted_neighbors[node_id]), shortcuts
+
+    def contract(
+        self,
+        node_id: int,
+        shortcuts: list[tuple[int, int, float]],
+    ) -> None:
+        for source_id, target_id, weight in shortcuts:
+            if weight < self.out_edges[source_id].get(target_id, INFINITY):
+                self.out_edges[source_id][target_id] = weight
+                self.in_edges[target_id][source_id] = weight
+                self.middles[(source_id, target_id)] = node_id
+        # the remaining neighbors all get a higher rank
+        self.up[node_id] = self.out_edges.pop(node_id)
+        self.down[node_id] = self.in_edges.pop(node_id)
+        for target_id in self.up[node_id]:
+            del self.in_edges[target_id][node_id]
+            self.contracted_neighbors[target_id] += 1
+        for source_id in self.down[node_id]:
+            del self.out_edges[source_id][node_id]
+            self.contracted_neighbors[source_id] += 1
+
+    def build(self) -> Hierarchy:
+        heap = [(self.priority(node_id)[0], node_id)
+                for node_id in self.out_edges]
+        heapq.heapify(heap)
+        rank = 0
+        while heap:
+            _, node_id = heapq.heappop(heap)
+            priority, shortcuts = self.priority(node_id)
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, node_id))
+                continue
+            self.contract(node_id, shortcuts)
+            self.rank[node_id] = rank
+            rank += 1
+
+        # only shortcuts that survived as edges of the hierarchy
+        kept = [(source_id, target_id, middle)
+                for (source_id, target_id), middle in self.middles.items()
+                if target_id in self.up.get(source_id, {})
+                or source_id in self.down.get(target_id, {})]
+        shortcuts = np.array(kept, dtype=np.int64).reshape(-1, 3)
+        return Hierarchy(self.rows, self.cols, self.rank,
+                         self.csr(self.up), self.csr(self.down),
+                         (shortcuts[:, 0], shortcuts[:, 1], shortcuts[:, 2]))
+
+    def csr(
+        self,
+        edges: dict[int, dict[int, float]],
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n_cells = self.rows * self.cols
+        counts = np.zeros(n_cells, dtype=np.int64)
+        for node_id, neighbors in edges.items():
+            counts[node_id] = len(neighbors)
+        offsets = np.zeros(n_cells + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        neighbor_ids = np.empty(offsets[-1], dtype=np.int64)
+        weights = np.empty(offsets[-1], dtype=np.float64)
+        for node_id, neighbors in edges.items():
+            start = offsets[node_id]
+            neighbor_ids[start:start + len(neighbors)] = list(neighbors)
+            weights[start:start + len(neighbors)] = list(neighbors.values())
+        return offsets, neighbor_ids, weights
+
+
+class ContractionHierarchy(DistanceEngine):
+    # Distance engine for static maps with many queries: the hierarchy is
+    # built once per graph and cost model (optionally kept in a file so
+    # that it survives restarts), after which a query only searches upwards
+    # from both ends.
+    def __init__(self, path: str | None = None) -> None:
+        super().__init__()
+        self.path = path
+        self.hierarchy: Hierarchy | None = None
+
+    # Accessors
+    def applies(
+        self,
+        task_setting: TaskSetting,
+        cost_model: TerrainCostModel | None,
+    ) -> bool:
+        # A* with the plain ELEVATION heuristic is not exact, see BitsetBFS
+        return task_setting != TaskSetting.ELEVATION or cost_model is not None
+
+    def get_hierarchy(self) -> Hierarchy:
+        if self.hierarchy is None:
+            self.hierarchy = self.load()
+        if self.hierarchy is None:
+            with self.stats.phase("ch_build"):
+                self.hierarchy = self.build()
+            self.stats.add("ch_shortcuts",
+                           self.hierarchy.get_number_of_shortcuts())
+            if self.path is not None and self.graph_hash is not None:
+                self.hierarchy.save(self.path, self.graph_hash,
+                                    repr(self.get_cost_signature()))
+        return self.hierarchy
+
+    def load(self) -> Hierarchy | None:
+        # only a hierarchy built for this very graph and costs is used. The
+        # content hash does not cover the size of the grid (all empty grids
+        # hash to 0), so the shape has to match as well.
+        if (self.path is None or self.graph is None or self.graph_hash is None
+                or not os.path.exists(self.path)):
+            return None
+        hierarchy, graph_hash, signature = load_hierarchy(self.path)
+        if (hierarchy.get_shape() != (len(self.graph), len(self.graph[0]))
+                or graph_hash != str(self.graph_hash)
+                or signature != repr(self.get_cost_signature())):
+            return None
+        self.stats.add("ch_loaded")
+        return hierarchy
+
+    def build(self) -> Hierarchy:
+        passable = ~occupancy_array(self.graph)
+        if self.cost_model is None:
+            edge_costs = TerrainCostModel(climb_cost=0.0, descent_cost=0.0
+                                          ).edge_costs(np.zeros(passable.shape))
+        else:
+            edge_costs = self.cost_model.edge_costs(terrain_array(self.graph))
+        return HierarchyBuilder(passable, edge_costs).build()
+
+    def find_legs(self, source: Node, targets: list[Node]) -> list[Leg]:
+        hierarchy = self.get_hierarchy()
+        legs: list[Leg] = []
+        with self.stats.phase("ch_query", source=source.id):
+            forward = hierarchy.search_forward(source.id)
+            for target in targets:
+                legs.append(hierarchy.query(forward, target.id))
+        self.stats.add("ch_queries", len(targets))
+        return legs
+
+    def find_distances(self, source: Node, targets: list[Node]) -> list[float]:
+        hierarchy = self.get_hierarchy()
+        with self.stats.phase("ch_query", source=source.id):
+            forward = hierarchy.search_forward(source.id)
+            distances = [hierarchy.query_distance(forward, target.id)
+                         for target in targets]
+        self.stats.add("ch_queries", len(targets))
+        return distances
+
+    def run_algorithm(
+        self,
+        start_node: Node,
+        end_node: Node,
+    ) -> tuple[float, dict[int, Node]]:
+        # same result as AStar.run_algorithm, for use with correct_path
+        distance, leg = self.find_legs(start_node, [end_node])[0]
+        return distance, path_dict_from_leg(self.graph, leg)
+
+    # Modifiers
+    def invalidate(self) -> None:
+        self.hierarchy = None
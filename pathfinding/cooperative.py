@@ -0,0 +1,409 @@
+import heapq
+
+import numpy as np
+
+from grid.grid import Grid
+from grid.node import Node
+from pathfinding.flow_field import FlowFieldPlanner
+from pathfinding.grid_arrays import occupancy_array
+from pathfinding.path_finding_algorithm import SolverCancelledError
+from pathfinding.stats import RunStats
+from pathfinding.terrain_cost import DIRECTIONS
+from pathfinding.utils import ids_array
+
+DEFAULT_WINDOW: int = 16
+DEFAULT_REPLAN_INTERVAL: int = 8
+DEFAULT_MAX_STEPS: int = 10_000
+# times a window is planned again with the blocked agents moved to the
+# front of the priority order
+MAX_PRIORITY_RETRIES: int = 4
+# moves of the space-time search, the last one waits in place
+WAIT: int = len(DIRECTIONS)
+OPPOSITE: tuple[int, ...] = (1, 0, 3, 2)
+
+
+class ReservationTable:
+    # Cells and moves claimed by the agents planned so far, hashed by time.
+    # A cell is reserved at a timestep, a move from a cell in a direction
+    # at the timestep it starts, so that two agents swapping cells (which
+    # never share a cell at any timestep) are detected as well.
+    def __init__(self, n_rows: int, n_cols: int) -> None:
+        self.n_cols = n_cols
+        self.n_cells = n_rows * n_cols
+        self.cells: dict[int, int] = {}
+        self.moves: set[int] = set()
+
+    # Accessors
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def is_free(self, timestep: int, node_id: int, agent: int) -> bool:
+        # free for the agent, i.e. not reserved by another one
+        occupant = self.cells.get(timestep * self.n_cells + node_id, agent)
+        return occupant == agent
+
+    def is_swap(self, timestep: int, node_id: int, direction: int) -> bool:
+        # whether the move of node_id in direction at timestep meets an
+        # agent moving the opposite way
+        row_offset, col_offset = DIRECTIONS[direction]
+        other_id = node_id + row_offset * self.n_cols + col_offset
+        return ((timestep * self.n_cells + other_id) * len(DIRECTIONS)
+                + OPPOSITE[direction]) in self.moves
+
+    # Modifiers
+    def reserve_cell(self, timestep: int, node_id: int, agent: int) -> None:
+        self.cells[timestep * self.n_cells + node_id] = agent
+
+    def reserve_move(
+        self,
+        timestep: int,
+        node_id: int,
+        direction: int,
+    ) -> None:
+        self.moves.add((timestep * self.n_cells + node_id) * len(DIRECTIONS)
+                       + direction)
+
+    def clear(self) -> None:
+        self.cells = {}
+        self.moves = set()
+
+
+class MultiAgentPlan:
+    # One path per agent, as the node id of the agent at every timestep.
+    # All paths have the same length, agents that arrived early wait at
+    # their goal.
+    def __init__(
+        self,
+        paths: list[np.ndarray],
+        arrival_times: list[int | None],
+    ) -> None:
+        self.paths = paths
+        self.arrival_times = arrival_times
+
+    # Accessors
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def get_path(self, agent: int) -> np.ndarray:
+        return self.paths[agent]
+
+    def get_arrival_time(self, agent: int) -> int | None:
+        # None for agents that did not reach their goal
+        return self.arrival_times[agent]
+
+    def is_complete(self) -> bool:
+        return all(time is not None for time in self.arrival_times)
+
+    def get_makespan(self) -> int:
+        return max((time for time in self.arrival_times if time is not None),
+                   default=0)
+
+    def get_sum_of_costs(self) -> int:
+        return sum(time for time in self.arrival_times if time is not None)
+
+    def get_conflicts(self) -> list[tuple[int, int, int]]:
+        # (timestep, agent, other agent) of every vertex or swap conflict
+        if not self.paths:
+            return []
+        positions = np.stack(self.paths)
+        conflicts = []
+        for timestep in range(positions.shape[1]):
+            column = positions[:, timestep]
+            order = np.argsort(column, kind="stable")
+            same = np.flatnonzero(column[order][1:] == column[order][:-1])
+            conflicts += [(timestep, int(order[i]), int(order[i + 1]))
+                          for i in same]
+            if timestep:
+                previous = positions[:, timestep - 1]
+                moved = {(int(before), int(after)): agent for agent, (
+                    before, after) in enumerate(zip(previous, column))
+                    if before != after}
+                for (before, after), agent in moved.items():
+                    other = moved.get((after, before))
+                    if other is not None and agent < other:
+                        conflicts.append((timestep, agent, other))
+        return conflicts
+
+
+class CooperativePlanner:
+    # Windowed cooperative A* (WHCA*). Agents are planned one after the
+    # other in priority order by a space-time A* over (cell, timestep) that
+    # avoids the cells and moves reserved by the agents before them, with
+    # waiting as an extra move. Each search only looks `window` timesteps
+    # ahead, beyond that the heuristic stands in for the rest of the path.
+    # The agents follow their plans for `replan_interval` timesteps, then
+    # the table is cleared and all agents plan their next window. Agents
+    # that are at their goal are planned last, and an agent that finds no
+    # way through the reservations of the others is moved to the front of
+    # the priority order and the window is planned again. Like any
+    # prioritized planner it is not complete: agents that meet head-on in a
+    # corridor longer than the window may never get past each other, which
+    # MultiAgentPlan.is_complete reports.
+    #
+    # The heuristic is the Manhattan distance, or with flow_fields the true
+    # distance to the goal ignoring the other agents, which keeps agents
+    # from getting stuck behind walls on maze-like maps at the cost of one
+    # flow field per distinct goal.
+    def __init__(
+        self,
+        grid: Grid,
+        window: int = DEFAULT_WINDOW,
+        replan_interval: int = DEFAULT_REPLAN_INTERVAL,
+        flow_fields: FlowFieldPlanner | None = None,
+    ) -> None:
+        if not 0 < replan_interval <= window:
+            raise ValueError("replan_interval must be between 1 and window")
+        self.grid = grid
+        self.window = window
+        self.replan_interval = replan_interval
+        self.flow_fields = flow_fields
+        self.stats = RunStats()
+        self.cancel_event = None
+        self.rows = grid.get_rows()
+        self.cols = grid.get_cols()
+        self.passable = ~occupancy_array(grid.get_grid()).ravel()
+        self.offsets = [row_offset * self.cols + col_offset
+                        for row_offset, col_offset in DIRECTIONS] + [0]
+        self.reservations = ReservationTable(self.rows, self.cols)
+        # moves possible from a cell, as (direction, offset) pairs
+        self.moves: dict[int, tuple[tuple[int, int], ...]] = {}
+
+    # Accessors
+    def get_stats(self) -> RunStats:
+        return self.stats
+
+    def get_moves(self, node_id: int) -> tuple[tuple[int, int], ...]:
+        moves = self.moves.get(node_id)
+        if moves is None:
+            moves = tuple((direction, offset)
+                          for direction, offset in enumerate(self.offsets)
+                          if self.can_move(node_id, direction))
+            self.moves[node_id] = moves
+        return moves
+
+    def can_move(self, node_id: int, direction: int) -> bool:
+        if direction == WAIT:
+            return True
+        row, col = divmod(node_id, self.cols)
+        row_offset, col_offset = DIRECTIONS[direction]
+        row += row_offset
+        col += col_offset
+        return (0 <= row < self.rows and 0 <= col < self.cols
+                and bool(self.passable[row * self.cols + col]))
+
+    # Modifiers
+    def set_stats(self, stats: RunStats) -> None:
+        self.stats = stats
+
+    def set_cancel_event(self, cancel_event) -> None:  # type: ignore
+        self.cancel_event = cancel_event
+
+    def plan(
+        self,
+        starts: list[Node],
+        goals: list[Node],
+        max_steps: int = DEFAULT_MAX_STEPS,
+    ) -> MultiAgentPlan:
+        # agents are given in priority order, the first is planned first
+        if len(starts) != len(goals):
+            raise ValueError("Every agent needs a start and a goal")
+        heuristics = [self.heuristic_function(goal) for goal in goals]
+        positions = [start.id for start in starts]
+        goal_ids = [goal.id for goal in goals]
+        histories = [[position] for position in positions]
+        arrival_times: list[int | None] = [
+            0 if position == goal_id else None
+            for position, goal_id in zip(positions, goal_ids)]
+
+        priorities = list(range(len(starts)))
+        timestep = 0
+        with self.stats.phase("cooperative_plan", agents=len(starts)):
+            while timestep < max_steps and any(
+                    position != goal_id
+                    for position, goal_id in zip(positions, goal_ids)):
+                if (self.cancel_event is not None
+                        and self.cancel_event.is_set()):
+                    raise SolverCancelledError(
+                        "CooperativePlanner run was cancelled")
+                # agents at their goal come last and step aside if needed
+                priorities.sort(
+                    key=lambda agent: positions[agent] == goal_ids[agent])
+                for _ in range(MAX_PRIORITY_RETRIES + 1):
+                    plans, blocked, safe_steps = self.plan_window(
+                        timestep, priorities, positions, goal_ids, heuristics)
+                    if not blocked:
+                        break
+                    self.stats.add("cooperative_retries")
+                    priorities = blocked + [agent for agent in priorities
+                                            if agent not in blocked]
+                # a blocked agent may have found no place to wait out the
+                # window, the plans are only followed up to its collision.
+                # At least one step is safe, every agent has its own cell
+                # reserved for the first step.
+                if safe_steps < self.replan_interval:
+                    self.stats.add("cooperative_short_windows")
+                steps = min(self.replan_interval, max_steps - timestep,
+                            safe_steps)
+                for agent, plan in enumerate(plans):
+                    histories[agent] += plan[1:steps + 1]
+                    positions[agent] = plan[steps]
+                timestep += steps
+                self.stats.add("cooperative_windows")
+
+        for agent, history in enumerate(histories):
+            # the last timestep the agent arrived at its goal to stay
+            arrival = len(history) - 1
+            while arrival > 0 and history[arrival - 1] == goal_ids[agent]:
+                arrival -= 1
+            if history[-1] == goal_ids[agent]:
+                arrival_times[agent] = arrival
+        return MultiAgentPlan([ids_array(history) for history in histories],
+                              arrival_times)
+
+    def heuristic_function(self, goal: Node):  # type: ignore[no-untyped-def]
+        if self.flow_fields is not None:
+            distances = self.flow_fields.get_field(self.grid, goal
+                                                   ).get_distances().tolist()
+            return distances.__getitem__
+        goal_row, goal_col = goal.get_position()
+        cols = self.cols
+
+        def manhattan(node_id: int) -> int:
+            row, col = divmod(node_id, cols)
+            return abs(row - goal_row) + abs(col - goal_col)
+        return manhattan
+
+    def plan_window(
+        self,
+        timestep: int,
+        priorities: list[int],
+        positions: list[int],
+        goal_ids: list[int],
+        heuristics: list,  # type: ignore[type-arg]
+    ) -> tuple[list[list[int]], list[int], int]:
+        # the positions of every agent for the next window timesteps, the
+        # agents that got stuck in priority order, and how many steps of
+        # the plans can be followed before two agents collide
+        table = self.reservations
+        table.clear()
+        for agent, position in enumerate(positions):
+            # an agent that is not planned yet may have to wait, so nobody
+            # walks into its cell in the first step
+            table.reserve_cell(timestep + 1, position, agent)
+        plans: list[list[int]] = [[] for _ in positions]
+        blocked = []
+        safe_steps = self.window
+        for agent in priorities:
+            plan, complete = self.search(agent, timestep, positions[agent],
+                                         goal_ids[agent], heuristics[agent])
+            if not complete:
+                blocked.append(agent)
+            for step, (node_id, next_id) in enumerate(zip(plan, plan[1:])):
+                direction = (self.offsets.index(next_id - node_id)
+                             if next_id != node_id else WAIT)
+                if not complete and step < safe_steps and (
+                        not table.is_free(timestep + step + 1, next_id, agent)
+                        or direction != WAIT and table.is_swap(
+                            timestep + step, node_id, direction)):
+                    # the search checks complete plans, but not the waits
+                    # after the state a blocked agent fell back to
+                    safe_steps = step
+                table.reserve_cell(timestep + step + 1, next_id, agent)
+                if direction != WAIT:
+                    table.reserve_move(timestep + step, node_id, direction)
+            plans[agent] = plan
+        return plans, blocked, safe_steps
+
+    def search(
+        self,
+        agent: int,
+        timestep: int,
+        start_id: int,
+        goal_id: int,
+        heuristic,  # type: ignore[no-untyped-def]
+    ) -> tuple[list[int], bool]:
+        # space-time A* over the window. A state at the end of the window
+        # is complete, its cost is the cost so far plus the heuristic.
+        # Waiting at the goal is free, so an agent that can stay at its goal
+        # for the rest of the window is done as well. Without a complete
+        # state the agent follows the deepest state found where it can wait
+        # until the window ends, or if there is none the deepest state.
+        cells = self.reservations.cells
+        reserved_moves = self.reservations.moves
+        n_directions = len(DIRECTIONS)
+        end_time = timestep + self.window
+        n_cells = self.rows * self.cols
+        start_state = timestep * n_cells + start_id
+        parents = {start_state: -1}
+        g_values = {start_state: 0}
+        h_values = {start_id: heuristic(start_id)}
+        # ties go to the deeper state, -g sorts them first
+        heap = [(h_values[start_id], 0, start_state)]
+        closed: set[int] = set()
+
+        def can_stay(time: int, node_id: int) -> bool:
+            return all(cells.get(later * n_cells + node_id, agent) == agent
+                       for later in range(time + 1, end_time + 1))
+
+        best_state = start_state
+        best_key = (timestep, -h_values[start_id])
+        # states the agent can stay at until the end of the window win
+        best_stays = can_stay(timestep, start_id)
+        complete = False
+        expanded = 0
+        while heap:
+            f_value, g_value, state = heapq.heappop(heap)
+            g_value = -g_value
+            if state in closed:
+                continue
+            closed.add(state)
+            expanded += 1
+            time, node_id = divmod(state, n_cells)
+            if time == end_time or node_id == goal_id and can_stay(
+                    time, goal_id):
+                best_state = state
+                complete = True
+                break
+            if ((time, -f_value) > best_key or not best_stays) and (
+                    can_stay(time, node_id)):
+                best_state = state
+                best_key = (time, -f_value)
+                best_stays = True
+            elif not best_stays and (time, -f_value) > best_key:
+                best_state = state
+                best_key = (time, -f_value)
+            next_time = state + n_cells - node_id
+            for direction, offset in self.get_moves(node_id):
+                next_id = node_id + offset
+                if cells.get(next_time + next_id, agent) != agent:
+                    continue
+                if direction != WAIT and (
+                        (state + offset) * n_directions
+                        + OPPOSITE[direction]) in reserved_moves:
+                    # the agent in next_id moves here at the same time
+                    continue
+                next_state = next_time + next_id
+                next_g = g_value + (0 if direction == WAIT
+                                    and node_id == goal_id else 1)
+                if next_g < g_values.get(next_state, next_g + 1):
+                    g_values[next_state] = next_g
+                    parents[next_state] = state
+                    h_value = h_values.get(next_id)
+                    if h_value is None:
+                        h_value = h_values[next_id] = heuristic(next_id)
+                    heapq.heappush(heap, (next_g + h_value, -next_g,
+                                          next_state))
+        self.stats.add("cooperative_searches")
+        self.stats.add("nodes_expanded", expanded)
+        if not complete:
+            self.stats.add("cooperative_blocked")
+
+        plan = []
+        state = best_state
+        while state >= 0:
+            plan.append(state % n_cells)
+            state = parents[state]
+        plan.reverse()
+        # agents that are done wait at the goal until the window ends
+        plan += [plan[-1]] * (self.window + 1 - len(plan))
+        return plan, complete
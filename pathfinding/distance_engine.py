@@ -0,0 +1,84 @@
+import abc
+
+import numpy as np
+
+from grid.node import Node
+from grid.tiled_grid import TiledCells
+from pathfinding.stats import RunStats
+from pathfinding.terrain_cost import TerrainCostModel
+from visualization.visualization import TaskSetting
+
+# distance and node ids of a leg, like AStar.find_leg
+Leg = tuple[float, np.ndarray]
+
+
+class DistanceEngine(abc.ABC):
+    # Alternative to one A* search per leg for the distance matrix. An
+    # engine answers one source to many targets queries on a whole graph
+    # and only applies to some settings, AStar falls back to its own search
+    # for the others. The legs have the same length as those of A*, but
+    # may take a different route among equally short ones.
+    def __init__(self) -> None:
+        self.graph: list[list[Node]] | TiledCells | None = None
+        self.graph_hash: int | None = None
+        # the costs of the task, None for unit cost moves
+        self.cost_model: TerrainCostModel | None = None
+        self.stats = RunStats()
+
+    # Accessors
+    def get_stats(self) -> RunStats:
+        return self.stats
+
+    def get_name(self) -> str:
+        return self.__class__.__name__
+
+    @abc.abstractmethod
+    def applies(
+        self,
+        task_setting: TaskSetting,
+        cost_model: TerrainCostModel | None,
+    ) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def find_legs(self, source: Node, targets: list[Node]) -> list[Leg]:
+        ...
+
+    def find_distances(self, source: Node, targets: list[Node]) -> list[float]:
+        # same distances as find_legs, engines that can skip the
+        # reconstruction of the cell paths override this
+        return [distance for distance, _ in self.find_legs(source, targets)]
+
+    def get_cost_signature(self) -> tuple[float | str | None, ...] | None:
+        if self.cost_model is None:
+            return None
+        return self.cost_model.get_signature()
+
+    # Modifiers
+    def set_stats(self, stats: RunStats) -> None:
+        self.stats = stats
+
+    def set_cost_model(self, cost_model: TerrainCostModel | None) -> None:
+        old_signature = self.get_cost_signature()
+        self.cost_model = cost_model
+        if self.get_cost_signature() != old_signature:
+            self.invalidate()
+
+    def set_graph(
+        self,
+        graph: list[list[Node]] | TiledCells,
+        graph_hash: int | None = None,
+    ) -> None:
+        # without a content hash the graph may have changed in place, so
+        # the engine has to assume it did
+        if (graph is self.graph and graph_hash is not None
+                and graph_hash == self.graph_hash):
+            return
+        self.graph = graph
+        self.graph_hash = graph_hash
+        self.invalidate()
+
+    @abc.abstractmethod
+    def invalidate(self) -> None:
+        # drop everything that was derived from the graph
+        ...
@@ -0,0 +1,175 @@
+from grid.node import Node
+from pathfinding.astar import AStar
+from pathfinding.distance_engine import Leg
+from pathfinding.path_store import EMPTY_LEG, PathStore
+from pathfinding.utils import ids_array
+
+
+class WaypointDistanceMatrix:
+    # Distance matrix between the start, end and waypoint nodes that is kept
+    # between runs. Adding a node only computes its row and column, removing
+    # it drops them, and moving it recomputes only its own row and column.
+    # Everything is recomputed when the graph itself changed. Without
+    # paths only the distances are asked for and the path store stays empty.
+    def __init__(self, astar: AStar, with_paths: bool = True) -> None:
+        self.astar = astar
+        self.with_paths = with_paths
+        self.start_node: Node | None = None
+        self.end_node: Node | None = None
+        self.waypoints: list[Node] = []
+        self.nodes: dict[int, Node] = {}
+        self.distances: dict[int, dict[int, float]] = {}
+        self.paths = PathStore()
+        self.graph_hash: int | None = None
+        self.legs_computed = 0
+
+    # Accessors
+    def get_start_node(self) -> Node | None:
+        return self.start_node
+
+    def get_end_node(self) -> Node | None:
+        return self.end_node
+
+    def get_waypoints(self) -> list[Node]:
+        return self.waypoints
+
+    def get_ordered_nodes(self) -> list[Node]:
+        if self.start_node is None or self.end_node is None:
+            return []
+        return [self.start_node] + self.waypoints + [self.end_node]
+
+    def get_nodes(self) -> dict[int, Node]:
+        return self.nodes
+
+    def get_matrix(self) -> list[list[float]]:
+        # first row and column is for the start node, the last for the end
+        # node and the rest for the waypoints
+        nodes = self.get_ordered_nodes()
+        return [[self.distances[node1.id][node2.id] for node2 in nodes]
+                for node1 in nodes]
+
+    def get_distance_dict(self) -> dict[int, dict[int, float]]:
+        return self.distances
+
+    def get_paths(self) -> PathStore:
+        return self.paths
+
+    def get_legs_computed(self) -> int:
+        return self.legs_computed
+
+    def has_paths(self) -> bool:
+        return self.with_paths
+
+    def find_legs(self, source: Node, targets: list[Node]) -> list[Leg]:
+        if self.with_paths:
+            return self.astar.find_legs(source, targets)
+        return [(distance, EMPTY_LEG)
+                for distance in self.astar.find_distances(source, targets)]
+
+    # Modifiers
+    def reset(self) -> None:
+        self.start_node = None
+        self.end_node = None
+        self.waypoints = []
+        self.nodes = {}
+        self.distances = {}
+        self.paths.clear()
+        self.graph_hash = None
+
+    def sync(
+        self,
+        start_node: Node,
+        end_node: Node,
+        waypoints: list[Node],
+        graph_hash: int | None,
+    ) -> None:
+        # bring the matrix up to date with the given nodes, the graph of the
+        # A* instance has to be set up already
+        if graph_hash is None or graph_hash != self.graph_hash:
+            self.nodes = {}
+            self.distances = {}
+            self.paths.clear()
+        self.graph_hash = graph_hash
+        self.paths.set_graph(self.astar.graph)
+
+        new_nodes = [start_node] + waypoints + [end_node]
+        new_ids = {node.id for node in new_nodes}
+        for node_id in [node_id for node_id in self.nodes
+                        if node_id not in new_ids]:
+            self.drop_node(node_id)
+
+        added = [node for node in new_nodes if node.id not in self.nodes]
+        self.start_node = start_node
+        self.end_node = end_node
+        self.waypoints = list(waypoints)
+        self.compute_nodes(added)
+
+    def add_waypoint(self, node: Node) -> None:
+        self.waypoints.append(node)
+        self.compute_nodes([node])
+
+    def remove_waypoint(self, node: Node) -> None:
+        self.waypoints.remove(node)
+        self.drop_node(node.id)
+
+    def move_node(self, old_node: Node, new_node: Node) -> None:
+        if self.start_node == old_node:
+            self.start_node = new_node
+        elif self.end_node == old_node:
+            self.end_node = new_node
+        else:
+            self.waypoints[self.waypoints.index(old_node)] = new_node
+        self.drop_node(old_node.id)
+        self.compute_nodes([new_node])
+
+    def drop_node(self, node_id: int) -> None:
+        del self.nodes[node_id]
+        del self.distances[node_id]
+        self.paths.remove_node(node_id)
+        for other_id in self.nodes:
+            del self.distances[other_id][node_id]
+
+    def compute_nodes(self, new_nodes: list[Node]) -> None:
+        # only the rows and columns of the new nodes are computed, with one
+        # batch per node: from every existing node to all new nodes, then
+        # from every new node to all other nodes
+        existing = list(self.nodes.values())
+        total_legs = (2 * len(new_nodes) * len(existing)
+                      + len(new_nodes) * (len(new_nodes) - 1))
+        legs_done = 0
+        # legs by source and target id until both ends are in the matrix
+        found: dict[int, dict[int, Leg]] = {}
+        for other in existing:
+            legs = self.find_legs(other, new_nodes)
+            found[other.id] = {node.id: leg
+                               for node, leg in zip(new_nodes, legs)}
+            legs_done += len(legs)
+            self.astar.report_progress(legs_done=legs_done,
+                                       total_legs=total_legs)
+        for position, node in enumerate(new_nodes):
+            others = (existing + new_nodes[:position]
+                      + new_nodes[position + 1:])
+            legs = self.find_legs(node, others)
+            found[node.id] = {other.id: leg
+                              for other, leg in zip(others, legs)}
+            legs_done += len(legs)
+            self.astar.report_progress(legs_done=legs_done,
+                                       total_legs=total_legs)
+
+            # The legs between the node and all nodes in the matrix are
+            # known now, in both directions. The node is only added at this
+            # point, so a cancelled sync leaves no half filled row or column
+            # behind.
+            self.distances[node.id] = {node.id: 0}
+            if self.with_paths:
+                self.paths.set_leg(node.id, node.id, ids_array([node.id]))
+            for other_id in self.nodes:
+                outgoing = found[node.id][other_id]
+                incoming = found[other_id][node.id]
+                self.distances[node.id][other_id] = outgoing[0]
+                self.distances[other_id][node.id] = incoming[0]
+                if self.with_paths:
+                    self.paths.set_leg(node.id, other_id, outgoing[1])
+                    self.paths.set_leg(other_id, node.id, incoming[1])
+            self.legs_computed += 2 * len(self.nodes)
+            self.nodes[node.id] = node
@@ -0,0 +1,283 @@
+import numpy as np
+
+from grid.grid import Grid
+from grid.node import Node
+from pathfinding.bitset_bfs import PackedGrid
+from pathfinding.cache import LRUCache
+from pathfinding.grid_arrays import occupancy_array, terrain_array
+from pathfinding.stats import RunStats
+from pathfinding.terrain_cost import DIRECTIONS, INFINITY, TerrainCostModel
+from pathfinding.utils import ids_array, ids_to_nodes
+
+# next move of cells that have none (the goal, obstacles, unreachable cells)
+NO_MOVE: int = -1
+DEFAULT_MAX_FIELDS: int = 8
+
+
+def direction_offsets(cols: int) -> np.ndarray:
+    # node id offset of every move in DIRECTIONS
+    return np.array([row_offset * cols + col_offset
+                     for row_offset, col_offset in DIRECTIONS],
+                    dtype=np.int64)
+
+
+def moves_inside(
+    node_ids: np.ndarray,
+    row_offset: int,
+    col_offset: int,
+    rows: int,
+    cols: int,
+) -> np.ndarray:
+    # mask of the cells that stay inside the grid when moved by the offset
+    node_rows, node_cols = np.divmod(node_ids, cols)
+    node_rows += row_offset
+    node_cols += col_offset
+    return ((node_rows >= 0) & (node_rows < rows)
+            & (node_cols >= 0) & (node_cols < cols))
+
+
+def move_sources(
+    targets: np.ndarray,
+    direction: int,
+    rows: int,
+    cols: int,
+) -> np.ndarray:
+    # mask of the targets that a cell inside the grid reaches by a move in
+    # this direction
+    row_offset, col_offset = DIRECTIONS[direction]
+    return moves_inside(targets, -row_offset, -col_offset, rows, cols)
+
+
+def weighted_wavefront(
+    passable: np.ndarray,
+    goal_id: int,
+    edge_costs: np.ndarray,
+) -> np.ndarray:
+    # label correcting search from the goal over the reversed moves: every
+    # step relaxes the moves into all cells whose distance improved in the
+    # previous step, until no distance improves any more
+    rows, cols = passable.shape
+    free = passable.ravel()
+    offsets = direction_offsets(cols)
+    n_directions = len(DIRECTIONS)
+    distances = np.full(rows * cols, INFINITY)
+    distances[goal_id] = 0.0
+    frontier = np.array([goal_id], dtype=np.int64)
+    while frontier.size:
+        sources = []
+        candidates = []
+        for direction in range(n_directions):
+            targets = frontier[move_sources(frontier, direction, rows, cols)]
+            source_ids = targets - offsets[direction]
+            sources.append(source_ids)
+            candidates.append(distances[targets]
+                              + edge_costs[source_ids * n_directions
+                                           + direction])
+        source_ids = np.concatenate(sources)
+        candidate = np.concatenate(candidates)
+        improved = free[source_ids] & (candidate < distances[source_ids])
+        source_ids = source_ids[improved]
+        candidate = candidate[improved]
+        # several targets may improve the same cell, keep the smallest
+        order = np.lexsort((candidate, source_ids))
+        source_ids = source_ids[order]
+        first = np.ones(source_ids.size, dtype=bool)
+        first[1:] = source_ids[1:] != source_ids[:-1]
+        frontier = source_ids[first]
+        distances[frontier] = candidate[order][first]
+    return distances
+
+
+def next_moves(
+    passable: np.ndarray,
+    goal_id: int,
+    distances: np.ndarray,
+    edge_costs: np.ndarray | None,
+) -> np.ndarray:
+    # the move of every cell that lies on a shortest path to the goal, ties
+    # go to the first direction like the neighbor order of the searches
+    rows, cols = passable.shape
+    n_cells = rows * cols
+    offsets = direction_offsets(cols)
+    cells = np.arange(n_cells, dtype=np.int64)
+    totals = np.full((len(DIRECTIONS), n_cells), INFINITY)
+    for direction in range(len(DIRECTIONS)):
+        # cells whose move in this direction stays inside the grid
+        sources = cells[moves_inside(cells, *DIRECTIONS[direction], rows,
+                                     cols)]
+        if edge_costs is None:
+            costs = 1.0
+        else:
+            costs = edge_costs[sources * len(DIRECTIONS) + direction]
+        totals[direction, sources] = (distances[sources + offsets[direction]]
+                                      + costs)
+    moves = np.argmin(totals, axis=0).astype(np.int8)
+    moves[~np.isfinite(distances) | ~passable.ravel()] = NO_MOVE
+    moves[goal_id] = NO_MOVE
+    return moves
+
+
+class FlowField:
+    # Distances to one goal and the next move towards it for every cell of
+    # the grid, computed in a single wavefront. Any number of agents share
+    # the field, each one follows the moves from its own cell, so that
+    # extracting a path is linear in its length.
+    def __init__(
+        self,
+        goal_id: int,
+        rows: int,
+        cols: int,
+        distances: np.ndarray,
+        moves: np.ndarray,
+    ) -> None:
+        self.goal_id = goal_id
+        self.rows = rows
+        self.cols = cols
+        self.distances = distances
+        self.moves = moves
+        self.offsets = direction_offsets(cols).tolist()
+
+    # Accessors
+    def get_goal_id(self) -> int:
+        return self.goal_id
+
+    def get_distances(self) -> np.ndarray:
+        # flat, indexed by node id, infinite where the goal is not reachable
+        return self.distances
+
+    def get_moves(self) -> np.ndarray:
+        # flat index into DIRECTIONS per node id, NO_MOVE where there is none
+        return self.moves
+
+    def get_distance(self, node_id: int) -> float:
+        return float(self.distances[node_id])
+
+    def is_reachable(self, node_id: int) -> bool:
+        return bool(np.isfinite(self.distances[node_id]))
+
+    def get_nbytes(self) -> int:
+        return self.distances.nbytes + self.moves.nbytes
+
+    def path_ids(self, start_id: int) -> np.ndarray:
+        # node ids from start to goal (both included), empty if the goal
+        # cannot be reached from the start
+        if not self.is_reachable(start_id):
+            return ids_array([])
+        moves = self.moves
+        offsets = self.offsets
+        path = [start_id]
+        node_id = start_id
+        while node_id != self.goal_id:
+            node_id += offsets[moves[node_id]]
+            path.append(node_id)
+        return ids_array(path)
+
+    def path(self, graph: list[list[Node]], start: Node) -> list[Node]:
+        return ids_to_nodes(graph, self.path_ids(start.id))
+
+
+def compute_flow_field(
+    passable: np.ndarray,
+    goal_id: int,
+    edge_costs: np.ndarray | None = None,
+    packed: PackedGrid | None = None,
+) -> FlowField:
+    # unit moves without edge costs, searched with a bit parallel BFS on
+    # the packed grid, otherwise the costs are a flat array as returned by
+    # TerrainCostModel.edge_costs
+    rows, cols = passable.shape
+    if not passable.ravel()[goal_id]:
+        raise ValueError(f"Goal {goal_id} is an obstacle")
+    if edge_costs is None:
+        if packed is None:
+            packed = PackedGrid(passable)
+        levels, _ = packed.search(goal_id)
+        distances = levels.astype(np.float64)
+        distances[levels < 0] = INFINITY
+    else:
+        distances = weighted_wavefront(passable, goal_id, edge_costs)
+    moves = next_moves(passable, goal_id, distances, edge_costs)
+    return FlowField(goal_id, rows, cols, distances, moves)
+
+
+class FlowFieldPlanner:
+    # Flow fields of a grid, cached per goal and cost model. The cache is
+    # keyed by the content hash of the grid, so fields survive edits that
+    # do not change obstacles or terrain (moving the start or the
+    # waypoints) and are recomputed after those that do.
+    def __init__(
+        self,
+        max_fields: int = DEFAULT_MAX_FIELDS,
+        cost_model: TerrainCostModel | None = None,
+    ) -> None:
+        self.fields = LRUCache(max_fields)
+        self.cost_model = cost_model
+        self.stats = RunStats()
+        # arrays of the last grid seen, as (key, passable, edge costs or
+        # the packed grid for unit moves)
+        self.arrays: tuple[tuple, np.ndarray, np.ndarray | None,
+                           PackedGrid | None] | None = None
+
+    # Accessors
+    def get_cost_model(self) -> TerrainCostModel | None:
+        return self.cost_model
+
+    def get_stats(self) -> RunStats:
+        return self.stats
+
+    def grid_key(self, grid: Grid) -> tuple:
+        signature = (self.cost_model.get_signature()
+                     if self.cost_model is not None else None)
+        return (grid.get_content_hash(), grid.get_rows(), grid.get_cols(),
+                signature)
+
+    def get_arrays(
+        self,
+        grid: Grid,
+    ) -> tuple[np.ndarray, np.ndarray | None, PackedGrid | None]:
+        key = self.grid_key(grid)
+        if self.arrays is None or self.arrays[0] != key:
+            graph = grid.get_grid()
+            passable = ~occupancy_array(graph)
+            edge_costs = None
+            packed = None
+            if self.cost_model is not None:
+                edge_costs = self.cost_model.edge_costs(terrain_array(graph))
+            else:
+                packed = PackedGrid(passable)
+            self.arrays = (key, passable, edge_costs, packed)
+        return self.arrays[1], self.arrays[2], self.arrays[3]
+
+    def get_field(self, grid: Grid, goal: Node) -> FlowField:
+        key = self.grid_key(grid) + (goal.id,)
+        field = self.fields.get(key)
+        if field is None:
+            with self.stats.phase("flow_field", goal=goal.id):
+                passable, edge_costs, packed = self.get_arrays(grid)
+                field = compute_flow_field(passable, goal.id, edge_costs,
+                                           packed)
+            self.stats.add("flow_fields")
+            self.fields.put(key, field)
+        return field
+
+    def find_paths(
+        self,
+        grid: Grid,
+        starts: list[Node],
+        goal: Node,
+    ) -> list[list[Node]]:
+        # one path per start, empty for starts that cannot reach the goal
+        field = self.get_field(grid, goal)
+        graph = grid.get_grid()
+        return [field.path(graph, start) for start in starts]
+
+    # Modifiers
+    def set_cost_model(self, cost_model: TerrainCostModel | None) -> None:
+        self.cost_model = cost_model
+
+    def set_stats(self, stats: RunStats) -> None:
+        self.stats = stats
+
+    def clear(self) -> None:
+        self.fields.clear()
+        self.arrays = None
@@ -0,0 +1,19 @@
+import numpy as np
+
+from grid.node import Node, NodeType
+from grid.tiled_grid import TiledCells
+
+
+def terrain_array(graph: list[list[Node]] | TiledCells) -> np.ndarray:
+    if isinstance(graph, TiledCells):
+        return graph.grid.get_terrain_array().astype(np.float64)
+    return np.array([[node.get_terrain_level() for node in row]
+                     for row in graph], dtype=np.float64)
+
+
+def occupancy_array(graph: list[list[Node]] | TiledCells) -> np.ndarray:
+    # True for obstacles, like GridMap occupancy
+    if isinstance(graph, TiledCells):
+        return graph.grid.get_occupancy_array()
+    return np.array([[node.get_type() == NodeType.OBSTACLE for node in row]
+                     for row in graph], dtype=bool)
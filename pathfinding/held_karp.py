@@ -1,11 +1,27 @@
 from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
 from typing import Any
 
 import itertools
+import multiprocessing
+import os
+
+import numpy as np
 
 from grid.node import Node
-from pathfinding.utils import correct_path
-from pathfinding.path_finding_algorithm import PathFindingAlgorithm
+from pathfinding.distance_matrix import WaypointDistanceMatrix
+from pathfinding.path_store import PathStore
+from pathfinding.path_finding_algorithm import (
+    PathFindingAlgorithm, PROGRESS_INTERVAL,
+)
+from pathfinding.subset_dp import (
+    BLOCK_SUBSETS, COST, SubsetLayers, backtrack, binomial_table, first_layer,
+    rank_subsets, solve_block, solve_layer, solve_layer_shared, solve_path,
+    unrank_subsets,
+)
+
+# layers with fewer subsets are not worth sending to the worker processes
+PARALLEL_MIN_SUBSETS: int = 4096
 
 
 class HeldKarp(PathFindingAlgorithm):
@@ -13,22 +29,36 @@ class HeldKarp(PathFindingAlgorithm):
     def __init__(self) -> None:
         super().__init__()
         self.distance_matrix: list[list[float]] = []
-        self.precomputed_paths: dict[int, dict[int, dict[int, Node]]] = {}
+        self.precomputed_paths = PathStore()
         self.waypoints: list[Node] = []
-        self.path_dict: dict[int, Node] = {}
+        self.tour: list[Node] = []
 
     def heuristic(self, node1: Node, node2: Node, **kwargs: Any) -> int:
         return 0
 
+    def get_tour(self) -> list[Node]:
+        # start, waypoints in visiting order and end of the last tour found
+        return self.tour
+
     def reset_values(self) -> None:
-        self.path_dict = {}
+        self.tour = []
 
-    def set_distance_matrix(self, distance_matrix: list[list[float]]) -> None:
-        self.distance_matrix = distance_matrix
+    def shutdown(self) -> None:
+        # engines with worker processes stop them here
+        pass
 
-    def set_precomputed_paths(
-        self, precomputed_paths: dict[int, dict[int, dict[int, Node]]]
+    def set_distance_matrix(
+        self,
+        distance_matrix: list[list[float]] | WaypointDistanceMatrix,
     ) -> None:
+        if isinstance(distance_matrix, WaypointDistanceMatrix):
+            # the matrix also knows the waypoint order and the leg paths
+            self.set_precomputed_paths(distance_matrix.get_paths())
+            self.set_waypoints(distance_matrix.get_waypoints())
+            distance_matrix = distance_matrix.get_matrix()
+        self.distance_matrix = distance_matrix
+
+    def set_precomputed_paths(self, precomputed_paths: PathStore) -> None:
         self.precomputed_paths = precomputed_paths
 
     def set_waypoints(self, waypoints: list[Node]) -> None:
@@ -40,6 +70,19 @@ class HeldKarp(PathFindingAlgorithm):
         start_node: Node,
         end_node: Node,
     ) -> bool:
+        if not self.find_tour(start_node, end_node):
+            return False
+
+        # now we have a path with the start, waypoints, and end nodes
+        # however, we need to reconstruct the path from the start to the end
+        # using the precomputed paths
+        self.path = self.precomputed_paths.stitch_nodes(
+            [node.id for node in self.tour])
+
+        return True
+
+    def find_tour(self, start_node: Node, end_node: Node) -> bool:
+        # only the order of the stops, the path is not stitched
         self.reset_values()
 
         # check if any distance between points is infinite
@@ -48,28 +91,17 @@ class HeldKarp(PathFindingAlgorithm):
                 if self.distance_matrix[i][j] == float("inf"):
                     return False
 
-        cost, optimal_traversal = self.run_algorithm()
+        with self.stats.phase("held_karp_dp"):
+            cost, optimal_traversal = self.run_algorithm()
 
         print("Optimal cost:", cost)
 
-        # optimal traversal is not in the correct format,
-        # it should be a dictionary with keys being the actual node IDs
-        # and the values being the parent nodes
-
-        self.path_dict[end_node.id] = self.waypoints[optimal_traversal[0] - 1]
-        for i in range(1, len(optimal_traversal)):
-            self.path_dict[self.waypoints[optimal_traversal[i - 1] -
-                                          1].id] = self.waypoints[
-                optimal_traversal[i] - 1]
-
-        self.path_dict[self.waypoints[optimal_traversal[-1] - 1].id] = start_node
-
-        # now we have a path with the start, waypoints, and end nodes
-        # however, we need to reconstruct the path from the start to the end
-        # using the precomputed paths
-        self.path = correct_path(start_node, end_node, self.path_dict,
-                                 self.precomputed_paths)
-
+        # optimal traversal lists the waypoint indices backwards from the
+        # end node, waypoint i is at index i - 1 in the waypoints list
+        self.tour = ([start_node]
+                     + [self.waypoints[i - 1]
+                        for i in reversed(optimal_traversal)]
+                     + [end_node])
         return True
 
     def run_algorithm(
@@ -86,24 +118,32 @@ class HeldKarp(PathFindingAlgorithm):
         # Iterate over all subsets of increasing length
         # Fill DP table in a bottom-up manner
         for s_size in range(2, n):
-            for S in itertools.combinations(range(1, n), s_size):
-                bits = 0
-                for bit in S:
-                    bits |= 1 << bit
-
-                # bits encoding the current subset
-
-                for e in S:
-                    S_i = bits & ~(1 << e)
-                    # Specify the type of res as List[Tuple[float, int]]
-                    res: list[tuple[float, int]] = []
-                    for m in S:
-                        if m == 0 or m == e:
-                            continue
-                        res.append(
-                            (DP[(S_i, m)][0] + self.distance_matrix[m][e], m))
-                    # default comparator is the first element of the tuple
-                    DP[(bits, e)] = min(res)
+            with self.stats.phase("dp_layer", subset_size=s_size):
+                self.check_cancelled()
+                self.report_progress(dp_layer=s_size, total_layers=n - 1)
+                for subset_idx, S in enumerate(
+                        itertools.combinations(range(1, n), s_size)):
+                    if subset_idx % PROGRESS_INTERVAL == 0:
+                        self.check_cancelled()
+                    bits = 0
+                    for bit in S:
+                        bits |= 1 << bit
+
+                    # bits encoding the current subset
+
+                    for e in S:
+                        S_i = bits & ~(1 << e)
+                        # Specify the type of res as List[Tuple[float, int]]
+                        res: list[tuple[float, int]] = []
+                        for m in S:
+                            if m == 0 or m == e:
+                                continue
+                            res.append((DP[(S_i, m)][0]
+                                        + self.distance_matrix[m][e], m))
+                        # default comparator is the first element of the tuple
+                        DP[(bits, e)] = min(res)
+
+        self.stats.add("dp_states", len(DP))
 
         # Calculate optimal cost
         bits = (1 << n) - 1
@@ -121,3 +161,249 @@ class HeldKarp(PathFindingAlgorithm):
             bits = new_bits
 
         return opt_cost, path
+
+
+class ParallelHeldKarp(HeldKarp):
+    # Same dynamic program as HeldKarp, over the subsets of the waypoints
+    # only, since the end node can only come last. A layer holds all
+    # subsets of one size and only depends on the layer before, so its
+    # subsets are split into ranges that the worker processes fill in
+    # parallel. The cost of the two active layers and the parents of all
+    # layers are numpy arrays in shared memory (see subset_dp), and the
+    # solver waits for all ranges of a layer before starting the next.
+    # Ties are broken like in HeldKarp, so the tour is the same.
+    def __init__(self, workers: int | None = None) -> None:
+        super().__init__()
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.executor: ProcessPoolExecutor | None = None
+
+    # Accessors
+    def get_workers(self) -> int:
+        return self.workers
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        # started on the first large layer and kept for later solves. Spawn
+        # instead of fork, the solver runs on a background thread.
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    # Modifiers
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def run_algorithm(
+        self,
+    ) -> tuple[float, list[int]]:
+        n = len(self.distance_matrix)
+        if n == 2:
+            return self.distance_matrix[0][1], []
+
+        # item i of the subsets is waypoint i + 1 of the matrix
+        matrix = np.array(self.distance_matrix, dtype=COST)
+        distances = np.ascontiguousarray(matrix[1:-1, 1:-1])
+        n_items = n - 2
+        binom = binomial_table(n_items)
+        layers = SubsetLayers(n_items)
+        try:
+            first_layer(matrix[0, 1:-1], layers.get_costs(1),
+                        layers.get_parents(1))
+            for size in range(2, n_items + 1):
+                with self.stats.phase("dp_layer", subset_size=size):
+                    self.check_cancelled()
+                    self.report_progress(dp_layer=size, total_layers=n_items)
+                    self.fill_layer(layers, distances, binom, size)
+
+            # argmin takes the first of equal costs, i.e. the smallest item
+            end_costs = layers.get_costs(n_items)[0] + matrix[1:-1, -1]
+            last = int(np.argmin(end_costs))
+            opt_cost = float(end_costs[last])
+            parents = [layers.get_parents(size)
+                       for size in range(n_items + 1)]
+            path = [item + 1 for item in backtrack(binom, parents, last)]
+            # views of the shared memory, which can only be closed without
+            del parents
+            self.stats.add("dp_states", int(layers.parent_offsets[-1]))
+            self.stats.add("dp_shared_bytes", layers.get_nbytes())
+        finally:
+            layers.close(unlink=True)
+        return opt_cost, path
+
+    def fill_layer(
+        self,
+        layers: SubsetLayers,
+        distances: np.ndarray,
+        binom: np.ndarray,
+        size: int,
+    ) -> None:
+        rows = layers.layer_rows[size]
+        n_ranges = min(self.workers, -(-rows // PARALLEL_MIN_SUBSETS))
+        if n_ranges <= 1:
+            solve_layer(distances, binom, size, 0, rows,
+                        layers.get_costs(size - 1), layers.get_costs(size),
+                        layers.get_parents(size))
+            return
+
+        bounds = np.linspace(0, rows, n_ranges + 1).astype(int).tolist()
+        executor = self.get_executor()
+        futures = [executor.submit(solve_layer_shared, layers.get_name(),
+                                   distances, size, lo, hi)
+                   for lo, hi in zip(bounds, bounds[1:])]
+        try:
+            for future in as_completed(futures):
+                future.result()
+                self.check_cancelled()
+        except BaseException:
+            # running ranges still write to the shared memory
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            raise
+
+
+class MeetInTheMiddleHeldKarp(HeldKarp):
+    # Exact Held-Karp that never holds a table deeper than half of the
+    # waypoints. A forward table from the start covers the subsets of the
+    # first half of the tour and a backward table from the end those of the
+    # second half. Both are joined over complementary subsets: the first
+    # half over A ends at a, the second over the rest B starts at b. Only
+    # the costs of the last layers are kept, the deepest backward layer is
+    # joined block by block as it is computed, and the two halves of the
+    # best tour are found again with small tables over A and B alone.
+    # The cost is optimal, among equally short tours it may pick another
+    # one than HeldKarp.
+    def __init__(self) -> None:
+        super().__init__()
+        # most table entries held at once in the last run
+        self.peak_states = 0
+
+    # Accessors
+    def get_peak_states(self) -> int:
+        return self.peak_states
+
+    # Modifiers
+    def run_algorithm(
+        self,
+    ) -> tuple[float, list[int]]:
+        n = len(self.distance_matrix)
+        n_items = n - 2
+        if n_items < 2:
+            return super().run_algorithm()
+
+        matrix = np.array(self.distance_matrix, dtype=COST)
+        # item i is waypoint i + 1 of the matrix, backward[m, e] is the
+        # distance from e to m
+        forward = np.ascontiguousarray(matrix[1:-1, 1:-1])
+        backward = np.ascontiguousarray(forward.T)
+        binom = binomial_table(n_items)
+        half = n_items // 2
+        rest = n_items - half
+        self.peak_states = 0
+
+        with self.stats.phase("dp_forward"):
+            first_half = self.grow_layer(matrix[0, 1:-1], forward, binom,
+                                         half, 0)
+        with self.stats.phase("dp_backward"):
+            second_half = self.grow_layer(matrix[1:-1, -1], backward, binom,
+                                          rest - 1, half)
+        with self.stats.phase("dp_join"):
+            first_items, last, second_items, next_item = self.join(
+                first_half, second_half, forward, backward, binom, half,
+                rest)
+        del first_half, second_half
+
+        # the halves once more, with their parents this time
+        first_path = solve_path(
+            matrix[0, first_items + 1],
+            forward[np.ix_(first_items, first_items)],
+            int(np.searchsorted(first_items, last)))
+        second_path = solve_path(
+            matrix[second_items + 1, -1],
+            backward[np.ix_(second_items, second_items)],
+            int(np.searchsorted(second_items, next_item)))
+        tour = ([int(first_items[item]) for item in reversed(first_path)]
+                + [int(second_items[item]) for item in second_path])
+
+        # summed along the tour like HeldKarp does
+        stops = [0] + [item + 1 for item in tour] + [n - 1]
+        opt_cost = self.distance_matrix[0][stops[1]]
+        for stop, next_stop in zip(stops[1:], stops[2:]):
+            opt_cost += self.distance_matrix[stop][next_stop]
+        self.stats.add("dp_peak_states", self.peak_states)
+        return opt_cost, [item + 1 for item in reversed(tour)]
+
+    def grow_layer(
+        self,
+        first_costs: np.ndarray,
+        distances: np.ndarray,
+        binom: np.ndarray,
+        size: int,
+        layers_done: int,
+    ) -> np.ndarray:
+        # costs of the layer of that size (at least 1), only the layer
+        # before is kept
+        n_items = len(distances)
+        costs = first_costs.reshape(n_items, 1).copy()
+        for layer_size in range(2, size + 1):
+            with self.stats.phase("dp_layer", subset_size=layer_size):
+                self.check_cancelled()
+                self.report_progress(dp_layer=layers_done + layer_size,
+                                     total_layers=n_items)
+                rows = int(binom[n_items, layer_size])
+                previous = costs
+                costs = np.empty((rows, layer_size), dtype=COST)
+                self.add_states(previous.size + costs.size)
+                solve_layer(distances, binom, layer_size, 0, rows, previous,
+                            costs, None)
+        return costs
+
+    def join(
+        self,
+        first_half: np.ndarray,
+        second_half: np.ndarray,
+        forward: np.ndarray,
+        backward: np.ndarray,
+        binom: np.ndarray,
+        half: int,
+        rest: int,
+    ) -> tuple[np.ndarray, int, np.ndarray, int]:
+        # items of the best first half and its last item, items of the
+        # second half and its first item
+        n_items = len(forward)
+        best_cost = float("inf")
+        best: tuple[np.ndarray, int, np.ndarray, int] | None = None
+        rows = int(binom[n_items, rest])
+        for lo in range(0, rows, BLOCK_SUBSETS):
+            self.check_cancelled()
+            self.report_progress(dp_layer=n_items, total_layers=n_items)
+            hi = min(lo + BLOCK_SUBSETS, rows)
+            # the deepest backward layer, one block at a time, unless it is
+            # the first layer
+            second_costs = (second_half if rest == 1 else solve_block(
+                backward, binom, rest, lo, hi, second_half)[0])
+            self.add_states(first_half.size + second_half.size
+                            + second_costs.size)
+            second_items = unrank_subsets(binom, rest, lo, hi)
+            outside = np.ones((hi - lo, n_items), dtype=bool)
+            outside[np.arange(hi - lo)[:, None], second_items] = False
+            first_items = np.nonzero(outside)[1].reshape(hi - lo, half)
+            first_costs = first_half[rank_subsets(binom, first_items)]
+            for j in range(rest):
+                next_item = second_items[:, j:j + 1]
+                totals = (first_costs + forward[first_items, next_item]
+                          + second_costs[:, j:j + 1])
+                row, position = np.unravel_index(np.argmin(totals),
+                                                 totals.shape)
+                if totals[row, position] < best_cost:
+                    best_cost = float(totals[row, position])
+                    best = (first_items[row],
+                            int(first_items[row, position]),
+                            second_items[row], int(next_item[row, 0]))
+        assert best is not None
+        return best
+
+    def add_states(self, states: int) -> None:
+        self.peak_states = max(self.peak_states, states)
@@ -0,0 +1,119 @@
+import numpy as np
+
+from grid.node import Node
+from grid.tiled_grid import TiledCells
+from pathfinding.cache import LRUCache
+from pathfinding.grid_arrays import terrain_array
+from pathfinding.terrain_cost import TerrainCostModel
+
+# fields are only built for grids up to this many cells, larger ones fall
+# back to evaluating the heuristic per node
+MAX_FIELD_CELLS: int = 1 << 22
+# total number of cells over all cached fields (8 bytes each)
+FIELD_BUDGET_CELLS: int = 1 << 24
+
+
+def elevation_heuristic_field(
+    terrain: np.ndarray,
+    goal_row: int,
+    goal_col: int,
+    k: float,
+) -> np.ndarray:
+    # the ELEVATION heuristic of AStar towards one goal for every cell,
+    # flattened so that it is indexed by node id
+    rows, cols = terrain.shape
+    row_distance = np.abs(np.arange(rows, dtype=np.float64) - goal_row)
+    col_distance = np.abs(np.arange(cols, dtype=np.float64) - goal_col)
+    manhattan = row_distance[:, None] + col_distance[None, :]
+    elevation_diff = np.abs(terrain - terrain[goal_row, goal_col])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        field = np.power(elevation_diff, k) * np.power(manhattan, 1 - k)
+    # 0 ** (1 - k) is infinite for k > 1, the goal itself is at distance 0
+    field[goal_row, goal_col] = 0.0
+    return field.ravel()
+
+
+class HeuristicFields:
+    # Per goal heuristic values, computed once as a NumPy field over the
+    # terrain and read by node id during the search, plus the edge costs of
+    # a terrain cost model. Everything belongs to one graph and is dropped
+    # when the graph or its content hash changes.
+    def __init__(self) -> None:
+        self.graph: list[list[Node]] | TiledCells | None = None
+        self.graph_hash: int | None = None
+        self.terrain: np.ndarray | None = None
+        self.fields = LRUCache(0)
+        self.edge_costs: dict[tuple[float | str | None, ...], memoryview] = {}
+
+    # Accessors
+    def fits(self) -> bool:
+        # whether arrays over all cells of the graph are affordable
+        if self.graph is None or not len(self.graph):
+            return False
+        return len(self.graph) * len(self.graph[0]) <= MAX_FIELD_CELLS
+
+    def get_terrain(self) -> np.ndarray:
+        if self.terrain is None:
+            self.terrain = terrain_array(self.graph)
+        return self.terrain
+
+    def get_values(
+        self,
+        goal: Node,
+        k: float,
+        cost_model: TerrainCostModel | None = None,
+    ) -> memoryview | None:
+        # memoryview indexing returns plain floats, which keeps the search
+        # loop free of NumPy scalars
+        if not self.fits():
+            return None
+        key = (goal.id, k,
+               cost_model.get_signature() if cost_model is not None else None)
+        values = self.fields.get(key)
+        if values is None:
+            row, col = goal.get_position()
+            terrain = self.get_terrain()
+            if cost_model is not None:
+                field = cost_model.heuristic_field(terrain, row, col)
+            else:
+                field = elevation_heuristic_field(terrain, row, col, k)
+            values = memoryview(field)
+            self.fields.put(key, values)
+        return values
+
+    def get_edge_costs(
+        self,
+        cost_model: TerrainCostModel,
+    ) -> memoryview | None:
+        if not self.fits():
+            return None
+        key = cost_model.get_signature()
+        if key not in self.edge_costs:
+            self.edge_costs[key] = memoryview(
+                cost_model.edge_costs(self.get_terrain()))
+        return self.edge_costs[key]
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    # Modifiers
+    def set_graph(
+        self,
+        graph: list[list[Node]] | TiledCells,
+        graph_hash: int | None,
+    ) -> None:
+        # without a content hash the graph may have changed in place
+        if (graph is self.graph and graph_hash is not None
+                and graph_hash == self.graph_hash):
+            return
+        self.graph = graph
+        self.graph_hash = graph_hash
+        self.terrain = None
+        self.edge_costs = {}
+        n_cells = len(graph) * len(graph[0]) if len(graph) else 0
+        self.fields = LRUCache(max(1, FIELD_BUDGET_CELLS // max(1, n_cells)))
+
+    def clear(self) -> None:
+        self.fields.clear()
+        self.terrain = None
+        self.edge_costs = {}
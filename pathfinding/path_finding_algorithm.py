@@ -1,13 +1,54 @@
 import abc
+import threading
 from collections.abc import Callable
 from typing import Any
 
 from grid.node import Node, NodeType
+from pathfinding.stats import RunStats
+
+# how many inner iterations (e.g. expanded nodes) pass between two
+# progress reports / cancellation checks
+PROGRESS_INTERVAL: int = 256
+
+ProgressCallback = Callable[[str, dict[str, Any]], None]
+
+
+class SolverCancelledError(Exception):
+    pass
 
 
 class PathFindingAlgorithm(abc.ABC):
     def __init__(self) -> None:
         self.path: list[Node] = []
+        self.progress_callback: ProgressCallback | None = None
+        self.cancel_event: threading.Event | None = None
+        # disabled by default, shared with other solvers of the same run
+        self.stats = RunStats()
+
+    def set_progress_callback(
+        self,
+        progress_callback: ProgressCallback | None,
+    ) -> None:
+        self.progress_callback = progress_callback
+
+    def set_cancel_event(self, cancel_event: threading.Event | None) -> None:
+        self.cancel_event = cancel_event
+
+    def set_stats(self, stats: RunStats) -> None:
+        self.stats = stats
+
+    def get_stats(self) -> RunStats:
+        return self.stats
+
+    def report_progress(self, **progress: Any) -> None:
+        if self.progress_callback is not None:
+            self.progress_callback(self.__class__.__name__, progress)
+
+    def check_cancelled(self) -> None:
+        # cooperative cancellation, the solvers call this regularly
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise SolverCancelledError(
+                f"{self.__class__.__name__} run was cancelled")
 
     @abc.abstractmethod
     def visualize_algorithm(
@@ -22,11 +63,20 @@ class PathFindingAlgorithm(abc.ABC):
     def heuristic(self, node1: Node, node2: Node, **kwargs: Any) -> int:
         ...
 
+    def get_path(self) -> list[Node]:
+        return self.path
+
+    def set_path(self, path: list[Node]) -> None:
+        self.path = path
+
     def reconstruct_path(
         self,
         start_node: Node,
         end_node: Node,
     ) -> None:
+        self.mark_path()
+
+    def mark_path(self) -> None:
         for node in self.path:
             if (
                 node.get_type() != NodeType.START
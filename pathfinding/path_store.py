@@ -0,0 +1,53 @@
+import numpy as np
+
+from grid.node import Node
+from pathfinding.utils import ids_array, ids_to_nodes
+
+EMPTY_LEG = np.empty(0, dtype=np.int32)
+
+
+class PathStore:
+    # Keeps only the actual legs between pairs of nodes, as int32 arrays of
+    # node ids from source to target. A full route is stitched together by
+    # concatenating leg slices and only turned into Node objects at the end.
+    def __init__(self, graph: list[list[Node]] | None = None) -> None:
+        self.graph: list[list[Node]] = graph if graph is not None else []
+        self.legs: dict[int, dict[int, np.ndarray]] = {}
+
+    # Accessors
+    def get_leg(self, source_id: int, target_id: int) -> np.ndarray:
+        return self.legs[source_id][target_id]
+
+    def has_leg(self, source_id: int, target_id: int) -> bool:
+        return target_id in self.legs.get(source_id, {})
+
+    def get_nbytes(self) -> int:
+        return sum(leg.nbytes for targets in self.legs.values()
+                   for leg in targets.values())
+
+    def stitch(self, tour_ids: list[int]) -> np.ndarray:
+        # the last node of every leg is the first node of the next one
+        if len(tour_ids) < 2:
+            return ids_array(tour_ids)
+        parts = [self.legs[source_id][target_id][:-1]
+                 for source_id, target_id in zip(tour_ids, tour_ids[1:])]
+        parts.append(ids_array(tour_ids[-1:]))
+        return np.concatenate(parts)
+
+    def stitch_nodes(self, tour_ids: list[int]) -> list[Node]:
+        return ids_to_nodes(self.graph, self.stitch(tour_ids))
+
+    # Modifiers
+    def set_graph(self, graph: list[list[Node]]) -> None:
+        self.graph = graph
+
+    def set_leg(self, source_id: int, target_id: int, leg: np.ndarray) -> None:
+        self.legs.setdefault(source_id, {})[target_id] = leg
+
+    def remove_node(self, node_id: int) -> None:
+        self.legs.pop(node_id, None)
+        for targets in self.legs.values():
+            targets.pop(node_id, None)
+
+    def clear(self) -> None:
+        self.legs = {}
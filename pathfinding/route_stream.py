@@ -0,0 +1,143 @@
+import asyncio
+from collections.abc import AsyncIterator, Iterator
+
+import numpy as np
+
+from grid.node import Node
+from pathfinding.ant_colony_opt import AntColonyOptimisation
+from pathfinding.astar import AStar
+from pathfinding.bitset_bfs import BitsetBFS
+from pathfinding.distance_matrix import WaypointDistanceMatrix
+from pathfinding.held_karp import HeldKarp
+from pathfinding.utils import ids_to_nodes
+
+
+class RouteLeg:
+    # One leg of a tour, node ids from one stop to the next (both included).
+    # The index counts the legs from the start, the last leg ends at the
+    # end node.
+    def __init__(
+        self,
+        index: int,
+        n_legs: int,
+        distance: float,
+        cells: np.ndarray,
+    ) -> None:
+        self.index = index
+        self.n_legs = n_legs
+        self.distance = distance
+        self.cells = cells
+
+    # Accessors
+    def get_index(self) -> int:
+        return self.index
+
+    def get_source_id(self) -> int:
+        return int(self.cells[0])
+
+    def get_target_id(self) -> int:
+        return int(self.cells[-1])
+
+    def get_distance(self) -> float:
+        return self.distance
+
+    def get_cells(self) -> np.ndarray:
+        return self.cells
+
+    def get_nodes(self, graph: list[list[Node]]) -> list[Node]:
+        return ids_to_nodes(graph, self.cells)
+
+    def is_last(self) -> bool:
+        return self.index == self.n_legs - 1
+
+
+class RouteStream:
+    # Delivers the route of a waypoint tour leg by leg in driving order.
+    # The solver only needs the distances between the stops, so by default
+    # the matrix holds no paths and every leg is searched for when it is
+    # asked for. Before the first leg only the distances, the tour and that
+    # one leg are computed, and a consumer that stops early never pays for
+    # the rest. Legs a matrix with paths already holds are taken from it.
+    def __init__(
+        self,
+        astar: AStar,
+        solver: HeldKarp | AntColonyOptimisation,
+        distance_matrix: WaypointDistanceMatrix | None = None,
+    ) -> None:
+        self.astar = astar
+        self.solver = solver
+        self.distance_matrix = (
+            distance_matrix if distance_matrix is not None
+            else WaypointDistanceMatrix(astar, with_paths=False))
+        if astar.get_distance_engine() is None:
+            # one search per stop for all of its distances instead of one
+            # A* per pair, A* still does the settings the BFS cannot
+            astar.set_distance_engine(BitsetBFS())
+
+    # Accessors
+    def get_distance_matrix(self) -> WaypointDistanceMatrix:
+        return self.distance_matrix
+
+    def find_tour(
+        self,
+        start_node: Node,
+        end_node: Node,
+        waypoints: list[Node],
+        graph_hash: int | None = None,
+    ) -> list[int]:
+        # node ids of the stops from start to end, empty without a tour.
+        # The graph of the AStar has to be set up already.
+        stats = self.solver.get_stats()
+        with stats.phase("distance_matrix"):
+            self.distance_matrix.sync(start_node, end_node, waypoints,
+                                      graph_hash)
+        self.solver.set_distance_matrix(self.distance_matrix)
+        with stats.phase("solver"):
+            if not self.solver.find_tour(start_node, end_node):
+                return []
+        return [node.id for node in self.solver.get_tour()]
+
+    def legs(
+        self,
+        start_node: Node,
+        end_node: Node,
+        waypoints: list[Node],
+        graph_hash: int | None = None,
+    ) -> Iterator[RouteLeg]:
+        # nothing is yielded if some stop cannot be reached
+        tour_ids = self.find_tour(start_node, end_node, waypoints,
+                                  graph_hash)
+        return self.tour_legs(tour_ids)
+
+    def tour_legs(self, tour_ids: list[int]) -> Iterator[RouteLeg]:
+        paths = self.distance_matrix.get_paths()
+        distances = self.distance_matrix.get_distance_dict()
+        nodes = self.distance_matrix.get_nodes()
+        n_legs = len(tour_ids) - 1
+        for index, (source_id, target_id) in enumerate(
+                zip(tour_ids, tour_ids[1:])):
+            if paths.has_leg(source_id, target_id):
+                distance = distances[source_id][target_id]
+                cells = paths.get_leg(source_id, target_id)
+            else:
+                distance, cells = self.astar.find_legs(
+                    nodes[source_id], [nodes[target_id]])[0]
+            yield RouteLeg(index, n_legs, distance, cells)
+
+    async def legs_async(
+        self,
+        start_node: Node,
+        end_node: Node,
+        waypoints: list[Node],
+        graph_hash: int | None = None,
+    ) -> AsyncIterator[RouteLeg]:
+        # same as legs, the matrix, the solver and every leg run on a worker
+        # thread so the event loop stays free
+        tour_ids = await asyncio.to_thread(
+            self.find_tour, start_node, end_node, waypoints, graph_hash)
+        legs = self.tour_legs(tour_ids)
+        while True:
+            leg = await asyncio.to_thread(next, legs, None)
+            if leg is None:
+                return
+            yield leg
@@ -0,0 +1,124 @@
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager, nullcontext
+from typing import Any
+
+# hooks are called as hook(event, name, value) with the events below,
+# value is the dict of phase arguments on "phase_start", the elapsed seconds
+# on "phase_end" and the epoch record on "epoch"
+StatsHook = Callable[[str, str, Any], None]
+
+PHASE_START = "phase_start"
+PHASE_END = "phase_end"
+EPOCH = "epoch"
+
+# shared no-op context handed out by disabled stats
+NO_PHASE = nullcontext()
+
+
+class RunStats:
+    # Statistics of one algorithm run: wall time per phase, counters such as
+    # expanded nodes or DP states, and one record per ACO epoch. When the
+    # stats are disabled every method returns right away, so the solvers can
+    # call them unconditionally. Inner loops keep local counters and only
+    # add them once per search.
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.phase_times: dict[str, float] = {}
+        self.counters: dict[str, float] = {}
+        self.epochs: list[dict[str, float]] = []
+        self.hooks: list[StatsHook] = []
+
+    # Accessors
+    def is_enabled(self) -> bool:
+        return self.enabled
+
+    def get_phase_times(self) -> dict[str, float]:
+        return self.phase_times
+
+    def get_counters(self) -> dict[str, float]:
+        return self.counters
+
+    def get_counter(self, name: str) -> float:
+        return self.counters.get(name, 0)
+
+    def get_epochs(self) -> list[dict[str, float]]:
+        return self.epochs
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"phases": dict(self.phase_times),
+                "counters": dict(self.counters),
+                "epochs": list(self.epochs)}
+
+    def report(self) -> str:
+        lines = ["Run statistics:"]
+        for name, seconds in self.phase_times.items():
+            lines.append(f"  {name}: {seconds * 1000:.2f} ms")
+        for name, value in self.counters.items():
+            lines.append(f"  {name}: {value:g}")
+        if self.epochs:
+            epoch_times = [epoch["seconds"] for epoch in self.epochs]
+            lines.append(
+                f"  epochs: {len(self.epochs)}, mean "
+                f"{sum(epoch_times) / len(epoch_times) * 1000:.2f} ms, "
+                f"best length {self.epochs[-1]['best_length']:g}")
+        return "\n".join(lines)
+
+    # Modifiers
+    def set_enabled(self, enabled: bool) -> None:
+        self.enabled = enabled
+
+    def add_hook(self, hook: StatsHook) -> None:
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: StatsHook) -> None:
+        self.hooks.remove(hook)
+
+    def reset(self) -> None:
+        self.phase_times = {}
+        self.counters = {}
+        self.epochs = []
+
+    def phase(self, name: str, **args: Any) -> Any:
+        # context manager timing the enclosed block, nested and repeated
+        # phases with the same name add up, the arguments are only passed
+        # on to the hooks
+        if not self.enabled:
+            return NO_PHASE
+        return self.timed_phase(name, args)
+
+    @contextmanager
+    def timed_phase(self, name: str, args: dict[str, Any]) -> Iterator[None]:
+        self.call_hooks(PHASE_START, name, args)
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - phase_start
+            self.phase_times[name] = self.phase_times.get(name, 0.0) + elapsed
+            self.call_hooks(PHASE_END, name, elapsed)
+
+    def add(self, name: str, amount: float = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_max(self, name: str, value: float) -> None:
+        if self.enabled and value > self.counters.get(name, 0):
+            self.counters[name] = value
+
+    def record_epoch(
+        self,
+        epoch: int,
+        seconds: float,
+        best_length: float,
+    ) -> None:
+        if not self.enabled:
+            return
+        record = {"epoch": epoch, "seconds": seconds,
+                  "best_length": best_length}
+        self.epochs.append(record)
+        self.call_hooks(EPOCH, "epoch", record)
+
+    def call_hooks(self, event: str, name: str, value: Any) -> None:
+        for hook in self.hooks:
+            hook(event, name, value)
@@ -0,0 +1,234 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Held-Karp over the subsets of n items, one layer per subset size. The
+# subsets of a layer are numbered by their colex rank: a subset with the
+# sorted items c_0 < c_1 < ... has rank C(c_0, 1) + C(c_1, 2) + ..., so the
+# ranks of a layer run from 0 to C(n, size) - 1 without gaps. A layer is
+# an array with one row per subset and one column per possible last item,
+# in the order of the sorted items of the subset.
+COST = np.dtype(np.float64)
+# item the best path to a state came from, -1 for the first item
+PARENT = np.dtype(np.int8)
+NO_PARENT: int = -1
+# subsets computed at once, bounds the temporary arrays of a block
+BLOCK_SUBSETS: int = 1 << 15
+
+
+def binomial_table(n_items: int) -> np.ndarray:
+    # C(c, k) at [c, k] for 0 <= c <= n_items and 0 <= k <= n_items + 1
+    table = np.zeros((n_items + 1, n_items + 2), dtype=np.int64)
+    table[:, 0] = 1
+    for c in range(1, n_items + 1):
+        table[c, 1:] = table[c - 1, 1:] + table[c - 1, :-1]
+    return table
+
+
+def unrank_subsets(
+    binom: np.ndarray,
+    size: int,
+    lo: int,
+    hi: int,
+) -> np.ndarray:
+    # sorted items of the subsets with ranks lo..hi - 1, one row each
+    n_items = binom.shape[0] - 1
+    ranks = np.arange(lo, hi, dtype=np.int64)
+    subsets = np.empty((hi - lo, size), dtype=np.int64)
+    for position in range(size - 1, -1, -1):
+        # largest item c with C(c, position + 1) <= rank
+        column = binom[:n_items, position + 1]
+        items = np.searchsorted(column, ranks, side="right") - 1
+        subsets[:, position] = items
+        ranks -= column[items]
+    return subsets
+
+
+def rank_subsets(binom: np.ndarray, subsets: np.ndarray) -> np.ndarray:
+    positions = np.arange(1, subsets.shape[1] + 1)
+    return binom[subsets, positions].sum(axis=1)
+
+
+def ranks_without(binom: np.ndarray, subsets: np.ndarray) -> np.ndarray:
+    # [s, j] is the rank of subset s without its item at position j, the
+    # items after j move one position down
+    size = subsets.shape[1]
+    positions = np.arange(size)
+    below = binom[subsets, positions + 1]
+    above = binom[subsets, positions]
+    before = np.cumsum(below, axis=1) - below
+    after = np.cumsum(above[:, ::-1], axis=1)[:, ::-1] - above
+    return before + after
+
+
+def first_layer(
+    first_costs: np.ndarray,
+    costs: np.ndarray,
+    parents: np.ndarray,
+) -> None:
+    # subset {c} has rank c, its only path comes straight from the origin
+    costs[:, 0] = first_costs
+    parents[:, 0] = NO_PARENT
+
+
+def solve_layer(
+    distances: np.ndarray,
+    binom: np.ndarray,
+    size: int,
+    lo: int,
+    hi: int,
+    previous: np.ndarray,
+    costs: np.ndarray,
+    parents: np.ndarray | None,
+) -> None:
+    # Fills rows lo..hi - 1 of layer size from the layer before, the
+    # parents are only kept if there is an array for them
+    for block_lo in range(lo, hi, BLOCK_SUBSETS):
+        block_hi = min(block_lo + BLOCK_SUBSETS, hi)
+        block_costs, block_parents = solve_block(
+            distances, binom, size, block_lo, block_hi, previous)
+        costs[block_lo:block_hi] = block_costs
+        if parents is not None:
+            parents[block_lo:block_hi] = block_parents
+
+
+def solve_block(
+    distances: np.ndarray,
+    binom: np.ndarray,
+    size: int,
+    lo: int,
+    hi: int,
+    previous: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    # costs and parents of rows lo..hi - 1 of layer size. For the last item
+    # e at position j, ties between candidates m go to the smallest m like
+    # min() over (cost, m) tuples.
+    subsets = unrank_subsets(binom, size, lo, hi)
+    without = ranks_without(binom, subsets)
+    rows = np.arange(hi - lo)
+    costs = np.empty((hi - lo, size), dtype=COST)
+    parents = np.empty((hi - lo, size), dtype=PARENT)
+    for j in range(size):
+        # the other items in increasing order, in the subset without e they
+        # keep their positions 0..size - 2
+        others = np.delete(subsets, j, axis=1)
+        candidates = (previous[without[:, j:j + 1], np.arange(size - 1)]
+                      + distances[others, subsets[:, j:j + 1]])
+        # argmin takes the first of equal costs, i.e. the smallest m
+        best = np.argmin(candidates, axis=1)
+        costs[:, j] = candidates[rows, best]
+        parents[:, j] = others[rows, best]
+    return costs, parents
+
+
+def backtrack(
+    binom: np.ndarray,
+    parents: list[np.ndarray],
+    last: int,
+) -> list[int]:
+    # items of the best path over all items ending at last, backwards.
+    # parents[size] are the parents of the layer of that size.
+    items = list(range(binom.shape[0] - 1))
+    path: list[int] = []
+    while items:
+        size = len(items)
+        rank = int(rank_subsets(binom, np.array([items]))[0])
+        parent = int(parents[size][rank, items.index(last)])
+        path.append(last)
+        items.remove(last)
+        last = parent
+    return path
+
+
+def solve_path(
+    first_costs: np.ndarray,
+    distances: np.ndarray,
+    last: int,
+) -> list[int]:
+    # the best path over all items that ends at last, backwards, with the
+    # whole table in this process. Meant for a handful of items.
+    n_items = len(distances)
+    binom = binomial_table(n_items)
+    costs = np.empty((n_items, 1), dtype=COST)
+    parents = [np.empty((1, 0), dtype=PARENT),
+               np.empty((n_items, 1), dtype=PARENT)]
+    first_layer(first_costs, costs, parents[1])
+    for size in range(2, n_items + 1):
+        rows = int(binom[n_items, size])
+        previous = costs
+        costs = np.empty((rows, size), dtype=COST)
+        parents.append(np.empty((rows, size), dtype=PARENT))
+        solve_layer(distances, binom, size, 0, rows, previous, costs,
+                    parents[size])
+    return backtrack(binom, parents, last)
+
+
+class SubsetLayers:
+    # The costs of two layers, the one being computed and the one before,
+    # and the parents of all layers for the backtracking. Everything is in
+    # one shared memory block, so worker processes can attach to it by
+    # name and fill their part of a layer in place.
+    def __init__(self, n_items: int, name: str | None = None) -> None:
+        self.n_items = n_items
+        binom = binomial_table(n_items)
+        sizes = np.arange(n_items + 1)
+        states = binom[n_items, :n_items + 1] * sizes
+        self.layer_rows = binom[n_items, :n_items + 1].tolist()
+        self.max_states = int(states.max())
+        self.parent_offsets = np.concatenate(([0], np.cumsum(states)))
+        cost_bytes = 2 * self.max_states * COST.itemsize
+        parent_bytes = int(self.parent_offsets[-1]) * PARENT.itemsize
+        if name is None:
+            self.memory = shared_memory.SharedMemory(
+                create=True, size=max(cost_bytes + parent_bytes, 1))
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.costs: np.ndarray | None = np.ndarray(
+            (2, self.max_states), dtype=COST, buffer=self.memory.buf)
+        self.parents: np.ndarray | None = np.ndarray(
+            (int(self.parent_offsets[-1]),), dtype=PARENT,
+            buffer=self.memory.buf, offset=cost_bytes)
+
+    # Accessors
+    def get_name(self) -> str:
+        return self.memory.name
+
+    def get_nbytes(self) -> int:
+        return self.memory.size
+
+    def get_costs(self, size: int) -> np.ndarray:
+        assert self.costs is not None
+        rows = self.layer_rows[size]
+        return self.costs[size % 2, :rows * size].reshape(rows, size)
+
+    def get_parents(self, size: int) -> np.ndarray:
+        assert self.parents is not None
+        offset = int(self.parent_offsets[size])
+        rows = self.layer_rows[size]
+        return self.parents[offset:offset + rows * size].reshape(rows, size)
+
+    # Modifiers
+    def close(self, unlink: bool = False) -> None:
+        # the views have to go before the memory can be closed
+        self.costs = None
+        self.parents = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def solve_layer_shared(
+    name: str,
+    distances: np.ndarray,
+    size: int,
+    lo: int,
+    hi: int,
+) -> None:
+    # runs in a worker process, rows lo..hi - 1 of a layer of the block
+    layers = SubsetLayers(len(distances), name)
+    try:
+        solve_layer(distances, binomial_table(len(distances)), size, lo, hi,
+                    layers.get_costs(size - 1), layers.get_costs(size),
+                    layers.get_parents(size))
+    finally:
+        layers.close()
@@ -0,0 +1,90 @@
+import numpy as np
+
+INFINITY = float("inf")
+# moves in the order of Grid.create_graph, as (row, col) offsets
+DIRECTIONS: tuple[tuple[int, int], ...] = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+class TerrainCostModel:
+    # Edge costs for the ELEVATION setting. A move costs base_cost plus
+    # climb_cost per unit of height gained or descent_cost per unit of
+    # height lost, and moves with a height difference above max_slope are
+    # impassable. The matching heuristic is admissible and consistent: any
+    # path has at least the Manhattan number of moves and has to climb (or
+    # descend) at least the height difference to the goal.
+    def __init__(
+        self,
+        base_cost: float = 1.0,
+        climb_cost: float = 0.1,
+        descent_cost: float = 0.05,
+        max_slope: float | None = None,
+    ) -> None:
+        self.base_cost = base_cost
+        self.climb_cost = climb_cost
+        self.descent_cost = descent_cost
+        self.max_slope = max_slope
+
+    # Accessors
+    def get_signature(self) -> tuple[float | str | None, ...]:
+        # identifies the costs in cache keys
+        return ("terrain_costs", self.base_cost, self.climb_cost,
+                self.descent_cost, self.max_slope)
+
+    def edge_cost(self, from_level: float, to_level: float) -> float:
+        height_diff = to_level - from_level
+        if self.max_slope is not None and abs(height_diff) > self.max_slope:
+            return INFINITY
+        if height_diff > 0:
+            return self.base_cost + self.climb_cost * height_diff
+        return self.base_cost - self.descent_cost * height_diff
+
+    def heuristic(
+        self,
+        level: float,
+        goal_level: float,
+        manhattan_distance: int,
+    ) -> float:
+        height_diff = goal_level - level
+        if height_diff > 0:
+            return (self.base_cost * manhattan_distance
+                    + self.climb_cost * height_diff)
+        return (self.base_cost * manhattan_distance
+                - self.descent_cost * height_diff)
+
+    def edge_costs(self, terrain: np.ndarray) -> np.ndarray:
+        # cost of every move as a flat array indexed by
+        # node_id * len(DIRECTIONS) + direction, infinite where the move
+        # leaves the grid or is too steep
+        rows, cols = terrain.shape
+        terrain = terrain.astype(np.float64)
+        costs = np.full((rows, cols, len(DIRECTIONS)), INFINITY)
+        for direction, (row_offset, col_offset) in enumerate(DIRECTIONS):
+            # cells of the grid whose move in this direction stays inside
+            source = (slice(max(0, -row_offset), rows - max(0, row_offset)),
+                      slice(max(0, -col_offset), cols - max(0, col_offset)))
+            target = (slice(max(0, row_offset), rows + min(0, row_offset)),
+                      slice(max(0, col_offset), cols + min(0, col_offset)))
+            height_diff = terrain[target] - terrain[source]
+            cost = (self.base_cost
+                    + self.climb_cost * np.maximum(height_diff, 0)
+                    - self.descent_cost * np.minimum(height_diff, 0))
+            if self.max_slope is not None:
+                cost[np.abs(height_diff) > self.max_slope] = INFINITY
+            costs[source + (direction,)] = cost
+        return costs.ravel()
+
+    def heuristic_field(
+        self,
+        terrain: np.ndarray,
+        goal_row: int,
+        goal_col: int,
+    ) -> np.ndarray:
+        rows, cols = terrain.shape
+        row_distance = np.abs(np.arange(rows, dtype=np.float64) - goal_row)
+        col_distance = np.abs(np.arange(cols, dtype=np.float64) - goal_col)
+        manhattan = row_distance[:, None] + col_distance[None, :]
+        height_diff = terrain[goal_row, goal_col] - terrain.astype(np.float64)
+        field = (self.base_cost * manhattan
+                 + self.climb_cost * np.maximum(height_diff, 0)
+                 - self.descent_cost * np.minimum(height_diff, 0))
+        return field.ravel()
@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+import time
+from typing import Any
+
+from pathfinding.stats import EPOCH, PHASE_END, PHASE_START, RunStats
+
+TraceEvent = dict[str, Any]
+
+
+def trace_timestamp() -> float:
+    # microseconds on the monotonic clock, which is shared by all processes
+    # of the machine, so events of worker processes line up with ours
+    return time.perf_counter() * 1e6
+
+
+def complete_event(
+    name: str,
+    start: float,
+    duration: float,
+    args: dict[str, Any] | None = None,
+) -> TraceEvent:
+    # one "X" (complete) event of the Chrome Trace Event format, can also be
+    # built in a worker process and handed back to the tracer
+    return {"name": name, "ph": "X", "ts": start, "dur": duration,
+            "pid": os.getpid(), "tid": threading.get_ident(),
+            "args": args or {}}
+
+
+class Tracer:
+    # Collects spans in the Chrome Trace Event format. The file written by
+    # save() opens directly in Perfetto or chrome://tracing. Spans come from
+    # the phases of a RunStats object through a hook, or from span() and
+    # add_events() for code outside the solvers.
+    def __init__(self) -> None:
+        self.events: list[TraceEvent] = []
+        self.lock = threading.Lock()
+        # file the events saved so far went to, later saves append to it
+        self.saved_path: str | None = None
+        self.saved_events = 0
+        # open phases per thread, as (name, start, args)
+        self.local = threading.local()
+        self.named_threads: set[tuple[int, int]] = set()
+
+    # Accessors
+    def get_events(self) -> list[TraceEvent]:
+        with self.lock:
+            return list(self.events)
+
+    def __len__(self) -> int:
+        # all events of the session, saved or not
+        return self.saved_events + len(self.events)
+
+    # Modifiers
+    def attach(self, stats: RunStats) -> None:
+        stats.add_hook(self.on_stats_event)
+
+    def detach(self, stats: RunStats) -> None:
+        stats.remove_hook(self.on_stats_event)
+
+    def on_stats_event(self, event: str, name: str, value: Any) -> None:
+        if event == PHASE_START:
+            self.open_phases().append((name, trace_timestamp(), value))
+        elif event == PHASE_END:
+            phase_name, start, args = self.open_phases().pop()
+            self.add_event(complete_event(
+                phase_name, start, trace_timestamp() - start, args))
+        elif event == EPOCH:
+            # epochs are timed by the solver itself, the span ends now
+            duration = value["seconds"] * 1e6
+            self.add_event(complete_event(
+                "aco_epoch", trace_timestamp() - duration, duration,
+                {"epoch": value["epoch"],
+                 "best_length": value["best_length"]}))
+
+    def open_phases(self) -> list[tuple[str, float, dict[str, Any]]]:
+        if not hasattr(self.local, "phases"):
+            self.local.phases = []
+        return self.local.phases
+
+    def span(self, name: str, **args: Any) -> "TraceSpan":
+        return TraceSpan(self, name, args)
+
+    def add_event(self, event: TraceEvent) -> None:
+        with self.lock:
+            self.name_thread(event)
+            self.events.append(event)
+
+    def add_events(self, events: list[TraceEvent]) -> None:
+        # events recorded by worker threads or processes
+        for event in events:
+            self.add_event(event)
+
+    def name_thread(self, event: TraceEvent) -> None:
+        # metadata events so the viewer shows readable process/thread names
+        key = (event["pid"], event["tid"])
+        if key in self.named_threads:
+            return
+        self.named_threads.add(key)
+        if event["tid"] == threading.get_ident():
+            thread_name = threading.current_thread().name
+        else:
+            thread_name = f"worker {event['tid']}"
+        self.events.append({"name": "thread_name", "ph": "M",
+                            "pid": event["pid"], "tid": event["tid"],
+                            "args": {"name": thread_name}})
+        if event["pid"] != os.getpid():
+            self.events.append({"name": "process_name", "ph": "M",
+                                "pid": event["pid"], "tid": event["tid"],
+                                "args": {"name": f"worker {event['pid']}"}})
+
+    def clear(self) -> None:
+        with self.lock:
+            self.events = []
+            self.named_threads = set()
+
+    def save(self, path: str) -> None:
+        # Writes the events recorded since the last save and forgets them,
+        # so every run costs only its own events. The file uses the JSON
+        # array form of the format, whose closing bracket is optional, so
+        # the events of later runs are simply appended.
+        with self.lock:
+            events, self.events = self.events, []
+        if path != self.saved_path:
+            with open(path, "w") as trace_file:
+                trace_file.write("[")
+            self.saved_path = path
+            self.saved_events = 0
+        if not events:
+            return
+        with open(path, "a") as trace_file:
+            if self.saved_events:
+                trace_file.write(",")
+            trace_file.write(",".join("\n" + json.dumps(event)
+                                      for event in events))
+        self.saved_events += len(events)
+
+
+class TraceSpan:
+    # context manager for a span that is not a RunStats phase
+    def __init__(self, tracer: Tracer, name: str, args: dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self) -> "TraceSpan":
+        self.start = trace_timestamp()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.tracer.add_event(complete_event(
+            self.name, self.start, trace_timestamp() - self.start, self.args))
@@ -1,3 +1,5 @@
+import numpy as np
+
 from grid.node import Node
 
 
@@ -5,52 +7,51 @@ def correct_path(
     start_node: Node,
     end_node: Node,
     path_dict: dict[int, Node],
-    precomputed_paths: dict[int, dict[int, dict[int, Node]]] = {},
 ) -> list[Node]:
     path: list[Node] = []
+    current_node = end_node
+    while current_node != start_node:
+        path.append(current_node)
+        current_node = path_dict[current_node.id]
+    path.append(start_node)
+    return path
 
-    if not precomputed_paths:
-        current_node = end_node
-        while current_node != start_node:
-            path.append(current_node)
-            current_node = path_dict[current_node.id]
-        path.append(start_node)
-        return path
 
-    current_node = end_node
-    waypoint_parent = path_dict[current_node.id]
-    path.append(current_node)
+def leg_from_path_dict(
+    start_node: Node,
+    end_node: Node,
+    path_dict: dict[int, Node],
+) -> np.ndarray:
+    # node ids of the leg from start to end (both included)
+    leg = [node.id for node in correct_path(start_node, end_node, path_dict)]
+    leg.reverse()
+    return ids_array(leg)
 
-    while waypoint_parent != start_node:
-        # reconstruct actual path from prev way point to current way point
-        path_current_to_parent = precomputed_paths[
-            waypoint_parent.id][current_node.id]
-        parent = path_current_to_parent[current_node.id]
-        while parent != waypoint_parent:
-            path_dict[current_node.id] = parent
-            path.append(parent)
-            current_node = parent
-            parent = path_current_to_parent[current_node.id]
 
-        path_dict[current_node.id] = waypoint_parent
-        path.append(waypoint_parent)
+def path_dict_from_leg(
+    graph: list[list[Node]],
+    leg: np.ndarray,
+) -> dict[int, Node]:
+    # predecessor of every node of the leg but the first, as used by
+    # correct_path
+    n_cols = len(graph[0])
+    ids = leg.tolist()
+    return {node_id: graph[previous_id // n_cols][previous_id % n_cols]
+            for previous_id, node_id in zip(ids, ids[1:])}
 
-        current_node = waypoint_parent
-        waypoint_parent = path_dict[current_node.id]
 
-    path_current_to_parent = precomputed_paths[
-        waypoint_parent.id][current_node.id]
-    parent = path_current_to_parent[current_node.id]
-    while parent != waypoint_parent:
-        path_dict[current_node.id] = parent
-        path.append(parent)
-        current_node = parent
-        parent = path_current_to_parent[current_node.id]
+def ids_array(ids: list[int]) -> np.ndarray:
+    # int32 unless the grid is too large for its node ids to fit
+    if ids and max(ids) > np.iinfo(np.int32).max:
+        return np.array(ids, dtype=np.int64)
+    return np.array(ids, dtype=np.int32)
 
-    path_dict[current_node.id] = start_node
-    path.append(start_node)
 
-    return path
+def ids_to_nodes(graph: list[list[Node]], ids: np.ndarray) -> list[Node]:
+    # node ids are row * cols + col
+    n_cols = len(graph[0])
+    return [graph[node_id // n_cols][node_id % n_cols]
+            for node_id in ids.tolist()]
 
 
 def rearrange_distance_matrix(
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import itertools
+import json
+from typing import Any
+
+from service.protocol import (
+    DEFAULT_HOST, DEFAULT_SOCKET_PATH, MAX_MESSAGE_BYTES, Message,
+    decode_message, encode_message,
+)
+
+
+class ServiceError(Exception):
+    def __init__(self, message: str, retry: bool = False) -> None:
+        super().__init__(message)
+        self.retry = retry
+
+
+class PlanningClient:
+    # Client of the planning service for one connection. Requests can be
+    # sent from many tasks at once, a reader task hands every response to
+    # the request with the same id.
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count()
+        self.pending: dict[int, asyncio.Future[Message]] = {}
+        self.reader_task = asyncio.create_task(self.read_responses())
+
+    # Accessors
+    async def ping(self) -> dict[str, Any]:
+        return await self.request("ping")
+
+    async def stats(self) -> dict[str, Any]:
+        return await self.request("stats")
+
+    # Modifiers
+    async def request(self, op: str, **fields: Any) -> Any:
+        # the result of the request, raises ServiceError if it failed
+        request_id = next(self.ids)
+        response: asyncio.Future[Message] = (
+            asyncio.get_running_loop().create_future())
+        self.pending[request_id] = response
+        self.writer.write(encode_message({"id": request_id, "op": op,
+                                          **fields}))
+        await self.writer.drain()
+        message = await response
+        if not message.get("ok"):
+            raise ServiceError(message.get("error", "Unknown error"),
+                               bool(message.get("retry")))
+        return message["result"]
+
+    async def load(self, name: str, path: str) -> dict[str, Any]:
+        # the path is read by the server
+        return await self.request("load", name=name, path=path)
+
+    async def solve(
+        self,
+        map_name: str,
+        start: tuple[int, int],
+        end: tuple[int, int],
+        waypoints: list[tuple[int, int]] | None = None,
+        solver: str = "astar",
+        **options: Any,
+    ) -> dict[str, Any]:
+        return await self.request(
+            "solve", map=map_name, solver=solver, start=list(start),
+            end=list(end),
+            waypoints=[list(waypoint) for waypoint in waypoints or []],
+            **options)
+
+    async def read_responses(self) -> None:
+        try:
+            while line := await self.reader.readline():
+                message = decode_message(line)
+                response = self.pending.pop(message.get("id"), None)
+                if response is not None and not response.done():
+                    response.set_result(message)
+        finally:
+            for response in self.pending.values():
+                if not response.done():
+                    response.set_exception(
+                        ConnectionError("Connection to the server closed"))
+            self.pending.clear()
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        self.reader_task.cancel()
+
+
+async def connect(
+    socket_path: str | None = DEFAULT_SOCKET_PATH,
+    host: str = DEFAULT_HOST,
+    port: int | None = None,
+) -> PlanningClient:
+    # over TCP when a port is given, otherwise over the Unix socket
+    if port is not None:
+        reader, writer = await asyncio.open_connection(
+            host, port, limit=MAX_MESSAGE_BYTES)
+    else:
+        reader, writer = await asyncio.open_unix_connection(
+            socket_path, limit=MAX_MESSAGE_BYTES)
+    return PlanningClient(reader, writer)
+
+
+def setup_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "requests",
+        nargs="+",
+        help='Requests as JSON objects, e.g. \'{"op": "stats"}\'',
+    )
+    parser.add_argument(
+        "--socket",
+        required=False,
+        default=DEFAULT_SOCKET_PATH,
+        help="Unix socket of the server",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        required=False,
+        default=None,
+        help="Connect to this localhost TCP port instead of the Unix socket",
+    )
+    parser.add_argument(
+        "--host",
+        required=False,
+        default=DEFAULT_HOST,
+        help="Address for --port",
+    )
+
+
+async def send_requests(args: argparse.Namespace) -> None:
+    # all requests are sent at once, the results are printed in order
+    client = await connect(args.socket, args.host, args.port)
+    try:
+        messages = [json.loads(request) for request in args.requests]
+        results = await asyncio.gather(
+            *(client.request(message.pop("op"), **message)
+              for message in messages),
+            return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Error: {result}")
+            else:
+                print(json.dumps(result, indent=2))
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Planning service client")
+    setup_parser(parser)
+    asyncio.run(send_requests(parser.parse_args()))
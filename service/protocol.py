@@ -0,0 +1,44 @@
+import json
+from typing import Any
+
+# one JSON object per line in both directions. Requests carry an "id" that
+# is echoed in the response, so a client can have many requests in flight
+# on one connection and responses may arrive in any order.
+Message = dict[str, Any]
+
+# longest accepted line, large enough for the full path of a big tour
+MAX_MESSAGE_BYTES: int = 64 * 1024 * 1024
+DEFAULT_SOCKET_PATH: str = "/tmp/pathplanner.sock"
+DEFAULT_HOST: str = "127.0.0.1"
+DEFAULT_PORT: int = 8765
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def encode_message(message: Message) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def decode_message(line: bytes) -> Message:
+    try:
+        message = json.loads(line)
+    except ValueError as error:
+        raise ProtocolError(f"Invalid JSON: {error}") from error
+    if not isinstance(message, dict):
+        raise ProtocolError("A message must be a JSON object")
+    return message
+
+
+def ok_response(request_id: Any, result: Any) -> Message:
+    return {"id": request_id, "ok": True, "result": result}
+
+
+def error_response(
+    request_id: Any,
+    error: str,
+    retry: bool = False,
+) -> Message:
+    # retry tells the client that the same request may succeed later
+    return {"id": request_id, "ok": False, "error": error, "retry": retry}
@@ -0,0 +1,392 @@
+import os
+import sys
+
+# the workers import the visualization, which needs no display but has to
+# find the images under the repository root. Relative map paths are still
+# resolved against the directory the server was started from.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+START_DIR = os.getcwd()
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(REPO_ROOT)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import multiprocessing  # noqa: E402
+import signal  # noqa: E402
+import statistics  # noqa: E402
+import time  # noqa: E402
+from collections import deque  # noqa: E402
+from concurrent.futures import ProcessPoolExecutor  # noqa: E402
+from typing import Any  # noqa: E402
+
+from grid.grid_map import GridMap  # noqa: E402
+from grid.map_io import read_map  # noqa: E402
+from service.protocol import (  # noqa: E402
+    DEFAULT_HOST, DEFAULT_SOCKET_PATH, MAX_MESSAGE_BYTES, Message,
+    ProtocolError, decode_message, encode_message, error_response,
+    ok_response,
+)
+from service.worker import map_version, normalize_job, solve_job  # noqa: E402
+
+DEFAULT_MAX_QUEUE: int = 64
+DEFAULT_MAX_CONNECTION_REQUESTS: int = 32
+# latencies kept per request kind for the percentiles
+LATENCY_WINDOW: int = 1024
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class ServiceStats:
+    # Counters and request latencies of the server. Percentiles are over
+    # the last LATENCY_WINDOW requests of a kind, count and mean over all.
+    def __init__(self) -> None:
+        self.start_time = time.monotonic()
+        self.counters: dict[str, int] = {}
+        self.latencies: dict[str, deque[float]] = {}
+        self.latency_totals: dict[str, tuple[int, float]] = {}
+
+    # Accessors
+    def get_counter(self, name: str) -> int:
+        return self.counters.get(name, 0)
+
+    def get_uptime(self) -> float:
+        return time.monotonic() - self.start_time
+
+    def as_dict(self) -> dict[str, Any]:
+        uptime = self.get_uptime()
+        latency = {}
+        for kind, window in self.latencies.items():
+            count, total = self.latency_totals[kind]
+            ordered = sorted(window)
+            latency[kind] = {
+                "count": count,
+                "mean_ms": total / count * 1000,
+                "p50_ms": statistics.median(ordered) * 1000,
+                "p95_ms": ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+                "max_ms": ordered[-1] * 1000,
+            }
+        return {
+            "uptime_s": uptime,
+            "counters": dict(self.counters),
+            "throughput_per_s": (self.get_counter("solved") / uptime
+                                 if uptime > 0 else 0.0),
+            "latency": latency,
+        }
+
+    # Modifiers
+    def add(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_latency(self, kind: str, seconds: float) -> None:
+        if kind not in self.latencies:
+            self.latencies[kind] = deque(maxlen=LATENCY_WINDOW)
+            self.latency_totals[kind] = (0, 0.0)
+        self.latencies[kind].append(seconds)
+        count, total = self.latency_totals[kind]
+        self.latency_totals[kind] = (count + 1, total + seconds)
+
+
+class PlanningServer:
+    # Local planning service speaking JSON lines (see service.protocol).
+    # Maps are loaded once by name and stay resident, here as arrays to
+    # check the requests and in every worker process as a node graph with
+    # its A* caches. Solve jobs run in a process pool:
+    # - identical jobs on the same map version that are in flight at the
+    #   same time are solved once and all requesters get the result
+    # - at most max_queue distinct jobs are accepted at a time, beyond that
+    #   requests fail right away with retry set
+    # - a connection has at most max_connection_requests requests open,
+    #   after that the server stops reading from it until one finishes
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        max_connection_requests: int = DEFAULT_MAX_CONNECTION_REQUESTS,
+    ) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.max_connection_requests = max_connection_requests
+        # spawned workers do not inherit the event loop or its threads
+        self.executor = ProcessPoolExecutor(
+            self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        self.worker_slots = asyncio.Semaphore(self.max_workers)
+        # name -> (path, version, map)
+        self.maps: dict[str, tuple[str, str, GridMap]] = {}
+        self.in_flight: dict[str, asyncio.Task[dict[str, Any]]] = {}
+        self.running = 0
+        self.stats = ServiceStats()
+
+    # Accessors
+    def get_stats(self) -> dict[str, Any]:
+        stats = self.stats.as_dict()
+        stats["queue"] = {"pending": len(self.in_flight),
+                          "running": self.running,
+                          "max_pending": self.max_queue,
+                          "workers": self.max_workers}
+        stats["maps"] = {name: {"rows": grid_map.get_rows(),
+                                "cols": grid_map.get_cols(),
+                                "version": version}
+                         for name, (_, version, grid_map)
+                         in self.maps.items()}
+        return stats
+
+    def check_job(self, grid_map: GridMap, job: dict[str, Any]) -> None:
+        occupancy = grid_map.get_occupancy()
+        for position in [job["start"], job["end"]] + job["waypoints"]:
+            row, col = position
+            if not (0 <= row < grid_map.get_rows()
+                    and 0 <= col < grid_map.get_cols()):
+                raise ValueError(f"Position {position} is outside the map")
+            if occupancy[row, col]:
+                raise ValueError(f"Position {position} is an obstacle")
+
+    # Modifiers
+    async def load_map(self, name: str, path: str) -> dict[str, Any]:
+        path = os.path.join(START_DIR, path)
+        grid_map = await asyncio.to_thread(read_map, path)
+        version = await asyncio.to_thread(map_version, grid_map)
+        self.maps[name] = (path, version, grid_map)
+        self.stats.add("maps_loaded")
+        return {"name": name, "rows": grid_map.get_rows(),
+                "cols": grid_map.get_cols(), "version": version}
+
+    async def solve(self, request: Message) -> dict[str, Any]:
+        job = normalize_job(request)
+        name = request.get("map")
+        if name not in self.maps:
+            raise ValueError(f"Unknown map {name}, load it first")
+        path, version, grid_map = self.maps[name]
+        self.check_job(grid_map, job)
+
+        key = json.dumps([name, version, job], sort_keys=True)
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.stats.add("coalesced")
+        else:
+            if len(self.in_flight) >= self.max_queue:
+                self.stats.add("rejected")
+                raise ServerBusy(f"{len(self.in_flight)} jobs pending")
+            task = asyncio.create_task(self.run_job(path, name, version, job))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.forget_job(key, task))
+        # a requester that goes away must not cancel the job of the others
+        return await asyncio.shield(task)
+
+    def forget_job(self, key: str, task: asyncio.Task[Any]) -> None:
+        self.in_flight.pop(key, None)
+        if not task.cancelled():
+            # the requesters may all be gone, the error is theirs to see
+            task.exception()
+
+    async def run_job(
+        self,
+        path: str,
+        name: str,
+        version: str,
+        job: dict[str, Any],
+    ) -> dict[str, Any]:
+        async with self.worker_slots:
+            self.running += 1
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, solve_job, name, path, version, job)
+            except Exception:
+                self.stats.add("failed")
+                raise
+            finally:
+                self.running -= 1
+        self.stats.add("solved")
+        return result
+
+    async def handle_request(self, message: Message) -> Message:
+        request_id = message.get("id")
+        op = message.get("op")
+        request_start = time.perf_counter()
+        self.stats.add("requests")
+        try:
+            if op == "ping":
+                result: Any = {"pong": True}
+            elif op == "load":
+                result = await self.load_map(str(message["name"]),
+                                             str(message["path"]))
+            elif op == "stats":
+                result = self.get_stats()
+            elif op == "solve":
+                result = await self.solve(message)
+                self.stats.record_latency(
+                    f"solve_{result['solver']}",
+                    time.perf_counter() - request_start)
+            else:
+                raise ValueError(f"Unknown op {op}")
+        except ServerBusy as error:
+            return error_response(request_id, f"Server busy: {error}",
+                                  retry=True)
+        except KeyError as error:
+            self.stats.add("errors")
+            return error_response(request_id, f"Missing field {error}")
+        except Exception as error:
+            self.stats.add("errors")
+            return error_response(request_id,
+                                  f"{error.__class__.__name__}: {error}")
+        return ok_response(request_id, result)
+
+    async def respond(
+        self,
+        line: bytes,
+        writer: asyncio.StreamWriter,
+        write_lock: asyncio.Lock,
+        slots: asyncio.Semaphore,
+    ) -> None:
+        try:
+            try:
+                response = await self.handle_request(decode_message(line))
+            except ProtocolError as error:
+                response = error_response(None, str(error))
+            async with write_lock:
+                writer.write(encode_message(response))
+                await writer.drain()
+        except ConnectionError:
+            # the client is gone, there is nobody to answer
+            pass
+        finally:
+            slots.release()
+
+    async def handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.stats.add("connections")
+        slots = asyncio.Semaphore(self.max_connection_requests)
+        write_lock = asyncio.Lock()
+        tasks: set[asyncio.Task[None]] = set()
+        try:
+            while True:
+                # nothing more is read while all slots are taken, the
+                # socket buffers fill up and the client has to wait
+                await slots.acquire()
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(encode_message(error_response(
+                        None, f"Message longer than {MAX_MESSAGE_BYTES} "
+                              "bytes")))
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    slots.release()
+                    continue
+                task = asyncio.create_task(
+                    self.respond(line, writer, write_lock, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def setup_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--socket",
+        required=False,
+        default=DEFAULT_SOCKET_PATH,
+        help="Unix socket the server listens on",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        required=False,
+        default=None,
+        help="Listen on this localhost TCP port instead of the Unix socket",
+    )
+    parser.add_argument(
+        "--host",
+        required=False,
+        default=DEFAULT_HOST,
+        help="Address for --port, keep it local, there is no authentication",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=None,
+        help="Number of worker processes (defaults to the number of CPUs)",
+    )
+    parser.add_argument(
+        "--max_queue",
+        type=int,
+        required=False,
+        default=DEFAULT_MAX_QUEUE,
+        help="Jobs accepted at a time, further requests are turned away",
+    )
+    parser.add_argument(
+        "--max_connection_requests",
+        type=int,
+        required=False,
+        default=DEFAULT_MAX_CONNECTION_REQUESTS,
+        help="Open requests per connection before the server stops reading "
+        "from it",
+    )
+    parser.add_argument(
+        "--map",
+        action="append",
+        required=False,
+        default=[],
+        help="Map to load at startup as NAME=PATH, can be repeated",
+    )
+
+
+async def serve(args: argparse.Namespace) -> None:
+    server = PlanningServer(args.workers, args.max_queue,
+                            args.max_connection_requests)
+    for entry in args.map:
+        name, _, path = entry.partition("=")
+        info = await server.load_map(name, path)
+        print(f"Loaded map {name} ({info['rows']}x{info['cols']})")
+    if args.port is not None:
+        listener = await asyncio.start_server(
+            server.handle_connection, args.host, args.port,
+            limit=MAX_MESSAGE_BYTES)
+        print(f"Listening on {args.host}:{args.port}")
+    else:
+        listener = await asyncio.start_unix_server(
+            server.handle_connection, args.socket, limit=MAX_MESSAGE_BYTES)
+        print(f"Listening on {args.socket}")
+    stop = asyncio.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(signal_number,
+                                                      stop.set)
+    try:
+        async with listener:
+            await stop.wait()
+    finally:
+        server.shutdown()
+        if args.port is None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local planning service")
+    setup_parser(parser)
+    args = parser.parse_args()
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
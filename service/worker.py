@@ -0,0 +1,199 @@
+import contextlib
+import hashlib
+import io
+import os
+import time
+from typing import Any
+
+import numpy as np
+
+from grid.grid import Grid
+from grid.grid_map import GridMap
+from grid.map_io import read_map
+from grid.node import Node
+from pathfinding.ant_colony_opt import AntColonyOptimisation
+from pathfinding.astar import AStar
+from pathfinding.cache import PathCache
+from pathfinding.distance_matrix import WaypointDistanceMatrix
+from pathfinding.held_karp import HeldKarp
+from visualization.visualization import TaskSetting
+
+SOLVERS: tuple[str, ...] = ("astar", "held_karp", "aco")
+DEFAULT_K: float = 1.0
+# same defaults as the command line of main.py
+ACO_DEFAULTS: dict[str, float] = {
+    "epochs": 100, "number_ants": 10, "rho": 0.1, "Q": 1.0, "alpha": 1.0,
+    "beta": 1.0, "ini_pheromone": 0.1,
+}
+LEG_CACHE_SIZE: int = 4096
+TOUR_CACHE_SIZE: int = 256
+
+# grids kept by this worker process between jobs, by map name
+RESIDENT: dict[str, "ResidentGrid"] = {}
+
+
+def map_version(grid_map: GridMap) -> str:
+    # content hash that is the same in every process, unlike hash()
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(np.asarray(grid_map.get_occupancy().shape).tobytes())
+    digest.update(np.ascontiguousarray(grid_map.get_occupancy()).tobytes())
+    digest.update(np.ascontiguousarray(grid_map.get_terrain()).tobytes())
+    return digest.hexdigest()
+
+
+def read_position(value: Any, name: str) -> list[int]:
+    if (not isinstance(value, (list, tuple)) or len(value) != 2
+            or not all(isinstance(item, int) for item in value)):
+        raise ValueError(f"{name} must be a [row, col] pair")
+    return [int(value[0]), int(value[1])]
+
+
+def normalize_job(request: dict[str, Any]) -> dict[str, Any]:
+    # the job of a solve request with all defaults filled in, two requests
+    # with the same normalized job get the same result
+    solver = request.get("solver", "astar")
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver {solver}, expected one of "
+                         f"{SOLVERS}")
+    waypoints = request.get("waypoints", [])
+    if not isinstance(waypoints, list):
+        raise ValueError("waypoints must be a list of [row, col] pairs")
+    if solver == "astar" and waypoints:
+        raise ValueError("astar jobs have no waypoints")
+    job = {
+        "solver": solver,
+        "start": read_position(request.get("start"), "start"),
+        "end": read_position(request.get("end"), "end"),
+        "waypoints": [read_position(waypoint, "waypoint")
+                      for waypoint in waypoints],
+        "k": float(request.get("k", DEFAULT_K)),
+    }
+    if solver == "aco":
+        for name, default in ACO_DEFAULTS.items():
+            job[name] = float(request.get(name, default))
+        seed = request.get("seed")
+        job["seed"] = None if seed is None else int(seed)
+    return job
+
+
+class ResidentGrid:
+    # Node graph of a map with one AStar per heuristic weight. The AStars
+    # share a path cache, and each keeps the distance matrix of its last
+    # tour, so repeated queries and tours over the same waypoints only
+    # search the legs that are new.
+    def __init__(self, grid_map: GridMap, version: str) -> None:
+        self.version = version
+        self.task_setting = (TaskSetting.ELEVATION
+                             if bool(np.any(grid_map.get_terrain()))
+                             else TaskSetting.DEFAULT)
+        self.grid: Grid = grid_map.to_grid(self.task_setting)
+        self.grid.create_graph()
+        self.path_cache = PathCache(LEG_CACHE_SIZE, TOUR_CACHE_SIZE)
+        self.astars: dict[float, tuple[AStar, WaypointDistanceMatrix]] = {}
+
+    # Accessors
+    def get_node(self, position: list[int]) -> Node:
+        row, col = position
+        if not (0 <= row < self.grid.get_rows()
+                and 0 <= col < self.grid.get_cols()):
+            raise ValueError(f"Position {position} is outside the map")
+        return self.grid.get_node(row, col)
+
+    def get_astar(self, k: float) -> tuple[AStar, WaypointDistanceMatrix]:
+        if k not in self.astars:
+            astar = AStar(k)
+            astar.set_task_setting(self.task_setting)
+            astar.set_cache(self.path_cache)
+            astar.set_graph(self.grid.get_grid(),
+                            self.grid.get_content_hash())
+            self.astars[k] = (astar, WaypointDistanceMatrix(astar))
+        return self.astars[k]
+
+    def get_positions(self, node_ids: list[int]) -> list[list[int]]:
+        cols = self.grid.get_cols()
+        return [[node_id // cols, node_id % cols] for node_id in node_ids]
+
+
+def get_resident(name: str, path: str, version: str) -> ResidentGrid:
+    resident = RESIDENT.get(name)
+    if resident is None or resident.version != version:
+        grid_map = read_map(path)
+        if map_version(grid_map) != version:
+            raise ValueError(f"Map file {path} changed since it was loaded, "
+                             "load it again")
+        resident = ResidentGrid(grid_map, version)
+        RESIDENT[name] = resident
+    return resident
+
+
+def solve_job(
+    name: str,
+    path: str,
+    version: str,
+    job: dict[str, Any],
+) -> dict[str, Any]:
+    # runs in a worker process of the service, the result has to be JSON
+    solve_start = time.perf_counter()
+    resident = get_resident(name, path, version)
+    astar, distance_matrix = resident.get_astar(job["k"])
+    start_node = resident.get_node(job["start"])
+    end_node = resident.get_node(job["end"])
+
+    if job["solver"] == "astar":
+        distance, leg = astar.find_leg(start_node, end_node)
+        tour_ids = [start_node.id, end_node.id]
+        path_ids = leg.tolist()
+    else:
+        waypoints = [resident.get_node(position)
+                     for position in job["waypoints"]]
+        distance_matrix.sync(start_node, end_node, waypoints,
+                             resident.grid.get_content_hash())
+        tour_ids = solve_tour(job, distance_matrix, start_node, end_node)
+        distances = distance_matrix.get_distance_dict()
+        distance = (sum(distances[node_id][next_id] for node_id, next_id
+                        in zip(tour_ids, tour_ids[1:]))
+                    if tour_ids else float("inf"))
+        path_ids = (distance_matrix.get_paths().stitch(tour_ids).tolist()
+                    if tour_ids else [])
+
+    reachable = distance != float("inf")
+    return {
+        "solver": job["solver"],
+        # JSON has no infinity, unreachable goals have no cost
+        "cost": float(distance) if reachable else None,
+        "tour": resident.get_positions(tour_ids) if reachable else [],
+        "path": resident.get_positions(path_ids) if reachable else [],
+        "solve_ms": (time.perf_counter() - solve_start) * 1000,
+        "worker": os.getpid(),
+    }
+
+
+def solve_tour(
+    job: dict[str, Any],
+    distance_matrix: WaypointDistanceMatrix,
+    start_node: Node,
+    end_node: Node,
+) -> list[int]:
+    # node ids of the tour from start to end, empty if some leg is missing
+    solver: HeldKarp | AntColonyOptimisation
+    if job["solver"] == "held_karp":
+        solver = HeldKarp()
+    else:
+        if job["seed"] is not None:
+            np.random.seed(job["seed"])
+        solver = AntColonyOptimisation(
+            epochs=int(job["epochs"]),
+            number_ants=int(job["number_ants"]),
+            rho=job["rho"],
+            Q=job["Q"],
+            alpha=job["alpha"],
+            beta=job["beta"],
+            ini_pheromone=job["ini_pheromone"],
+        )
+    solver.set_distance_matrix(distance_matrix)
+    # the solvers print their progress, which nobody reads in a worker
+    with contextlib.redirect_stdout(io.StringIO()):
+        found = solver.find_tour(start_node, end_node)
+    if not found:
+        return []
+    return [node.id for node in solver.get_tour()]
@@ -27,6 +27,69 @@ def setup_parser(parser: argparse.ArgumentParser) -> None:
         help="K value for A* algorithm heuristic",
     )
 
+    parser.add_argument(
+        "--terrain_costs",
+        required=False,
+        action="store_true",
+        help="Whether moves in the relief task cost extra for climbing and "
+        "descending, with an admissible heuristic instead of --K",
+    )
+
+    parser.add_argument(
+        "--climb_cost",
+        type=float,
+        required=False,
+        default=0.1,
+        help="Extra cost per unit of height climbed (with --terrain_costs)",
+    )
+
+    parser.add_argument(
+        "--descent_cost",
+        type=float,
+        required=False,
+        default=0.05,
+        help="Extra cost per unit of height descended (with --terrain_costs)",
+    )
+
+    parser.add_argument(
+        "--max_slope",
+        type=float,
+        required=False,
+        default=None,
+        help="Height difference above which a move is impassable "
+        "(with --terrain_costs)",
+    )
+
+    parser.add_argument(
+        "--epsilon",
+        type=float,
+        required=False,
+        default=1.0,
+        help="Weight of the A* heuristic for the legs of the waypoint "
+        "distance matrix, legs cost at most epsilon times the optimum",
+    )
+
+    parser.add_argument(
+        "--distance_engine",
+        type=str,
+        required=False,
+        default="astar",
+        choices=["astar", "bitset", "ch"],
+        help="How the legs of the waypoint distance matrix are computed: "
+        "one A* search per leg, one bit-parallel BFS per waypoint "
+        "(unit-cost tasks only), or queries on a contraction hierarchy "
+        "built once per map",
+    )
+
+    parser.add_argument(
+        "--ch_file",
+        type=str,
+        required=False,
+        default=None,
+        help="File (.npz) the contraction hierarchy is saved to and loaded "
+        "from when it matches the map (with --distance_engine ch)",
+    )
+
     parser.add_argument(
         "--deterministic_waypoints",
         required=False,
@@ -35,6 +98,26 @@ def setup_parser(parser: argparse.ArgumentParser) -> None:
         "the optimal path in the Waypoint task",
     )
 
+    parser.add_argument(
+        "--held_karp_engine",
+        type=str,
+        required=False,
+        default="serial",
+        choices=["serial", "parallel", "meet_in_the_middle"],
+        help="How Held-Karp fills its table: in this process, one subset "
+        "size at a time split across worker processes, or from both ends "
+        "up to half of the waypoints to save memory",
+    )
+
+    parser.add_argument(
+        "--held_karp_workers",
+        type=int,
+        required=False,
+        default=None,
+        help="Worker processes of the parallel Held-Karp engine (one per "
+        "CPU by default)",
+    )
+
     parser.add_argument(
         "--epochs",
         type=int,
@@ -91,3 +174,104 @@ def setup_parser(parser: argparse.ArgumentParser) -> None:
         help="Initial pheromone value for the"
         " ant colony optimisation algorithm",
     )
+
+    parser.add_argument(
+        "--aco_warm_start",
+        required=False,
+        action="store_true",
+        help="Carry the pheromone and the best tour of the ant colony over "
+        "to the next run",
+    )
+
+    parser.add_argument(
+        "--aco_patience",
+        type=int,
+        required=False,
+        default=None,
+        help="Stop the ant colony after this many epochs without a better "
+        "tour",
+    )
+
+    parser.add_argument(
+        "--aco_candidates",
+        type=int,
+        required=False,
+        default=None,
+        help="Ants only choose among this many nearest waypoints while one "
+        "of them is unvisited (all waypoints by default)",
+    )
+
+    parser.add_argument(
+        "--map",
+        type=str,
+        required=False,
+        default=None,
+        help="Map loaded at startup (.gmap, MovingAI .map, .png or .npz), "
+        "replaces --rows",
+    )
+
+    parser.add_argument(
+        "--save_map",
+        type=str,
+        required=False,
+        default="map.gmap",
+        help="File the grid is written to when pressing S",
+    )
+
+    parser.add_argument(
+        "--frame_stats",
+        required=False,
+        action="store_true",
+        help="Whether to periodically print redraw counts and frame times",
+    )
+
+    parser.add_argument(
+        "--frame_stats_interval",
+        type=float,
+        required=False,
+        default=5.0,
+        help="Seconds between two frame statistics reports",
+    )
+
+    parser.add_argument(
+        "--stats",
+        required=False,
+        action="store_true",
+        help="Whether to print phase timings and search statistics "
+        "after every run",
+    )
+
+    parser.add_argument(
+        "--trace",
+        type=str,
+        required=False,
+        default=None,
+        help="File a Chrome trace (JSON) of every run is written to, "
+        "open it in Perfetto or chrome://tracing",
+    )
+
+    parser.add_argument(
+        "--animation_delay",
+        type=float,
+        required=False,
+        default=0.005,
+        help="Seconds the A* search pauses after each expanded node so that "
+        "the search can be followed on screen (0 to disable)",
+    )
+
+    parser.add_argument(
+        "--path_cache_size",
+        type=int,
+        required=False,
+        default=4096,
+        help="Maximum number of cached point-to-point A* results "
+        "(0 disables the cache)",
+    )
+
+    parser.add_argument(
+        "--tour_cache_size",
+        type=int,
+        required=False,
+        default=64,
+        help="Maximum number of cached full runs (0 disables the cache)",
+    )
@@ -66,5 +66,8 @@ class Button:
         if not pygame.mouse.get_pressed()[0]:
             self.clicked = False
 
-        window.blit(self.img, (self.rect.x, self.rect.y))
+        self.blit(window)
         return action
+
+    def blit(self, window: pygame.Surface) -> None:
+        window.blit(self.img, (self.rect.x, self.rect.y))
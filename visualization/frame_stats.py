@@ -0,0 +1,52 @@
+import time
+
+
+class FrameStats:
+    def __init__(self, report_interval: float) -> None:
+        self.report_interval = report_interval
+        self.redraws = 0
+        self.wakeups = 0
+        self.idle_timeouts = 0
+        self.total_frame_time = 0.0
+        self.max_frame_time = 0.0
+        self.frame_start = 0.0
+        self.last_report = time.perf_counter()
+
+    # Accessors
+    def get_redraws(self) -> int:
+        return self.redraws
+
+    def get_mean_frame_time(self) -> float:
+        if self.redraws == 0:
+            return 0.0
+        return self.total_frame_time / self.redraws
+
+    # Modifiers
+    def record_wakeup(self, had_events: bool) -> None:
+        self.wakeups += 1
+        if not had_events:
+            self.idle_timeouts += 1
+
+    def start_frame(self) -> None:
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self) -> None:
+        frame_time = time.perf_counter() - self.frame_start
+        self.redraws += 1
+        self.total_frame_time += frame_time
+        self.max_frame_time = max(self.max_frame_time, frame_time)
+
+    def report(self) -> None:
+        print(
+            f"Frames: {self.redraws} redraws, {self.wakeups} wakeups "
+            f"({self.idle_timeouts} idle), "
+            f"mean frame {self.get_mean_frame_time() * 1000:.2f} ms, "
+            f"max frame {self.max_frame_time * 1000:.2f} ms"
+        )
+
+    def maybe_report(self) -> None:
+        # only report periodically, the idle loop wakes up regularly
+        now = time.perf_counter()
+        if now - self.last_report >= self.report_interval:
+            self.report()
+            self.last_report = now
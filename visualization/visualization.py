@@ -163,6 +163,13 @@ class Visualization:
                 return button, num_waypoints
         return None, None
 
+    def render_topbar(self) -> None:
+        # draw the topbar without checking for button clicks
+        pygame.draw.rect(self.window, CommonColors.DARK_BLUE.value,
+                         (0, 0, self.window_width, self.topbar_height))
+        for button in self.buttons.values():
+            button.blit(self.window)
+
     def draw_text(
             self,
             text: str,